@@ -0,0 +1 @@
+"""Benchmarks of the files API; see `files_api_benchmark`."""
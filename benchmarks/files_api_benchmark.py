@@ -0,0 +1,290 @@
+"""
+Benchmark every route of the files API against a local S3 stand-in.
+
+The app runs in-process and is driven over ASGI by an httpx client, so results measure the app and its S3
+calls rather than the network. S3 is either mocked in-process by moto (the default) or served by a moto
+server, e.g. the one started by `./run.sh run-mock`, passed with `--s3-endpoint-url`.
+
+For each object size, `--key-count` files are uploaded (PUT), described (HEAD), downloaded (GET), listed
+(GET /files) and deleted (DELETE), with `--concurrency` requests in flight at once. Throughput, latency
+percentiles and the peak RSS of the process are written as JSON with `--output`, and compared with the
+results of an earlier run passed with `--baseline`: the benchmark exits with status 1 on any regression.
+
+Example:
+    ./run.sh benchmark --object-size-bytes 1024 1048576 --output benchmarks/baseline.json
+    ./run.sh benchmark --object-size-bytes 1024 1048576 --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import platform
+import resource
+import sys
+import time
+from dataclasses import (
+    asdict,
+    dataclass,
+)
+from typing import (
+    Awaitable,
+    Callable,
+    Iterator,
+    Optional,
+)
+
+import boto3
+import httpx
+
+from files_api.main import create_app
+from files_api.settings import Settings
+
+BENCHMARK_BUCKET_NAME = "files-api-benchmark"
+
+# keys are spread over this many directories, so listings return pages of a realistic size
+DIRECTORY_COUNT = 10
+
+LIST_PAGE_SIZE = 100
+
+# the relative change tolerated before a difference from the baseline counts as a regression
+DEFAULT_TOLERANCE = 0.2
+
+
+@dataclass
+class BenchmarkConfig:
+    """What to benchmark, and how hard."""
+
+    concurrency: int = 16
+    key_count: int = 200
+    object_sizes_bytes: tuple[int, ...] = (1024,)
+    s3_endpoint_url: Optional[str] = None
+
+
+@dataclass
+class ScenarioResult:
+    """Throughput and latency of one operation on objects of one size."""
+
+    requests: int
+    errors: int
+    duration_seconds: float
+    throughput_rps: float
+    throughput_bytes_per_second: float
+    latency_p50_ms: float
+    latency_p95_ms: float
+    latency_p99_ms: float
+    latency_max_ms: float
+
+
+def percentile(sorted_values: list[float], percent: float) -> float:
+    """Return the nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(percent / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def peak_rss_bytes() -> int:
+    """Return the peak resident set size of this process so far."""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return max_rss if platform.system() == "Darwin" else max_rss * 1024
+
+
+async def run_scenario(
+    send_request: Callable[[int], Awaitable[httpx.Response]],
+    request_count: int,
+    concurrency: int,
+    expected_status_codes: tuple[int, ...],
+    bytes_per_request: int = 0,
+) -> ScenarioResult:
+    """Send `request_count` requests, `concurrency` at a time, and measure how long each one takes."""
+    latencies_seconds: list[float] = []
+    errors = 0
+    next_index = iter(range(request_count))
+
+    async def worker() -> None:
+        nonlocal errors
+        for index in next_index:
+            start_time = time.perf_counter()
+            response = await send_request(index)
+            latencies_seconds.append(time.perf_counter() - start_time)
+            if response.status_code not in expected_status_codes:
+                errors += 1
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration_seconds = time.perf_counter() - start_time
+
+    latencies_ms = sorted(latency * 1000 for latency in latencies_seconds)
+    return ScenarioResult(
+        requests=request_count,
+        errors=errors,
+        duration_seconds=duration_seconds,
+        throughput_rps=request_count / duration_seconds,
+        throughput_bytes_per_second=request_count * bytes_per_request / duration_seconds,
+        latency_p50_ms=percentile(latencies_ms, 50),
+        latency_p95_ms=percentile(latencies_ms, 95),
+        latency_p99_ms=percentile(latencies_ms, 99),
+        latency_max_ms=latencies_ms[-1] if latencies_ms else 0.0,
+    )
+
+
+async def benchmark_object_size(
+    client: httpx.AsyncClient, config: BenchmarkConfig, size_bytes: int
+) -> dict[str, ScenarioResult]:
+    """Run every scenario on `config.key_count` objects of `size_bytes` bytes, in an order leaving the bucket empty."""
+    content = os.urandom(size_bytes)
+    base_directory = f"benchmark/{size_bytes}"
+
+    def file_path(index: int) -> str:
+        return f"{base_directory}/dir-{index % DIRECTORY_COUNT}/file-{index}.bin"
+
+    def put(index: int) -> Awaitable[httpx.Response]:
+        files = {"file": ("file.bin", content, "application/octet-stream")}
+        return client.put(f"/files/{file_path(index)}", files=files)
+
+    def list_directory(index: int) -> Awaitable[httpx.Response]:
+        directory = f"{base_directory}/dir-{index % DIRECTORY_COUNT}/"
+        return client.get("/files", params={"directory": directory, "page_size": LIST_PAGE_SIZE})
+
+    scenarios: list[tuple[str, Callable[[int], Awaitable[httpx.Response]], tuple[int, ...], int]] = [
+        ("put", put, (200, 201), size_bytes),
+        ("head", lambda index: client.head(f"/files/{file_path(index)}"), (200,), 0),
+        ("get", lambda index: client.get(f"/files/{file_path(index)}"), (200,), size_bytes),
+        ("list", list_directory, (200,), 0),
+        ("delete", lambda index: client.delete(f"/files/{file_path(index)}"), (204,), 0),
+    ]
+    results = {}
+    for name, send_request, expected_status_codes, bytes_per_request in scenarios:
+        results[f"{name}/{size_bytes}B"] = await run_scenario(
+            send_request,
+            request_count=config.key_count,
+            concurrency=config.concurrency,
+            expected_status_codes=expected_status_codes,
+            bytes_per_request=bytes_per_request,
+        )
+    return results
+
+
+@contextlib.contextmanager
+def local_s3(s3_endpoint_url: Optional[str]) -> Iterator[None]:
+    """Point boto3 at a moto server, or mock S3 in-process if no endpoint is given, and create the bucket."""
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "mock")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "mock")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    with contextlib.ExitStack() as stack:
+        if s3_endpoint_url:
+            os.environ["AWS_ENDPOINT_URL"] = s3_endpoint_url
+        else:
+            from moto import mock_aws  # pylint: disable=import-outside-toplevel
+
+            stack.enter_context(mock_aws())
+        boto3.client("s3").create_bucket(Bucket=BENCHMARK_BUCKET_NAME)
+        yield
+
+
+async def run_benchmark(config: BenchmarkConfig) -> dict:
+    """Run the benchmark and return its configuration, results and peak RSS, ready to be written as JSON."""
+    results: dict[str, ScenarioResult] = {}
+    with local_s3(config.s3_endpoint_url):
+        app = create_app(settings=Settings(s3_bucket_name=BENCHMARK_BUCKET_NAME))
+        transport = httpx.ASGITransport(app=app)
+        # httpx does not run the app's lifespan, which creates and releases its background tasks
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+                for size_bytes in config.object_sizes_bytes:
+                    results.update(await benchmark_object_size(client, config, size_bytes))
+    return {
+        "config": asdict(config),
+        "python": sys.version.split()[0],
+        "peak_rss_bytes": peak_rss_bytes(),
+        "scenarios": {name: asdict(result) for name, result in results.items()},
+    }
+
+
+def compare_with_baseline(report: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> list[str]:
+    """
+    Compare a report with the report of an earlier run.
+
+    :return: A description of every regression: lower throughput, higher median or tail latency, higher peak
+        RSS, or failed requests. Scenarios missing from either report are not compared.
+    """
+    regressions = []
+    for name, result in report["scenarios"].items():
+        if result["errors"]:
+            regressions.append(f"{name}: {result['errors']} of {result['requests']} requests failed")
+        baseline_result = baseline.get("scenarios", {}).get(name)
+        if baseline_result is None:
+            continue
+        if result["throughput_rps"] < baseline_result["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {result['throughput_rps']:.1f} req/s"
+                f" < baseline {baseline_result['throughput_rps']:.1f} req/s"
+            )
+        for latency_key in ("latency_p50_ms", "latency_p95_ms"):
+            if result[latency_key] > baseline_result[latency_key] * (1 + tolerance):
+                regressions.append(
+                    f"{name}: {latency_key} {result[latency_key]:.2f} > baseline {baseline_result[latency_key]:.2f}"
+                )
+    if "peak_rss_bytes" in baseline and report["peak_rss_bytes"] > baseline["peak_rss_bytes"] * (1 + tolerance):
+        regressions.append(
+            f"peak RSS {report['peak_rss_bytes'] / 2**20:.1f} MiB"
+            f" > baseline {baseline['peak_rss_bytes'] / 2**20:.1f} MiB"
+        )
+    return regressions
+
+
+def format_report(report: dict) -> str:
+    """Format the results of a run as a table."""
+    lines = [f"{'scenario':<24}{'req/s':>10}{'MiB/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"]
+    for name, result in report["scenarios"].items():
+        lines.append(
+            f"{name:<24}{result['throughput_rps']:>10.1f}{result['throughput_bytes_per_second'] / 2**20:>10.2f}"
+            f"{result['latency_p50_ms']:>10.2f}{result['latency_p95_ms']:>10.2f}{result['latency_p99_ms']:>10.2f}"
+            f"{result['errors']:>8}"
+        )
+    lines.append(f"peak RSS: {report['peak_rss_bytes'] / 2**20:.1f} MiB")
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=BenchmarkConfig.concurrency)
+    parser.add_argument("--key-count", type=int, default=BenchmarkConfig.key_count)
+    parser.add_argument("--object-size-bytes", type=int, nargs="+", default=list(BenchmarkConfig.object_sizes_bytes))
+    parser.add_argument("--s3-endpoint-url", help="URL of a moto server; S3 is mocked in-process if not given")
+    parser.add_argument("--output", help="file to write the results to, as JSON")
+    parser.add_argument("--baseline", help="results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+    config = BenchmarkConfig(
+        concurrency=args.concurrency,
+        key_count=args.key_count,
+        object_sizes_bytes=tuple(args.object_size_bytes),
+        s3_endpoint_url=args.s3_endpoint_url,
+    )
+    report = asyncio.run(run_benchmark(config))
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    regressions = compare_with_baseline(report, baseline, tolerance=args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Measure the per-item cost of serializing a `GET /files` page, before and after the serialization fast path.
+
+"model" builds a `FileMetadata` per item and a `GetFilesResponse`, which FastAPI then validates and serializes
+again; "fast path" serializes plain dicts in one pass, as `files_api.serialization` does.
+
+Example:
+    python -m benchmarks.serialization_benchmark --page-sizes 10 100 1000
+"""
+
+import argparse
+import timeit
+from datetime import (
+    datetime,
+    timezone,
+)
+from typing import Callable
+
+from pydantic import TypeAdapter
+
+from files_api.schemas import (
+    FileMetadata,
+    GetFilesResponse,
+)
+from files_api.serialization import (
+    CSV_MEDIA_TYPE,
+    file_metadata_dicts,
+    get_files_response,
+)
+
+_GET_FILES_RESPONSE_ADAPTER = TypeAdapter(GetFilesResponse)
+
+
+def list_objects_page(page_size: int) -> list[dict]:
+    """Return a page of objects shaped like the `Contents` of a ListObjectsV2 response."""
+    last_modified = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [
+        {"Key": f"folder/file-{index}.txt", "LastModified": last_modified, "Size": index} for index in range(page_size)
+    ]
+
+
+def serialize_with_models(files: list[dict]) -> bytes:
+    response = GetFilesResponse(
+        files=[
+            FileMetadata(file_path=item["Key"], last_modified=item["LastModified"], size_bytes=item["Size"])
+            for item in files
+        ],
+        next_page_token=None,
+    )
+    # what FastAPI does with the returned model: validate it against the response model, then dump it
+    return _GET_FILES_RESPONSE_ADAPTER.dump_json(_GET_FILES_RESPONSE_ADAPTER.validate_python(response))
+
+
+def serialize_fast_path(files: list[dict]) -> bytes:
+    return get_files_response(file_metadata_dicts(files), next_page_token=None).body
+
+
+def serialize_csv(files: list[dict]) -> bytes:
+    return get_files_response(file_metadata_dicts(files), next_page_token=None, media_type=CSV_MEDIA_TYPE).body
+
+
+def microseconds_per_item(serialize: Callable[[list[dict]], bytes], files: list[dict], repeat: int) -> float:
+    number = max(10_000 // len(files), 1)
+    best_seconds = min(timeit.repeat(lambda: serialize(files), number=number, repeat=repeat))
+    return best_seconds / number / len(files) * 1_000_000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'page size':>10}{'model µs/item':>16}{'fast path µs/item':>20}{'csv µs/item':>14}{'speedup':>10}")
+    for page_size in args.page_sizes:
+        files = list_objects_page(page_size)
+        assert serialize_with_models(files) == serialize_fast_path(files)
+        model_cost = microseconds_per_item(serialize_with_models, files, args.repeat)
+        fast_path_cost = microseconds_per_item(serialize_fast_path, files, args.repeat)
+        csv_cost = microseconds_per_item(serialize_csv, files, args.repeat)
+        print(
+            f"{page_size:>10}{model_cost:>16.3f}{fast_path_cost:>20.3f}{csv_cost:>14.3f}"
+            f"{model_cost / fast_path_cost:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -25,6 +25,12 @@ function run {
     AWS_PROFILE=cloud-course S3_BUCKET_NAME="$S3_BUCKET_NAME" uvicorn src.files_api.main:create_app --reload
 }
 
+# run the API server as in production: one worker per CPU core, on uvloop and httptools when installed
+# (example) S3_BUCKET_NAME=some-bucket ./run.sh serve --workers 4 --port 8080
+function serve {
+    files-api "$@"
+}
+
 function run-mock {
     python -m moto.server -p 5000 &
 
@@ -39,6 +45,13 @@ function run-mock {
     uvicorn src.files_api.main:create_app --reload
 }
 
+# benchmark every route against S3 mocked in-process, or against the moto server of `run-mock` with
+# --s3-endpoint-url http://localhost:5000; pass --output and --baseline to record and compare results
+# (example) ./run.sh benchmark --concurrency 32 --object-size-bytes 1024 1048576 --baseline benchmarks/baseline.json
+function benchmark {
+    python -m benchmarks.files_api_benchmark "$@"
+}
+
 # run linting, formatting, and other static code quality tools
 function lint {
     pre-commit run --all-files
@@ -0,0 +1,199 @@
+"""Stream the files under a directory as a ZIP archive built on the fly, without buffering the archive."""
+
+import asyncio
+import contextlib
+import logging
+import zipfile
+from collections import deque
+from datetime import (
+    datetime,
+    timezone,
+)
+from typing import (
+    AsyncIterator,
+    Optional,
+)
+
+from botocore.exceptions import ClientError
+
+from files_api.compression import (
+    GZIP_CONTENT_ENCODING,
+    gunzip_chunks,
+)
+from files_api.listings import iter_directory_pages
+from files_api.metadata_cache import uncompressed_size
+from files_api.s3.executor import S3Executor
+from files_api.s3.read_objects import (
+    NO_SUCH_KEY_ERROR_CODE,
+    fetch_s3_object,
+)
+
+try:
+    from mypy_boto3_s3 import S3Client
+    from mypy_boto3_s3.type_defs import GetObjectOutputTypeDef
+except ImportError:
+    ...
+
+LOGGER = logging.getLogger(__name__)
+
+# the ZIP format cannot represent timestamps before 1980
+ZIP_EPOCH = datetime(1980, 1, 1, tzinfo=timezone.utc)
+
+
+class ZipStreamSink:
+    """
+    A write-only, non-seekable file object collecting the bytes `zipfile` writes until they are sent.
+
+    Because it cannot seek, `zipfile` writes each entry's sizes and CRC in a data descriptor after
+    its content instead of going back to patch the entry header.
+    """
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def pop(self) -> bytes:
+        """Return and forget everything written since the last call."""
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def archive_base_path(prefix: str) -> str:
+    """Return the part of the prefix stripped from the keys to name the archive entries, up to its last '/'."""
+    return prefix[: prefix.rfind("/") + 1]
+
+
+def archive_filename(prefix: str) -> str:
+    """Name the archive after the last directory of the prefix."""
+    name = prefix.rstrip("/").rsplit("/", 1)[-1] or "archive"
+    return f"{name}.zip"
+
+
+def archive_entry_name(object_key: str, base_path: str) -> Optional[str]:
+    """
+    Name the archive entry of an object, relative to the base path and without empty or "." segments.
+
+    :return: The name of the entry, or None if the key has ".." segments, which could make an unzip tool write
+        the entry outside of the directory it extracts the archive to.
+    """
+    # unzip tools on Windows take backslashes for separators too
+    segments = object_key.removeprefix(base_path).replace("\\", "/").split("/")
+    if ".." in segments:
+        return None
+    return "/".join(segment for segment in segments if segment not in ("", ".")) or None
+
+
+async def iter_directory_objects(
+    bucket_name: str,
+    prefix: str,
+    s3_client: "S3Client",
+    s3_executor: S3Executor,
+    prefetch: int,
+) -> AsyncIterator[tuple[str, "GetObjectOutputTypeDef"]]:
+    """
+    Open every object under a prefix, in key order, with the next `prefetch` objects opened concurrently.
+
+    Only the responses of the prefetched objects are held open; their bodies are read by the caller.
+    Objects deleted since they were listed are skipped.
+
+    :return: Pairs of the key of each object and its `get_object` response.
+    """
+    pending: deque[tuple[str, asyncio.Task["GetObjectOutputTypeDef"]]] = deque()
+    try:
+        async for files in iter_directory_pages(bucket_name, prefix, s3_client, s3_executor):
+            for item in files:
+                # zero-byte "folder" placeholders have no content to archive
+                if item["Key"].endswith("/"):
+                    continue
+                get_object = s3_executor.run(fetch_s3_object, bucket_name, object_key=item["Key"], s3_client=s3_client)
+                pending.append((item["Key"], asyncio.create_task(get_object)))
+                if len(pending) > prefetch:
+                    opened = await _open_next(pending)
+                    if opened is not None:
+                        yield opened
+        while pending:
+            opened = await _open_next(pending)
+            if opened is not None:
+                yield opened
+    finally:
+        # the S3 calls already submitted cannot be interrupted: close their bodies once they return
+        for _, task in pending:
+            task.add_done_callback(_close_body)
+
+
+async def _open_next(
+    pending: deque[tuple[str, asyncio.Task["GetObjectOutputTypeDef"]]],
+) -> Optional[tuple[str, "GetObjectOutputTypeDef"]]:
+    object_key, task = pending[0]
+    try:
+        get_object_response = await task
+    except ClientError as err:
+        if err.response.get("Error", {}).get("Code") != NO_SUCH_KEY_ERROR_CODE:
+            raise
+        pending.popleft()
+        return None
+    pending.popleft()
+    return object_key, get_object_response
+
+
+def _close_body(task: asyncio.Task["GetObjectOutputTypeDef"]) -> None:
+    if not task.cancelled() and task.exception() is None:
+        task.result()["Body"].close()
+
+
+async def stream_zip_archive(
+    objects: AsyncIterator[tuple[str, "GetObjectOutputTypeDef"]],
+    base_path: str,
+    s3_executor: S3Executor,
+) -> AsyncIterator[bytes]:
+    """
+    Write objects into a ZIP archive, yielding the archive as it is produced.
+
+    Entries are stored uncompressed and their bodies are copied chunk by chunk, so memory use does not
+    depend on the size of the objects nor on the number of entries, apart from the central directory.
+
+    :param objects: Pairs of the key of each object and its `get_object` response.
+    :param base_path: Prefix removed from the keys to name the entries; objects whose names would be unsafe to
+        extract are left out.
+    :param s3_executor: The executor reading the object bodies.
+    """
+    sink = ZipStreamSink()
+    async with contextlib.aclosing(objects):
+        with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+            async for object_key, get_object_response in objects:
+                entry_name = archive_entry_name(object_key, base_path)
+                if entry_name is None:
+                    LOGGER.warning("Left %s out of the archive, its key is not a safe entry name", object_key)
+                    get_object_response["Body"].close()
+                    continue
+                last_modified = max(get_object_response["LastModified"].astimezone(timezone.utc), ZIP_EPOCH)
+                entry_info = zipfile.ZipInfo(entry_name, date_time=last_modified.timetuple()[:6])
+                # known sizes let zipfile decide whether the entry needs ZIP64 extensions up front
+                entry_info.file_size = get_object_response["ContentLength"]
+                body_chunks = s3_executor.iter_body(get_object_response["Body"])
+                if get_object_response.get("ContentEncoding") == GZIP_CONTENT_ENCODING:
+                    # archive entries hold the original content of files stored compressed
+                    entry_info.file_size = uncompressed_size(get_object_response) or entry_info.file_size
+                    body_chunks = gunzip_chunks(body_chunks)
+                async with contextlib.aclosing(body_chunks):
+                    with archive.open(entry_info, mode="w") as entry:
+                        async for chunk in body_chunks:
+                            entry.write(chunk)
+                            if data := sink.pop():
+                                yield data
+                if data := sink.pop():
+                    yield data
+    # the central directory is written when the archive is closed
+    yield sink.pop()
@@ -0,0 +1,264 @@
+"""Operations on many files per request, fanned out to S3 with bounded concurrency."""
+
+import asyncio
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Optional,
+    TypeVar,
+)
+
+from botocore.exceptions import (
+    BotoCoreError,
+    ClientError,
+)
+from fastapi import (
+    UploadFile,
+    status,
+)
+
+from files_api.dedup import DedupIndex
+from files_api.listing_index import ListingIndex
+from files_api.listings import iter_directory_pages
+from files_api.metadata_cache import (
+    MetadataCache,
+    lookup_object_metadata,
+)
+from files_api.resilience import (
+    S3DeadlineExceededError,
+    S3UnavailableError,
+)
+from files_api.s3.delete_objects import (
+    DELETE_OBJECTS_MAX_KEYS,
+    delete_s3_objects,
+)
+from files_api.s3.executor import S3Executor
+from files_api.schemas import (
+    BatchDeleteResponse,
+    BatchPutFileResult,
+    BatchPutFilesResponse,
+    DeleteFileError,
+    FileHeadResultDict,
+)
+from files_api.settings import Settings
+from files_api.uploads import store_uploaded_file
+
+try:
+    from mypy_boto3_s3 import S3Client
+except ImportError:
+    ...
+
+T = TypeVar("T")
+
+
+async def gather_or_cancel(awaitables: list[Awaitable[T]]) -> list[T]:
+    """
+    Await many awaitables concurrently, like `asyncio.gather`.
+
+    If one of them fails, the others are cancelled and awaited before the error is raised, so none of them
+    keeps running once nobody waits for its result.
+    """
+    tasks = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def iter_directory_key_batches(
+    bucket_name: str,
+    prefix: str,
+    s3_client: "S3Client",
+    s3_executor: S3Executor,
+    batch_size: int = DELETE_OBJECTS_MAX_KEYS,
+) -> AsyncIterator[list[str]]:
+    """List the keys under a prefix one page at a time, so that only one page is held in memory."""
+    async for files in iter_directory_pages(bucket_name, prefix, s3_client, s3_executor, page_size=batch_size):
+        yield [item["Key"] for item in files]
+
+
+async def iter_key_batches(object_keys: list[str], batch_size: int = DELETE_OBJECTS_MAX_KEYS) -> AsyncIterator[list[str]]:
+    """Split a list of keys into batches of at most `batch_size` keys."""
+    for start in range(0, len(object_keys), batch_size):
+        yield object_keys[start : start + batch_size]
+
+
+async def delete_s3_objects_in_batches(
+    key_batches: AsyncIterator[list[str]],
+    bucket_name: str,
+    s3_client: "S3Client",
+    s3_executor: S3Executor,
+    max_concurrency: int,
+    on_deleted: Optional[Callable[[list[str]], None]] = None,
+) -> BatchDeleteResponse:
+    """
+    Delete batches of keys with concurrent DeleteObjects calls.
+
+    The next batch is only pulled from `key_batches` once one of the `max_concurrency` delete slots is
+    free, so memory stays flat however many keys there are to delete.
+
+    :param key_batches: Batches of at most `DELETE_OBJECTS_MAX_KEYS` keys to delete.
+    :param bucket_name: Name of the S3 bucket.
+    :param s3_client: The S3 client to delete with.
+    :param s3_executor: The executor running the blocking S3 calls.
+    :param max_concurrency: Maximum number of DeleteObjects calls in flight at once.
+    :param on_deleted: Optional callback receiving the keys of each batch that were deleted.
+
+    :return: The number of deleted keys and the keys that could not be deleted.
+    """
+    delete_slots = asyncio.Semaphore(max_concurrency)
+    deletions: list[asyncio.Task[None]] = []
+    response = BatchDeleteResponse(deleted_count=0, errors=[])
+
+    async def delete_batch(object_keys: list[str]) -> None:
+        try:
+            errors = await s3_executor.run(
+                delete_s3_objects,
+                bucket_name=bucket_name,
+                object_keys=object_keys,
+                s3_client=s3_client,
+            )
+        finally:
+            delete_slots.release()
+        failed_keys = {error["Key"] for error in errors}
+        deleted_keys = [object_key for object_key in object_keys if object_key not in failed_keys]
+        response.deleted_count += len(deleted_keys)
+        response.errors.extend(
+            DeleteFileError(file_path=error["Key"], code=error.get("Code", ""), message=error.get("Message", ""))
+            for error in errors
+        )
+        if on_deleted is not None:
+            on_deleted(deleted_keys)
+
+    try:
+        while True:
+            await delete_slots.acquire()
+            object_keys = await anext(key_batches, None)
+            if object_keys is None:
+                delete_slots.release()
+                break
+            # stop listing early when a batch has already failed, and stop tracking the batches that are done
+            for deletion in deletions:
+                if deletion.done() and deletion.exception() is not None:
+                    raise deletion.exception()  # type: ignore[misc]
+            deletions = [deletion for deletion in deletions if not deletion.done()]
+            deletions.append(asyncio.create_task(delete_batch(object_keys)))
+        await asyncio.gather(*deletions)
+    except BaseException:
+        for deletion in deletions:
+            deletion.cancel()
+        await asyncio.gather(*deletions, return_exceptions=True)
+        raise
+
+    return response
+
+
+async def store_uploaded_files(
+    uploads: list[tuple[str, UploadFile]],
+    settings: Settings,
+    s3_client: "S3Client",
+    s3_executor: S3Executor,
+    metadata_cache: MetadataCache,
+    listing_index: Optional[ListingIndex],
+    max_concurrency: int,
+    dedup_index: Optional[DedupIndex] = None,
+) -> BatchPutFilesResponse:
+    """
+    Upload many files concurrently, with at most `max_concurrency` uploads in flight.
+
+    :param uploads: Pairs of the path to store each file at and the uploaded file.
+
+    :return: The result of each upload, in the order of `uploads`.
+    """
+    upload_slots = asyncio.Semaphore(max_concurrency)
+
+    async def store(file_path: str, file: UploadFile) -> BatchPutFileResult:
+        async with upload_slots:
+            try:
+                object_already_exists = await store_uploaded_file(
+                    file=file,
+                    file_path=file_path,
+                    settings=settings,
+                    s3_client=s3_client,
+                    s3_executor=s3_executor,
+                    metadata_cache=metadata_cache,
+                    listing_index=listing_index,
+                    dedup_index=dedup_index,
+                )
+            except (BotoCoreError, ClientError):
+                return BatchPutFileResult(
+                    file_path=file_path,
+                    message=f"Failed to upload file at path: /{file_path}",
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                )
+            except S3UnavailableError:
+                # the call was refused to let S3 recover, so the client may try again later
+                return BatchPutFileResult(
+                    file_path=file_path,
+                    message=f"Storage temporarily unavailable, file not uploaded at path: /{file_path}",
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                )
+            except S3DeadlineExceededError:
+                return BatchPutFileResult(
+                    file_path=file_path,
+                    message=f"Storage did not answer in time, file not uploaded at path: /{file_path}",
+                    status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                )
+        if object_already_exists:
+            return BatchPutFileResult(
+                file_path=file_path,
+                message=f"Existing file updated at path: /{file_path}",
+                status_code=status.HTTP_200_OK,
+            )
+        return BatchPutFileResult(
+            file_path=file_path,
+            message=f"New file uploaded at path: /{file_path}",
+            status_code=status.HTTP_201_CREATED,
+        )
+
+    results = await gather_or_cancel([store(file_path, file) for file_path, file in uploads])
+    return BatchPutFilesResponse(results=results)
+
+
+async def lookup_files_metadata(
+    file_paths: list[str],
+    bucket_name: str,
+    s3_client: "S3Client",
+    s3_executor: S3Executor,
+    metadata_cache: MetadataCache,
+    max_concurrency: int,
+) -> list[FileHeadResultDict]:
+    """
+    Look up the metadata of many files concurrently, with at most `max_concurrency` head_object calls in flight.
+
+    Files whose metadata is cached need no S3 call at all. A failed lookup fails the whole batch, whose response
+    has no room for per-file errors; the other lookups are then cancelled.
+
+    :return: The metadata of each file, in the order of `file_paths`.
+    """
+    lookup_slots = asyncio.Semaphore(max_concurrency)
+
+    async def lookup(file_path: str) -> FileHeadResultDict:
+        async with lookup_slots:
+            object_metadata = await lookup_object_metadata(
+                bucket_name=bucket_name,
+                object_key=file_path,
+                s3_client=s3_client,
+                s3_executor=s3_executor,
+                metadata_cache=metadata_cache,
+            )
+        return {
+            "file_path": file_path,
+            "exists": object_metadata.exists,
+            "size_bytes": object_metadata.size_bytes,
+            "content_type": object_metadata.content_type,
+            "etag": object_metadata.etag,
+            "last_modified": object_metadata.last_modified,
+        }
+
+    return await gather_or_cancel([lookup(file_path) for file_path in file_paths])
+
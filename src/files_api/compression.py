@@ -0,0 +1,70 @@
+"""Optional gzip compression of stored files, negotiated with clients through `Accept-Encoding`."""
+
+import asyncio
+import contextlib
+import zlib
+from typing import (
+    AsyncIterator,
+    Optional,
+)
+
+GZIP_CONTENT_ENCODING = "gzip"
+
+# user-defined metadata key under which the size of a compressed object's original content is stored
+UNCOMPRESSED_SIZE_METADATA_KEY = "uncompressed-size"
+
+# zlib window size selecting the gzip container, rather than raw deflate or zlib
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+# largest chunk of decompressed content produced at once, however compressible the content is
+GUNZIP_MAX_CHUNK_SIZE = 1024 * 1024
+
+
+def is_compressible(content_type: Optional[str], compressible_content_types: list[str]) -> bool:
+    """
+    Return whether files of a content type are worth compressing.
+
+    :param content_type: The MIME type of the file, possibly with parameters, e.g. "text/csv; charset=utf-8".
+    :param compressible_content_types: MIME types to compress; "text/*" matches every subtype of "text".
+    """
+    if not content_type:
+        return False
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    main_type = media_type.split("/", 1)[0]
+    return any(
+        media_type == compressible or (compressible.endswith("/*") and compressible[:-2] == main_type)
+        for compressible in compressible_content_types
+    )
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int) -> AsyncIterator[bytes]:
+    """Compress a stream of chunks into a gzip stream; each chunk is compressed off the event loop."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+    async for chunk in chunks:
+        if compressed := await asyncio.to_thread(compressor.compress, chunk):
+            yield compressed
+    yield compressor.flush()
+
+
+async def gunzip_chunks(
+    chunks: AsyncIterator[bytes], max_chunk_size: int = GUNZIP_MAX_CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    """
+    Decompress a gzip stream chunk by chunk, off the event loop.
+
+    Each step yields at most `max_chunk_size` bytes, keeping the input it did not get to for the next step,
+    so a small, highly compressed chunk cannot inflate into one very large buffer.
+    """
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    async with contextlib.aclosing(chunks):
+        async for chunk in chunks:
+            while True:
+                decompressed = await asyncio.to_thread(decompressor.decompress, chunk, max_chunk_size)
+                if decompressed:
+                    yield decompressed
+                chunk = decompressor.unconsumed_tail
+                # a full chunk may leave output behind even once all of the input is consumed
+                if not chunk and len(decompressed) < max_chunk_size:
+                    break
+    if remaining := decompressor.flush():
+        yield remaining
@@ -0,0 +1,188 @@
+"""Opt-in deduplication of uploads: content already in the bucket is copied server-side instead of uploaded again."""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import (
+    BinaryIO,
+    Optional,
+)
+
+from botocore.exceptions import ClientError
+
+from files_api.compression import UNCOMPRESSED_SIZE_METADATA_KEY
+from files_api.metadata_cache import (
+    MetadataCache,
+    lookup_object_metadata,
+)
+from files_api.s3.executor import S3Executor
+from files_api.s3.read_objects import NO_SUCH_KEY_ERROR_CODE
+from files_api.s3.write_objects import (
+    PRECONDITION_FAILED_ERROR_CODE,
+    copy_s3_object,
+)
+
+try:
+    from mypy_boto3_s3 import S3Client
+except ImportError:
+    ...
+
+# user-defined metadata key under which the SHA-256 of an object's content is stored
+DIGEST_METADATA_KEY = "sha256"
+
+# CopyObject copies objects of up to 5 GiB in a single call
+COPY_OBJECT_MAX_BYTES = 5 * 1024 * 1024 * 1024
+
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(file: BinaryIO, chunk_size: int = DIGEST_CHUNK_SIZE) -> tuple[str, int]:
+    """
+    Compute the SHA-256 of a file from its start, then rewind it so it can be read again.
+
+    :return: The hex digest and the size of the file in bytes.
+    """
+    file.seek(0)
+    digest = hashlib.sha256()
+    size_bytes = 0
+    while chunk := file.read(chunk_size):
+        digest.update(chunk)
+        size_bytes += len(chunk)
+    file.seek(0)
+    return digest.hexdigest(), size_bytes
+
+
+@dataclass(frozen=True)
+class StoredContent:
+    """An object known to hold some content, as it was when it was written."""
+
+    object_key: str
+    etag: str
+    # copies of a compressed object must be stored with the same content coding
+    content_encoding: Optional[str] = None
+
+
+class DedupIndex:
+    """
+    A size-bounded LRU map from the SHA-256 of contents to an object holding them.
+
+    Entries are only hints: an object may be changed or deleted after it was recorded, which is detected
+    when it is copied (the copy is conditional on its ETag), and the entry is then forgotten.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, str], StoredContent] = OrderedDict()
+        self._lock = threading.Lock()
+        self.deduplicated_uploads = 0
+        self.bytes_saved = 0
+
+    def get(self, bucket_name: str, digest: str) -> Optional[StoredContent]:
+        """Return an object recorded as holding the content with this digest, if any."""
+        with self._lock:
+            stored_content = self._entries.get((bucket_name, digest))
+            if stored_content is not None:
+                self._entries.move_to_end((bucket_name, digest))
+            return stored_content
+
+    def put(self, bucket_name: str, digest: str, stored_content: StoredContent) -> None:
+        """Record that an object holds the content with this digest, evicting the least recently used entries if full."""
+        with self._lock:
+            self._entries[(bucket_name, digest)] = stored_content
+            self._entries.move_to_end((bucket_name, digest))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget(self, bucket_name: str, digest: str) -> None:
+        """Forget the object recorded for a digest, e.g. because it no longer holds that content."""
+        with self._lock:
+            self._entries.pop((bucket_name, digest), None)
+
+    def record_duplicate(self, size_bytes: int) -> None:
+        """Count an upload that did not need to transfer its content to S3."""
+        with self._lock:
+            self.deduplicated_uploads += 1
+            self.bytes_saved += size_bytes
+
+    def stats(self) -> dict:
+        """Return the counters used to measure how much deduplication saves."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "deduplicated_uploads": self.deduplicated_uploads,
+                "bytes_saved": self.bytes_saved,
+            }
+
+
+async def store_duplicate_content(
+    bucket_name: str,
+    object_key: str,
+    digest: str,
+    size_bytes: int,
+    content_type: Optional[str],
+    content_encoding: Optional[str],
+    s3_client: "S3Client",
+    s3_executor: S3Executor,
+    metadata_cache: MetadataCache,
+    dedup_index: DedupIndex,
+) -> Optional[bool]:
+    """
+    Store content at `object_key` without uploading it, if an object already holds the same content.
+
+    Nothing is written if `object_key` itself is known to hold the content already, with the same content type;
+    otherwise the content is copied server-side from the object recorded in the index, which may be `object_key`
+    itself when only its content type changes.
+
+    :return: Whether an existing file was replaced, or None if the content is not in the bucket and must be uploaded.
+    """
+    stored_content = dedup_index.get(bucket_name, digest)
+    if stored_content is None or size_bytes > COPY_OBJECT_MAX_BYTES:
+        return None
+    if stored_content.content_encoding != content_encoding:
+        # the content would be stored with a different coding than the upload asks for
+        return None
+
+    # Tells whether the file exists, and whether it already holds the content
+    object_metadata = await lookup_object_metadata(
+        bucket_name=bucket_name,
+        object_key=object_key,
+        s3_client=s3_client,
+        s3_executor=s3_executor,
+        metadata_cache=metadata_cache,
+    )
+    if (
+        stored_content.object_key == object_key
+        and object_metadata.etag == stored_content.etag
+        and object_metadata.content_type == (content_type or "application/octet-stream")
+    ):
+        dedup_index.record_duplicate(size_bytes)
+        return True
+
+    copy_metadata = {DIGEST_METADATA_KEY: digest}
+    if content_encoding is not None:
+        copy_metadata[UNCOMPRESSED_SIZE_METADATA_KEY] = str(size_bytes)
+    try:
+        await s3_executor.run(
+            copy_s3_object,
+            bucket_name=bucket_name,
+            source_key=stored_content.object_key,
+            object_key=object_key,
+            source_etag=stored_content.etag,
+            content_type=content_type,
+            metadata=copy_metadata,
+            content_encoding=content_encoding,
+            s3_client=s3_client,
+        )
+    except ClientError as err:
+        if err.response.get("Error", {}).get("Code") not in (NO_SUCH_KEY_ERROR_CODE, PRECONDITION_FAILED_ERROR_CODE):
+            raise
+        # The recorded object was changed or deleted since
+        dedup_index.forget(bucket_name, digest)
+        return None
+
+    # The copy changed the ETag and content type the metadata cache may hold for this key
+    metadata_cache.invalidate(bucket_name, object_key)
+    dedup_index.record_duplicate(size_bytes)
+    return object_metadata.exists
@@ -0,0 +1,70 @@
+"""FastAPI dependencies that hand resources owned by the app to the routes."""
+
+from typing import Optional
+
+from fastapi import Request
+
+from files_api.dedup import DedupIndex
+from files_api.disk_cache import DiskCache
+from files_api.listing_index import ListingIndex
+from files_api.metadata_cache import MetadataCache
+from files_api.metrics import Metrics
+from files_api.profiling import ProfileStore
+from files_api.resilience import S3Resilience
+from files_api.s3.executor import S3Executor
+from files_api.single_flight import SingleFlight
+
+try:
+    from mypy_boto3_s3 import S3Client
+except ImportError:
+    ...
+
+
+def get_s3_client(request: Request) -> "S3Client":
+    """Return the shared S3 client created by `create_app`."""
+    return request.app.state.s3_client
+
+
+def get_s3_executor(request: Request) -> S3Executor:
+    """Return the S3 thread pool created by `create_app`."""
+    return request.app.state.s3_executor
+
+
+def get_metadata_cache(request: Request) -> MetadataCache:
+    """Return the object metadata cache created by `create_app`."""
+    return request.app.state.metadata_cache
+
+
+def get_listing_index(request: Request) -> Optional[ListingIndex]:
+    """Return the listing index created by `create_app`, or None if it is disabled."""
+    return request.app.state.listing_index
+
+
+def get_disk_cache(request: Request) -> Optional[DiskCache]:
+    """Return the disk cache of file bodies created by `create_app`, or None if it is disabled."""
+    return request.app.state.disk_cache
+
+
+def get_dedup_index(request: Request) -> Optional[DedupIndex]:
+    """Return the deduplication index of uploaded contents created by `create_app`, or None if it is disabled."""
+    return request.app.state.dedup_index
+
+
+def get_metrics(request: Request) -> Metrics:
+    """Return the metrics of this worker created by `create_app`."""
+    return request.app.state.metrics
+
+
+def get_profile_store(request: Request) -> Optional[ProfileStore]:
+    """Return the store of request profiles created by `create_app`, or None if profiling is disabled."""
+    return request.app.state.profile_store
+
+
+def get_s3_resilience(request: Request) -> S3Resilience:
+    """Return the protections of the S3 calls of this worker created by `create_app`."""
+    return request.app.state.s3_resilience
+
+
+def get_single_flight(request: Request) -> Optional[SingleFlight]:
+    """Return the coalescer of concurrent identical S3 reads created by `create_app`, or None if it is disabled."""
+    return request.app.state.single_flight
@@ -0,0 +1,173 @@
+"""Optional local disk cache of object bodies, so hot files are served from disk instead of downloaded from S3."""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import (
+    AsyncIterator,
+    Optional,
+)
+
+
+@dataclass
+class CachedBody:
+    """A complete copy of an object's body on disk, and the validators of the version it holds."""
+
+    path: str
+    etag: str
+    size_bytes: int
+    content_type: str
+    last_modified: datetime
+    # requests currently serving the file; an evicted file is only deleted once none is left
+    readers: int = 0
+    evicted: bool = False
+
+
+class DiskCache:
+    """
+    A byte-budgeted LRU cache of object bodies stored as files in a local directory.
+
+    Files are written under a temporary name and renamed into place once complete, so a reader never
+    sees a partial file. Entries are only trusted after their ETag was checked against S3 (or against
+    fresh cached metadata), and a file is not deleted while a request is still serving it.
+
+    Every instance uses its own subdirectory of `directory`, removed by `close`, so worker processes
+    can share the same cache directory without sharing (or corrupting) each other's entries.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, max_object_bytes: int):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix="files-api-", dir=directory)
+        self.max_bytes = max_bytes
+        self.max_object_bytes = max_object_bytes
+        self._entries: OrderedDict[tuple[str, str], CachedBody] = OrderedDict()
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.lookups = 0
+        self.hits = 0
+        self.bytes_saved = 0
+        self.evictions = 0
+
+    def acquire(self, bucket_name: str, object_key: str) -> Optional[CachedBody]:
+        """Return the cached body of an object, protected from deletion until it is passed to `release`."""
+        with self._lock:
+            self.lookups += 1
+            cached_body = self._entries.get((bucket_name, object_key))
+            if cached_body is None:
+                return None
+            self._entries.move_to_end((bucket_name, object_key))
+            cached_body.readers += 1
+            return cached_body
+
+    def serve(self, cached_body: CachedBody) -> None:
+        """Record that a request is served from an acquired body; it takes its own reference, to `release` once sent."""
+        with self._lock:
+            cached_body.readers += 1
+            self.hits += 1
+            self.bytes_saved += cached_body.size_bytes
+
+    def release(self, cached_body: CachedBody) -> None:
+        """Give back a reference taken by `acquire` or `serve`, deleting the file if it was evicted meanwhile."""
+        with self._lock:
+            cached_body.readers -= 1
+            delete_file = cached_body.evicted and cached_body.readers == 0
+        if delete_file:
+            _remove_file(cached_body.path)
+
+    def accepts(self, size_bytes: int) -> bool:
+        """Return whether an object of this size is worth caching; a single object may not flush the whole cache."""
+        return size_bytes <= min(self.max_object_bytes, self.max_bytes)
+
+    async def fill(
+        self,
+        chunks: AsyncIterator[bytes],
+        bucket_name: str,
+        object_key: str,
+        etag: str,
+        size_bytes: int,
+        content_type: str,
+        last_modified: datetime,
+    ) -> AsyncIterator[bytes]:
+        """
+        Pass a body through while writing a copy of it to disk, then add the copy to the cache.
+
+        The copy is only added if the whole body went through; otherwise its partial file is deleted.
+        """
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        written_bytes = 0
+        try:
+            with os.fdopen(file_descriptor, "wb") as file:
+                async for chunk in chunks:
+                    await asyncio.to_thread(file.write, chunk)
+                    written_bytes += len(chunk)
+                    yield chunk
+        except BaseException:
+            _remove_file(temp_path)
+            raise
+        if written_bytes != size_bytes:
+            _remove_file(temp_path)
+            return
+        # the rename is atomic: the file appears under its final name only once complete
+        path = os.path.join(self.directory, uuid.uuid4().hex)
+        os.replace(temp_path, path)
+        self._add(
+            (bucket_name, object_key),
+            CachedBody(path=path, etag=etag, size_bytes=size_bytes, content_type=content_type, last_modified=last_modified),
+        )
+
+    def stats(self) -> dict:
+        """Return the counters used to tune the size of the cache."""
+        with self._lock:
+            misses = self.lookups - self.hits
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self.size_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": misses,
+                "hit_ratio": self.hits / self.lookups if self.lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "evictions": self.evictions,
+            }
+
+    def close(self) -> None:
+        """Delete the files of this cache."""
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _add(self, cache_key: tuple[str, str], cached_body: CachedBody) -> None:
+        evicted: list[CachedBody] = []
+        with self._lock:
+            replaced = self._entries.pop(cache_key, None)
+            if replaced is not None:
+                self.size_bytes -= replaced.size_bytes
+                evicted.append(replaced)
+            self._entries[cache_key] = cached_body
+            self.size_bytes += cached_body.size_bytes
+            while self.size_bytes > self.max_bytes:
+                _, least_recently_used = self._entries.popitem(last=False)
+                self.size_bytes -= least_recently_used.size_bytes
+                self.evictions += 1
+                evicted.append(least_recently_used)
+            unused: list[CachedBody] = []
+            for body in evicted:
+                body.evicted = True
+                if body.readers == 0:
+                    unused.append(body)
+        for body in unused:
+            _remove_file(body.path)
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,84 @@
+from typing import Callable
+
+import pydantic
+from botocore.exceptions import (
+    BotoCoreError,
+    ClientError,
+)
+from fastapi import (
+    Request,
+    status,
+)
+from fastapi.responses import JSONResponse
+
+from files_api.resilience import (
+    THROTTLING_ERROR_CODES,
+    S3DeadlineExceededError,
+    S3UnavailableError,
+)
+
+# seconds clients are asked to wait before retrying a request that failed because S3 is overloaded
+S3_OVERLOADED_RETRY_AFTER_SECONDS = 1
+
+
+async def handle_broad_exception(request: Request, call_next: Callable):
+    try:
+        return await call_next(request)
+    except Exception:
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"detail": "Internal server error"},
+        )
+        
+
+async def handle_pydantic_validation_errors(request: Request, exc: pydantic.ValidationError):
+    errors = exc.errors()
+    return JSONResponse(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        content={
+            "detail": [
+                {"msg": error["msg"], "input": error["input"]}
+                for error in errors
+            ]
+        },
+    )
+
+
+async def handle_s3_unavailable(request: Request, exc: S3UnavailableError):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Storage temporarily unavailable"},
+        headers={"Retry-After": str(exc.retry_after_seconds)},
+    )
+
+
+async def handle_s3_deadline_exceeded(request: Request, exc: S3DeadlineExceededError):
+    return JSONResponse(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        content={"detail": "Storage did not answer in time"},
+    )
+
+
+async def handle_s3_client_error(request: Request, exc: ClientError):
+    # S3 still throttling or failing once the retries are spent is temporary; any other error is a bug
+    error_code = exc.response.get("Error", {}).get("Code")
+    status_code = exc.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+    if error_code in THROTTLING_ERROR_CODES or status_code >= 500:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"detail": "Storage temporarily unavailable"},
+            headers={"Retry-After": str(S3_OVERLOADED_RETRY_AFTER_SECONDS)},
+        )
+    return JSONResponse(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        content={"detail": "Internal server error"},
+    )
+
+
+async def handle_s3_connection_error(request: Request, exc: BotoCoreError):
+    # S3 could not be reached or timed out, retries included
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Storage temporarily unavailable"},
+        headers={"Retry-After": str(S3_OVERLOADED_RETRY_AFTER_SECONDS)},
+    )
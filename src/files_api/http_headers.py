@@ -0,0 +1,184 @@
+"""Helpers for the HTTP headers the file routes read from requests and write to responses."""
+
+import re
+from datetime import (
+    datetime,
+    timezone,
+)
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+HTTP_DATE_FORMAT = "%a, %d %b %Y %H:%M:%S GMT"
+
+# a single byte range: "bytes=<first>-<last>", "bytes=<first>-" or "bytes=-<suffix length>"
+SINGLE_BYTE_RANGE_PATTERN = re.compile(r"^bytes=(?P<first>\d*)-(?P<last>\d*)$")
+
+
+def parse_range_header(range_header: Optional[str]) -> Optional[str]:
+    """
+    Validate a `Range` request header so it can be passed through to S3 `GetObject`.
+
+    Only single byte ranges are supported. Per RFC 9110, a server may ignore a `Range` header it
+    does not support, so malformed and multi-range headers are ignored and the whole file is served.
+
+    :param range_header: Value of the `Range` request header, if any.
+
+    :return: The normalized range, e.g. "bytes=0-99", or None if the whole file should be served.
+    """
+    if not range_header:
+        return None
+    match = SINGLE_BYTE_RANGE_PATTERN.match(range_header.replace(" ", ""))
+    if match is None:
+        return None
+    first, last = match.group("first"), match.group("last")
+    if not first and not last:
+        return None
+    if first and last and int(first) > int(last):
+        return None
+    return f"bytes={first}-{last}"
+
+
+def accepts_encoding(accept_encoding_header: Optional[str], content_coding: str) -> bool:
+    """
+    Return whether an `Accept-Encoding` request header allows a response in the given content coding.
+
+    A coding is accepted when it, or "*", is listed without a quality value of 0.
+
+    :param accept_encoding_header: Value of the `Accept-Encoding` request header, if any.
+    :param content_coding: The content coding of the response, e.g. "gzip".
+    """
+    if not accept_encoding_header:
+        return False
+    qualities = {}
+    for item in accept_encoding_header.split(","):
+        coding, _, parameters = item.partition(";")
+        quality = 1.0
+        name, _, value = parameters.partition("=")
+        if name.strip().lower() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    return qualities.get(content_coding, qualities.get("*", 0.0)) > 0
+
+
+def negotiate_media_type(accept_header: Optional[str], media_types: list[str]) -> Optional[str]:
+    """
+    Choose the media type of a response from those the server can produce, following the `Accept` request header.
+
+    The type with the highest quality value wins; ties go to the type listed first in `media_types`. Ranges
+    such as "text/*" and "*/*" match the types they cover, but a more specific entry overrides them.
+
+    :param accept_header: Value of the `Accept` request header, if any; without one, any type is accepted.
+    :param media_types: The media types the response can be sent in, in order of preference.
+
+    :return: The chosen media type, or None if the client accepts none of them.
+    """
+    if not accept_header:
+        return media_types[0]
+    # quality of each listed media range, with its specificity: an exact type beats "type/*", which beats "*/*"
+    ranges: dict[str, float] = {}
+    for item in accept_header.split(","):
+        media_range, *parameters = item.split(";")
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        ranges[media_range.strip().lower()] = quality
+
+    best_media_type, best_quality = None, 0.0
+    for media_type in media_types:
+        main_type = media_type.split("/")[0]
+        quality = next(
+            (
+                ranges[media_range]
+                for media_range in (media_type, f"{main_type}/*", "*/*")
+                if media_range in ranges
+            ),
+            0.0,
+        )
+        if quality > best_quality:
+            best_media_type, best_quality = media_type, quality
+    return best_media_type
+
+
+def parse_if_none_match(if_none_match_header: Optional[str]) -> list[str]:
+    """
+    Split an `If-None-Match` request header into the entity tags it lists.
+
+    `If-None-Match` uses weak comparison, so the `W/` prefix of weak tags is dropped.
+
+    :param if_none_match_header: Value of the `If-None-Match` request header, if any.
+
+    :return: The listed entity tags, e.g. ['"abc"', '"def"'] or ["*"]; empty if the header is absent.
+    """
+    if not if_none_match_header:
+        return []
+    entity_tags = [entity_tag.strip() for entity_tag in if_none_match_header.split(",")]
+    return [entity_tag.removeprefix("W/") for entity_tag in entity_tags if entity_tag]
+
+
+def etag_matches(etag: str, entity_tags: list[str]) -> bool:
+    """Return whether an object's ETag matches one of the tags of an `If-None-Match` header."""
+    return "*" in entity_tags or etag.removeprefix("W/") in entity_tags
+
+
+def is_not_modified(
+    etag: Optional[str],
+    last_modified: Optional[datetime],
+    if_none_match: list[str],
+    if_modified_since: Optional[datetime],
+) -> bool:
+    """
+    Evaluate the conditional headers of a GET or HEAD request against known validators of a file.
+
+    As required by RFC 9110, `If-Modified-Since` is only considered when there is no `If-None-Match`.
+    """
+    if if_none_match:
+        return etag is not None and etag_matches(etag, if_none_match)
+    if if_modified_since is not None and last_modified is not None:
+        # HTTP dates have a resolution of one second
+        return last_modified.replace(microsecond=0) <= if_modified_since
+    return False
+
+
+def parse_http_date(http_date: Optional[str]) -> Optional[datetime]:
+    """Parse an HTTP date such as the value of `If-Modified-Since`; invalid dates are ignored and return None."""
+    if not http_date:
+        return None
+    try:
+        parsed = parsedate_to_datetime(http_date)
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def format_http_date(timestamp: datetime) -> str:
+    """Format a timestamp as an HTTP date, e.g. for the `Last-Modified` response header."""
+    return timestamp.astimezone(timezone.utc).strftime(HTTP_DATE_FORMAT)
+
+
+def validator_headers(etag: Optional[str], last_modified: Optional[datetime]) -> dict[str, str]:
+    """Build the `ETag` and `Last-Modified` response headers clients use to revalidate a cached file."""
+    headers = {}
+    if etag:
+        headers["ETag"] = etag
+    if last_modified:
+        headers["Last-Modified"] = format_http_date(last_modified)
+    return headers
+
+
+def not_modified_headers(err_response: dict) -> dict[str, str]:
+    """Copy the validators S3 sent along with its "304 Not Modified" error, to send them on to the client."""
+    s3_headers = err_response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+    headers = {}
+    if "etag" in s3_headers:
+        headers["ETag"] = s3_headers["etag"]
+    if "last-modified" in s3_headers:
+        headers["Last-Modified"] = s3_headers["last-modified"]
+    return headers
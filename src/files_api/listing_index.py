@@ -0,0 +1,210 @@
+"""Optional in-memory index of the bucket's keys, to answer `GET /files` without calling ListObjectsV2."""
+
+import asyncio
+import base64
+import binascii
+import json
+import logging
+import threading
+from array import array
+from bisect import (
+    bisect_left,
+    bisect_right,
+)
+from datetime import (
+    datetime,
+    timezone,
+)
+from typing import Optional
+
+from files_api.s3.executor import S3Executor
+from files_api.s3.read_objects import iter_s3_object_pages
+
+try:
+    from mypy_boto3_s3 import S3Client
+    from mypy_boto3_s3.type_defs import ObjectTypeDef
+except ImportError:
+    ...
+
+LOGGER = logging.getLogger(__name__)
+
+# page tokens issued from the index start with this, to tell them apart from S3 continuation tokens
+INDEX_PAGE_TOKEN_PREFIX = "idx:"
+
+
+def encode_page_token(prefix: str, start_after: str) -> str:
+    """Encode where the next page of a listing starts as an opaque page token."""
+    position = json.dumps({"prefix": prefix, "start_after": start_after}).encode()
+    return INDEX_PAGE_TOKEN_PREFIX + base64.urlsafe_b64encode(position).decode()
+
+
+def decode_page_token(page_token: str) -> Optional[tuple[str, str]]:
+    """
+    Decode a page token issued by `encode_page_token`.
+
+    :return: The prefix and the key the next page starts after, or None if this is not an index page token.
+    """
+    if not page_token.startswith(INDEX_PAGE_TOKEN_PREFIX):
+        return None
+    try:
+        position = json.loads(base64.urlsafe_b64decode(page_token.removeprefix(INDEX_PAGE_TOKEN_PREFIX)))
+        return position["prefix"], position["start_after"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        return None
+
+
+class ListingIndex:
+    """
+    A sorted, array-backed index of the (key, size, last modified) of every object in the bucket.
+
+    Keys are kept in a sorted list next to two parallel arrays of sizes and POSIX timestamps, so a
+    page of a prefix listing is found with a binary search. The index is (re)built from a full scan
+    of the bucket and kept up to date in between by the writes made through the API. Writes made
+    while a rebuild is in progress are journaled and replayed on top of the freshly scanned keys.
+    """
+
+    def __init__(self):
+        self._keys: list[str] = []
+        self._sizes = array("q")
+        self._timestamps = array("d")
+        self._journal: Optional[list[tuple[str, Optional[tuple[int, float]]]]] = None
+        self._lock = threading.Lock()
+        self.ready = False
+        self.rebuilds = 0
+        self.last_rebuilt_at: Optional[datetime] = None
+
+    def upsert(self, object_key: str, size_bytes: int, last_modified: datetime) -> None:
+        """Record that an object was created or updated."""
+        self._record_change(object_key, (size_bytes, last_modified.timestamp()))
+
+    def remove(self, object_key: str) -> None:
+        """Record that an object was deleted."""
+        self._record_change(object_key, None)
+
+    def begin_rebuild(self) -> None:
+        """Start journaling writes, so none is lost when the index is replaced by `finish_rebuild`."""
+        with self._lock:
+            self._journal = []
+
+    def finish_rebuild(self, keys: list[str], sizes: array, timestamps: array) -> None:
+        """Replace the index with the result of a full scan, then replay the writes made during the scan."""
+        with self._lock:
+            self._keys, self._sizes, self._timestamps = keys, sizes, timestamps
+            for object_key, value in self._journal or []:
+                self._apply_change(object_key, value)
+            self._journal = None
+            self.ready = True
+            self.rebuilds += 1
+            self.last_rebuilt_at = datetime.now(timezone.utc)
+
+    def abort_rebuild(self) -> None:
+        """Stop journaling writes after a failed scan; the index keeps serving its current keys."""
+        with self._lock:
+            self._journal = None
+
+    def list_page(self, prefix: str, start_after: Optional[str], max_keys: int) -> tuple[list["ObjectTypeDef"], Optional[str]]:
+        """
+        Return a page of the objects under a prefix, in the same shape as ListObjectsV2 returns them.
+
+        :param prefix: Prefix to filter objects by.
+        :param start_after: Optional key the page starts after.
+        :param max_keys: Maximum number of objects in the page.
+
+        :return: Tuple of the objects in the page and the key the next page starts after, or None if this is the last page.
+        """
+        with self._lock:
+            start = bisect_left(self._keys, prefix)
+            if start_after:
+                start = max(start, bisect_right(self._keys, start_after))
+            # keys sharing the prefix are contiguous in the sorted list
+            end = start
+            while end < len(self._keys) and end - start <= max_keys and self._keys[end].startswith(prefix):
+                end += 1
+            files: list["ObjectTypeDef"] = [
+                {
+                    "Key": self._keys[position],
+                    "Size": self._sizes[position],
+                    "LastModified": datetime.fromtimestamp(self._timestamps[position], tz=timezone.utc),
+                }
+                for position in range(start, min(end, start + max_keys))
+            ]
+        has_more_files = end - start > max_keys
+        return files, files[-1]["Key"] if has_more_files else None
+
+    def stats(self) -> dict:
+        """Return the size and freshness of the index."""
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "objects": len(self._keys),
+                "rebuilds": self.rebuilds,
+                "last_rebuilt_at": self.last_rebuilt_at.isoformat() if self.last_rebuilt_at else None,
+            }
+
+    def _record_change(self, object_key: str, value: Optional[tuple[int, float]]) -> None:
+        with self._lock:
+            self._apply_change(object_key, value)
+            if self._journal is not None:
+                self._journal.append((object_key, value))
+
+    def _apply_change(self, object_key: str, value: Optional[tuple[int, float]]) -> None:
+        position = bisect_left(self._keys, object_key)
+        found = position < len(self._keys) and self._keys[position] == object_key
+        if value is None:
+            if found:
+                del self._keys[position]
+                del self._sizes[position]
+                del self._timestamps[position]
+        elif found:
+            self._sizes[position], self._timestamps[position] = value
+        else:
+            self._keys.insert(position, object_key)
+            self._sizes.insert(position, value[0])
+            self._timestamps.insert(position, value[1])
+
+
+def scan_bucket(bucket_name: str, s3_client: "S3Client") -> tuple[list[str], array, array]:
+    """List every object of the bucket into the sorted arrays backing a `ListingIndex`."""
+    keys: list[str] = []
+    sizes = array("q")
+    timestamps = array("d")
+    for files in iter_s3_object_pages(bucket_name, s3_client=s3_client):
+        for item in files:
+            keys.append(item["Key"])
+            sizes.append(item["Size"])
+            timestamps.append(item["LastModified"].timestamp())
+    # ListObjectsV2 returns keys in UTF-8 binary order, which matches Python's string order
+    return keys, sizes, timestamps
+
+
+async def rebuild_listing_index(
+    listing_index: ListingIndex,
+    bucket_name: str,
+    s3_client: "S3Client",
+    s3_executor: S3Executor,
+) -> None:
+    """Reconcile the index with the bucket through a full paginated scan."""
+    listing_index.begin_rebuild()
+    try:
+        scanned = await s3_executor.run(scan_bucket, bucket_name, s3_client)
+    except BaseException:
+        listing_index.abort_rebuild()
+        raise
+    listing_index.finish_rebuild(*scanned)
+
+
+async def maintain_listing_index(
+    listing_index: ListingIndex,
+    bucket_name: str,
+    s3_client: "S3Client",
+    s3_executor: S3Executor,
+    reconcile_interval_seconds: float,
+) -> None:
+    """Bootstrap the index, then periodically reconcile it with the bucket until cancelled."""
+    while True:
+        try:
+            await rebuild_listing_index(listing_index, bucket_name, s3_client, s3_executor)
+        except Exception:  # pylint: disable=broad-except
+            # listings keep being served from S3, or from the previous index, until the next attempt
+            LOGGER.exception("Failed to rebuild the listing index of bucket %s", bucket_name)
+        await asyncio.sleep(reconcile_interval_seconds)
@@ -0,0 +1,134 @@
+"""Walk every object under a prefix from async code, one page of ListObjectsV2 results at a time."""
+
+import asyncio
+import base64
+import binascii
+import json
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Optional,
+)
+
+from files_api.s3.executor import S3Executor
+from files_api.s3.read_objects import (
+    DEFAULT_MAX_KEYS,
+    fetch_s3_objects_metadata,
+    fetch_s3_objects_using_page_token,
+)
+
+try:
+    from mypy_boto3_s3 import S3Client
+    from mypy_boto3_s3.type_defs import ObjectTypeDef
+except ImportError:
+    ...
+
+# distinguishes the page tokens of non-recursive listings from S3 continuation tokens and from index page tokens
+DIRECTORY_PAGE_TOKEN_PREFIX = "dir:"
+
+# distinguishes the page tokens of recursive listings served from S3 from bare S3 continuation tokens
+OBJECTS_PAGE_TOKEN_PREFIX = "s3:"
+
+
+def encode_directory_page_token(prefix: str, continuation_token: str) -> str:
+    """
+    Encode the position of the next page of a non-recursive listing as an opaque page token.
+
+    An S3 continuation token alone does not tell which prefix and delimiter the listing uses, so the prefix is kept
+    next to it.
+    """
+    position = json.dumps({"prefix": prefix, "continuation_token": continuation_token}).encode()
+    return DIRECTORY_PAGE_TOKEN_PREFIX + base64.urlsafe_b64encode(position).decode()
+
+
+def decode_directory_page_token(page_token: str) -> Optional[tuple[str, str]]:
+    """
+    Decode a page token issued by `encode_directory_page_token`.
+
+    :return: The prefix and the S3 continuation token of the next page, or None if this is not a directory page token.
+    """
+    if not page_token.startswith(DIRECTORY_PAGE_TOKEN_PREFIX):
+        return None
+    try:
+        position = json.loads(base64.urlsafe_b64decode(page_token.removeprefix(DIRECTORY_PAGE_TOKEN_PREFIX)))
+        return position["prefix"], position["continuation_token"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        return None
+
+
+def encode_objects_page_token(prefix: str, continuation_token: str) -> str:
+    """
+    Encode the position of the next page of a recursive listing served from S3 as an opaque page token.
+
+    S3 does not restrict the keys of the next page to the prefix of the listing from the continuation token alone,
+    so the prefix is kept next to it.
+    """
+    position = json.dumps({"prefix": prefix, "continuation_token": continuation_token}).encode()
+    return OBJECTS_PAGE_TOKEN_PREFIX + base64.urlsafe_b64encode(position).decode()
+
+
+def decode_objects_page_token(page_token: str) -> Optional[tuple[str, str]]:
+    """
+    Decode a page token issued by `encode_objects_page_token`.
+
+    :return: The prefix and the S3 continuation token of the next page, or None if this is not such a page token.
+    """
+    if not page_token.startswith(OBJECTS_PAGE_TOKEN_PREFIX):
+        return None
+    try:
+        position = json.loads(base64.urlsafe_b64decode(page_token.removeprefix(OBJECTS_PAGE_TOKEN_PREFIX)))
+        return position["prefix"], position["continuation_token"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        return None
+
+
+async def iter_directory_pages(
+    bucket_name: str,
+    prefix: str,
+    s3_client: "S3Client",
+    s3_executor: S3Executor,
+    page_size: int = DEFAULT_MAX_KEYS,
+    prefetch: bool = False,
+) -> AsyncIterator[list["ObjectTypeDef"]]:
+    """
+    List the objects under a prefix one non-empty page at a time, so that only one page is held in memory.
+
+    With `prefetch`, the next page is fetched while the consumer handles the current one, so at most two
+    pages are held in memory and the consumer rarely waits for S3.
+    """
+
+    def fetch_page(page_token: Optional[str]) -> Awaitable[tuple[list["ObjectTypeDef"], Optional[str]]]:
+        if page_token is None:
+            return s3_executor.run(
+                fetch_s3_objects_metadata,
+                bucket_name=bucket_name,
+                prefix=prefix,
+                max_keys=page_size,
+                s3_client=s3_client,
+            )
+        return s3_executor.run(
+            fetch_s3_objects_using_page_token,
+            bucket_name=bucket_name,
+            continuation_token=page_token,
+            max_keys=page_size,
+            s3_client=s3_client,
+            prefix=prefix,
+        )
+
+    files, next_page_token = await fetch_page(None)
+    next_page: Optional[asyncio.Task] = None
+    try:
+        while True:
+            if next_page_token and prefetch:
+                next_page = asyncio.create_task(fetch_page(next_page_token))
+            if files:
+                yield files
+            if not next_page_token:
+                return
+            files, next_page_token = await (next_page if next_page is not None else fetch_page(next_page_token))
+            next_page = None
+    finally:
+        if next_page is not None:
+            # the consumer stopped early: drop the page being fetched, and any error fetching it
+            next_page.cancel()
+            next_page.add_done_callback(lambda task: task.cancelled() or task.exception())
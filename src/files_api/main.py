@@ -1,21 +1,181 @@
+import asyncio
+import contextlib
 import os
+import sys
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 
 import pydantic
+from botocore.exceptions import (
+    ClientError,
+    ConnectionError,
+    HTTPClientError,
+)
 from fastapi import FastAPI
 
 
+from files_api.dedup import DedupIndex
+from files_api.disk_cache import DiskCache
+from files_api.listing_index import (
+    ListingIndex,
+    maintain_listing_index,
+)
+from files_api.metadata_cache import MetadataCache
+from files_api.metrics import (
+    Metrics,
+    MetricsMiddleware,
+    instrument_s3_client,
+    publish_metrics,
+    remove_snapshot,
+)
+from files_api.profiling import (
+    ProfileStore,
+    ProfilingMiddleware,
+    profile_s3_calls,
+)
+from files_api.resilience import (
+    AdaptiveRateLimiter,
+    CircuitBreaker,
+    RequestDeadlineMiddleware,
+    RetryBudget,
+    S3DeadlineExceededError,
+    S3Resilience,
+    S3UnavailableError,
+    protect_s3_client,
+)
 from files_api.settings import Settings
 from files_api.routes import ROUTER
-from src.errors import handle_broad_exception, handle_pydantic_validation_errors
+from files_api.s3.client import (
+    create_s3_client,
+    warm_up_s3_client,
+)
+from files_api.s3.executor import S3Executor
+from files_api.single_flight import SingleFlight
+from files_api.errors import (
+    handle_broad_exception,
+    handle_pydantic_validation_errors,
+    handle_s3_client_error,
+    handle_s3_connection_error,
+    handle_s3_deadline_exceeded,
+    handle_s3_unavailable,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Start the background tasks of the app, and release the resources created by `create_app` when it shuts down."""
+    settings: Settings = app.state.settings
+    if settings.s3_warm_up_connections:
+        # Pay for credentials, endpoint resolution and TLS handshakes before the server accepts connections
+        await warm_up_s3_client(
+            s3_client=app.state.s3_client,
+            s3_executor=app.state.s3_executor,
+            bucket_name=settings.s3_bucket_name,
+            connection_count=settings.s3_warm_up_connections,
+        )
+    background_tasks = []
+    if app.state.listing_index is not None:
+        # Bootstrap the listing index in the background; listings are served from S3 until it is ready
+        background_tasks.append(
+            asyncio.create_task(
+                maintain_listing_index(
+                    listing_index=app.state.listing_index,
+                    bucket_name=settings.s3_bucket_name,
+                    s3_client=app.state.s3_client,
+                    s3_executor=app.state.s3_executor,
+                    reconcile_interval_seconds=settings.listing_index_reconcile_interval_seconds,
+                )
+            )
+        )
+
+    if settings.metrics_multiprocess_dir:
+        # Publish the metrics of this worker for `/metrics` to merge them with those of the other workers
+        background_tasks.append(
+            asyncio.create_task(
+                publish_metrics(
+                    metrics=app.state.metrics,
+                    directory=settings.metrics_multiprocess_dir,
+                    interval_seconds=settings.metrics_publish_interval_seconds,
+                )
+            )
+        )
+
+    yield
+
+    for task in background_tasks:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    if settings.metrics_multiprocess_dir:
+        # The other workers stop counting this one once it is gone
+        remove_snapshot(settings.metrics_multiprocess_dir)
+    # Let in-flight S3 calls finish before closing the connections they use
+    await asyncio.to_thread(app.state.s3_executor.shutdown)
+    # Close the pooled connections held by the shared S3 client
+    app.state.s3_client.close()
+    if app.state.disk_cache is not None:
+        app.state.disk_cache.close()
 
 
 def create_app(settings: Settings | None = None) -> FastAPI:
     """Create and return the FastAPI application instance."""
     # Use the provided settings or create a new Settings instance if none are given
     settings = settings or Settings(s3_bucket_name=os.environ["S3_BUCKET_NAME"])
-    app = FastAPI()
+    app = FastAPI(lifespan=lifespan)
     # Store the settings in the app's state for access throughout the app
     app.state.settings = settings
+    # Create a single pooled S3 client shared by every request, rather than one client per S3 call
+    app.state.s3_client = create_s3_client(settings)
+    # Record the requests handled and the S3 calls made by this worker, exposed at `/metrics`
+    app.state.metrics = Metrics()
+    instrument_s3_client(app.state.s3_client, app.state.metrics)
+    # Optionally profile requests asking for it, or a sample of them, and keep their profiles for `/debug/profiles`
+    profiling_enabled = settings.profiling_header_enabled or settings.profiling_sample_rate > 0
+    app.state.profile_store = (
+        ProfileStore(max_profiles=settings.profiling_max_stored_profiles) if profiling_enabled else None
+    )
+    if profiling_enabled:
+        profile_s3_calls(app.state.s3_client)
+    # Throttle, budget the retries of, and fail fast the S3 calls of this worker when S3 struggles
+    app.state.s3_resilience = S3Resilience(
+        rate_limiter=AdaptiveRateLimiter(
+            max_rate=settings.s3_max_request_rate,
+            min_rate=min(settings.s3_min_request_rate, settings.s3_max_request_rate),
+        ),
+        retry_budget=RetryBudget(
+            ratio=settings.s3_retry_budget_ratio,
+            max_balance=settings.s3_retry_budget_max_retries,
+        ),
+        circuit_breaker=CircuitBreaker(
+            failure_threshold=settings.s3_circuit_breaker_failure_threshold,
+            reset_timeout_seconds=settings.s3_circuit_breaker_reset_seconds,
+        ),
+        call_timeout_seconds=settings.s3_call_timeout_seconds,
+    )
+    protect_s3_client(app.state.s3_client, app.state.s3_resilience)
+    # Run the blocking boto3 calls on a bounded thread pool so they never stall the event loop
+    app.state.s3_executor = S3Executor(max_concurrency=settings.s3_max_concurrency)
+    # Cache object metadata so hot keys can be checked without a round trip to S3
+    app.state.metadata_cache = MetadataCache(
+        max_entries=settings.metadata_cache_max_entries,
+        ttl_seconds=settings.metadata_cache_ttl_seconds,
+    )
+    # Let concurrent identical reads of a hot object share one S3 call
+    app.state.single_flight = SingleFlight() if settings.single_flight_enabled else None
+    # Optionally index the bucket's keys in memory to answer listings without calling S3
+    app.state.listing_index = ListingIndex() if settings.listing_index_enabled else None
+    # Optionally keep copies of hot files on local disk to serve them without downloading them from S3
+    app.state.disk_cache = (
+        DiskCache(
+            directory=settings.disk_cache_dir,
+            max_bytes=settings.disk_cache_max_bytes,
+            max_object_bytes=settings.disk_cache_max_object_bytes,
+        )
+        if settings.disk_cache_dir
+        else None
+    )
+    # Optionally remember the digests of uploaded contents, to copy duplicates server-side instead of uploading them
+    app.state.dedup_index = DedupIndex(max_entries=settings.dedup_index_max_entries) if settings.dedup_enabled else None
     # Register the API router with the FastAPI app
     app.include_router(ROUTER)
     # Add a custom exception handler for Pydantic validation errors
@@ -23,13 +183,31 @@ def create_app(settings: Settings | None = None) -> FastAPI:
         exc_class_or_status_code=pydantic.ValidationError,
         handler=handle_pydantic_validation_errors,
     )
+    # Answer S3 calls refused to protect S3, or failed because S3 is overloaded, with 503 or 504 instead of 500
+    app.add_exception_handler(exc_class_or_status_code=S3UnavailableError, handler=handle_s3_unavailable)
+    app.add_exception_handler(exc_class_or_status_code=S3DeadlineExceededError, handler=handle_s3_deadline_exceeded)
+    app.add_exception_handler(exc_class_or_status_code=ClientError, handler=handle_s3_client_error)
+    for connection_error in (ConnectionError, HTTPClientError):
+        app.add_exception_handler(exc_class_or_status_code=connection_error, handler=handle_s3_connection_error)
     # Add a middleware to handle broad exceptions and return appropriate responses
     app.middleware("http")(handle_broad_exception)
+    # Profile requests around the exception handling, so failed requests are profiled too
+    if app.state.profile_store is not None:
+        app.add_middleware(
+            ProfilingMiddleware,
+            profile_store=app.state.profile_store,
+            sample_rate=settings.profiling_sample_rate,
+            header_enabled=settings.profiling_header_enabled,
+        )
+    # Give the S3 calls of requests sent with a timeout a deadline
+    app.add_middleware(RequestDeadlineMiddleware)
+    # Add the metrics middleware last so it wraps the others and sees the responses they produce
+    app.add_middleware(MetricsMiddleware, metrics=app.state.metrics)
     # Return the configured FastAPI application instance
     return app
 
 
 if __name__ == "__main__":
-    import uvicorn
+    from files_api.server import main
 
-    uvicorn.run(ROUTER, host="0.0.0.0", port=8000)
+    sys.exit(main())
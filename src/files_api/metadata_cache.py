@@ -0,0 +1,219 @@
+"""In-process cache of S3 object metadata, so hot keys need no `head_object` round trip."""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import (
+    Callable,
+    Optional,
+)
+
+from botocore.exceptions import ClientError
+
+from files_api.compression import UNCOMPRESSED_SIZE_METADATA_KEY
+from files_api.s3.executor import S3Executor
+from files_api.s3.read_objects import (
+    OBJECT_NOT_FOUND_ERROR_CODE,
+    fetch_s3_object_metadata,
+)
+from files_api.single_flight import SingleFlight
+
+try:
+    from mypy_boto3_s3 import S3Client
+    from mypy_boto3_s3.type_defs import (
+        GetObjectOutputTypeDef,
+        HeadObjectOutputTypeDef,
+    )
+except ImportError:
+    ...
+
+
+@dataclass(frozen=True)
+class ObjectMetadata:
+    """What the API needs to know about an object, or that it does not exist."""
+
+    exists: bool
+    size_bytes: Optional[int] = None
+    content_type: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[datetime] = None
+    # set for objects stored compressed, e.g. "gzip"; `size_bytes` is then the size of the compressed content
+    content_encoding: Optional[str] = None
+    uncompressed_size_bytes: Optional[int] = None
+
+    @classmethod
+    def from_head_object_response(cls, response: "HeadObjectOutputTypeDef") -> "ObjectMetadata":
+        return cls(
+            exists=True,
+            size_bytes=response["ContentLength"],
+            content_type=response.get("ContentType"),
+            etag=response.get("ETag"),
+            last_modified=response.get("LastModified"),
+            content_encoding=response.get("ContentEncoding"),
+            uncompressed_size_bytes=uncompressed_size(response),
+        )
+
+    @classmethod
+    def from_get_object_response(cls, response: "GetObjectOutputTypeDef") -> "ObjectMetadata":
+        # the body of a range request is only part of the object, whose full size ends the Content-Range
+        content_range = response.get("ContentRange")
+        return cls(
+            exists=True,
+            size_bytes=int(content_range.rsplit("/", 1)[1]) if content_range else response["ContentLength"],
+            content_type=response.get("ContentType"),
+            etag=response.get("ETag"),
+            last_modified=response.get("LastModified"),
+            content_encoding=response.get("ContentEncoding"),
+            uncompressed_size_bytes=uncompressed_size(response),
+        )
+
+
+def uncompressed_size(response: "HeadObjectOutputTypeDef | GetObjectOutputTypeDef") -> Optional[int]:
+    """Return the size of the original content of an object stored compressed, if it was recorded."""
+    size = response.get("Metadata", {}).get(UNCOMPRESSED_SIZE_METADATA_KEY)
+    return int(size) if size is not None and size.isdigit() else None
+
+
+MISSING_OBJECT = ObjectMetadata(exists=False)
+
+
+class MetadataCache:
+    """
+    A size-bounded LRU cache of object metadata whose entries expire after a TTL.
+
+    Writes made through the API update or invalidate their entries; the TTL bounds how long
+    changes made by anyone else (or by another worker process) can go unnoticed.
+    A cache with `max_entries=0` is disabled and never stores anything.
+
+    Every `put` and `invalidate` of a key bumps its generation. A lookup reads the generation before calling
+    S3 and hands it to `put`, which drops the result if the key was written or invalidated in the meantime,
+    e.g. by an upload that completed while S3 was answering that the file did not exist.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: OrderedDict[tuple[str, str], tuple[float, ObjectMetadata]] = OrderedDict()
+        # the generations of the most recently written keys; forgotten ones are at most `_generation_floor`
+        self._generations: OrderedDict[tuple[str, str], int] = OrderedDict()
+        self._last_generation = 0
+        self._generation_floor = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, bucket_name: str, object_key: str) -> Optional[ObjectMetadata]:
+        """Return the cached metadata of an object, or None if it is not cached or has expired."""
+        cache_key = (bucket_name, object_key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None or entry[0] <= self._clock():
+                if entry is not None:
+                    del self._entries[cache_key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(cache_key)
+            self.hits += 1
+            return entry[1]
+
+    def generation(self, bucket_name: str, object_key: str) -> int:
+        """Return the generation of an object's entry, to hand to `put` along with metadata looked up from now on."""
+        with self._lock:
+            return self._generations.get((bucket_name, object_key), self._generation_floor)
+
+    def put(
+        self, bucket_name: str, object_key: str, metadata: ObjectMetadata, generation: Optional[int] = None
+    ) -> None:
+        """
+        Cache the metadata of an object, evicting the least recently used entries if the cache is full.
+
+        :param generation: The generation of the entry when the metadata was looked up, if it may be stale by now;
+            the metadata is then dropped if the entry was written or invalidated since.
+        """
+        if self.max_entries <= 0:
+            return
+        cache_key = (bucket_name, object_key)
+        with self._lock:
+            if generation is not None and generation != self._generations.get(cache_key, self._generation_floor):
+                return
+            self._bump_generation(cache_key)
+            self._entries[cache_key] = (self._clock() + self.ttl_seconds, metadata)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, bucket_name: str, object_key: str) -> None:
+        """Forget the cached metadata of an object."""
+        with self._lock:
+            self._bump_generation((bucket_name, object_key))
+            self._entries.pop((bucket_name, object_key), None)
+
+    def _bump_generation(self, cache_key: tuple[str, str]) -> None:
+        self._last_generation += 1
+        self._generations[cache_key] = self._last_generation
+        self._generations.move_to_end(cache_key)
+        while len(self._generations) > max(self.max_entries, 1):
+            # lookups of the forgotten key that started before its last write still see a newer generation
+            _, forgotten_generation = self._generations.popitem(last=False)
+            self._generation_floor = max(self._generation_floor, forgotten_generation)
+
+    def stats(self) -> dict:
+        """Return the counters used to tune the size and TTL of the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+async def lookup_object_metadata(
+    bucket_name: str,
+    object_key: str,
+    s3_client: "S3Client",
+    s3_executor: S3Executor,
+    metadata_cache: MetadataCache,
+    single_flight: Optional[SingleFlight] = None,
+) -> ObjectMetadata:
+    """
+    Return the metadata of an object, from the cache if possible, otherwise with one `head_object` call.
+
+    Missing objects are cached too, so repeated lookups of a nonexistent key also skip S3.
+    With `single_flight`, concurrent lookups of the same object share a single `head_object` call.
+    """
+    metadata = metadata_cache.get(bucket_name, object_key)
+    if metadata is not None:
+        return metadata
+
+    async def head_object() -> ObjectMetadata:
+        # a write of the object while S3 answers makes the answer stale, so it is not cached
+        generation = metadata_cache.generation(bucket_name, object_key)
+        try:
+            head_object_response = await s3_executor.run(
+                fetch_s3_object_metadata,
+                bucket_name,
+                object_key=object_key,
+                s3_client=s3_client,
+            )
+            metadata = ObjectMetadata.from_head_object_response(head_object_response)
+        except ClientError as err:
+            if err.response.get("Error", {}).get("Code") != OBJECT_NOT_FOUND_ERROR_CODE:
+                raise
+            metadata = MISSING_OBJECT
+        metadata_cache.put(bucket_name, object_key, metadata, generation=generation)
+        return metadata
+
+    if single_flight is None:
+        return await head_object()
+    metadata, _ = await single_flight.do(("head_object", bucket_name, object_key), head_object)
+    return metadata
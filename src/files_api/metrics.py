@@ -0,0 +1,379 @@
+"""Prometheus metrics of the API: request latencies per route, in-flight requests, bytes transferred and S3 calls."""
+
+import asyncio
+import bisect
+import contextlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import (
+    Any,
+    Iterable,
+    Optional,
+)
+
+from starlette.types import (
+    ASGIApp,
+    Message,
+    Receive,
+    Scope,
+    Send,
+)
+
+try:
+    from mypy_boto3_s3 import S3Client
+except ImportError:
+    ...
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# upper bounds of the latency histograms, in seconds
+LATENCY_BUCKETS_SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# route label of the requests that matched no route, so unknown paths cannot blow up the number of series
+UNMATCHED_ROUTE = "unmatched"
+
+# what the latency histogram needs from the start of each S3 call, kept in botocore's context of that call
+_S3_START_TIME_CONTEXT_KEY = "files_api_metrics_start_time"
+_S3_OPERATION_CONTEXT_KEY = "files_api_metrics_operation"
+
+
+class Counter:
+    """A metric whose value per set of labels only goes up, e.g. a number of requests or bytes."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values: dict[tuple[str, ...], float] = {}
+        # each metric has its own lock, held for a single dict update, so recording never waits for long
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple[str, ...] = (), amount: float = 1.0) -> None:
+        """Add `amount` to the value of the series with these label values."""
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> list[list]:
+        """Return the label values and value of every series, in a JSON-serializable form."""
+        with self._lock:
+            return [[list(labels), value] for labels, value in self._values.items()]
+
+
+class Gauge(Counter):
+    """A metric whose value per set of labels goes up and down, e.g. a number of requests in flight."""
+
+    type_name = "gauge"
+
+    def dec(self, labels: tuple[str, ...] = (), amount: float = 1.0) -> None:
+        """Subtract `amount` from the value of the series with these label values."""
+        self.inc(labels, -amount)
+
+
+class Histogram:
+    """A metric counting observed values, e.g. latencies, in buckets of fixed upper bounds, per set of labels."""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS_SECONDS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        # per series: the count of each bucket (not cumulative), then of the +Inf bucket, then the sum of the values
+        self._values: dict[tuple[str, ...], list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple[str, ...], value: float) -> None:
+        """Count a value in the series with these label values."""
+        bucket_index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[bucket_index] += 1
+            state[-1] += value
+
+    def samples(self) -> list[list]:
+        """Return the label values and bucket counts and sum of every series, in a JSON-serializable form."""
+        with self._lock:
+            return [[list(labels), list(state)] for labels, state in self._values.items()]
+
+
+class Metrics:
+    """The metrics recorded by a worker process, and their rendering in the Prometheus text format."""
+
+    def __init__(self):
+        self.http_request_duration = Histogram(
+            "files_api_http_request_duration_seconds",
+            "Time spent handling HTTP requests, by method, route and status code.",
+            ("method", "route", "status"),
+        )
+        self.http_requests_in_flight = Gauge(
+            "files_api_http_requests_in_flight",
+            "Number of HTTP requests being handled, by method.",
+            ("method",),
+        )
+        self.http_request_bytes = Counter(
+            "files_api_http_request_bytes_total",
+            "Bytes received in HTTP request bodies, by method and route.",
+            ("method", "route"),
+        )
+        self.http_response_bytes = Counter(
+            "files_api_http_response_bytes_total",
+            "Bytes sent in HTTP response bodies, by method and route.",
+            ("method", "route"),
+        )
+        self.s3_request_duration = Histogram(
+            "files_api_s3_request_duration_seconds",
+            "Time spent in S3 calls, retries included, by operation and HTTP status code (or 'error').",
+            ("operation", "status"),
+        )
+        self.s3_retries = Counter(
+            "files_api_s3_retries_total",
+            "Number of S3 calls retried by botocore, by operation.",
+            ("operation",),
+        )
+        self._metrics: list[Counter | Histogram] = [
+            self.http_request_duration,
+            self.http_requests_in_flight,
+            self.http_request_bytes,
+            self.http_response_bytes,
+            self.s3_request_duration,
+            self.s3_retries,
+        ]
+
+    def snapshot(self) -> dict:
+        """Return the current values of the metrics of this process, in a JSON-serializable form."""
+        return {
+            "pid": os.getpid(),
+            "metrics": {metric.name: metric.samples() for metric in self._metrics},
+        }
+
+    def render(self, snapshots: Iterable[dict] = ()) -> str:
+        """
+        Render the metrics in the Prometheus text format.
+
+        :param snapshots: Snapshots of other worker processes to add to the values of this one.
+        """
+        merged = {metric.name: _merge_samples({}, metric.samples()) for metric in self._metrics}
+        for snapshot in snapshots:
+            # the gauges of a process that is gone describe nothing anymore, unlike its counters
+            process_alive = _is_process_alive(snapshot.get("pid"))
+            for metric in self._metrics:
+                if metric.type_name == "gauge" and not process_alive:
+                    continue
+                _merge_samples(merged[metric.name], snapshot.get("metrics", {}).get(metric.name, []))
+
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for labels, value in sorted(merged[metric.name].items()):
+                label_pairs = list(zip(metric.label_names, labels))
+                if isinstance(metric, Histogram):
+                    if len(value) != len(metric.buckets) + 2:
+                        # recorded with other buckets, e.g. by an older version of the app
+                        continue
+                    cumulative_count = 0.0
+                    for upper_bound, count in zip([*metric.buckets, float("inf")], value):
+                        cumulative_count += count
+                        bucket_labels = _format_labels([*label_pairs, ("le", _format_value(upper_bound))])
+                        lines.append(f"{metric.name}_bucket{bucket_labels} {_format_value(cumulative_count)}")
+                    lines.append(f"{metric.name}_sum{_format_labels(label_pairs)} {_format_value(value[-1])}")
+                    lines.append(f"{metric.name}_count{_format_labels(label_pairs)} {_format_value(cumulative_count)}")
+                else:
+                    lines.append(f"{metric.name}{_format_labels(label_pairs)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording the latency, status code and body sizes of every HTTP request.
+
+    Requests are labelled with the template of the route they matched (e.g. `/files/{file_path:path}`)
+    rather than their path, so the number of series stays bounded.
+    """
+
+    def __init__(self, app: ASGIApp, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        # stays 500 if the app fails before starting a response
+        status_code = 500
+        content_length = 0
+        request_bytes = 0
+        response_bytes = 0
+
+        async def receive_counting_bytes() -> Message:
+            nonlocal request_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                request_bytes += len(message.get("body", b""))
+            return message
+
+        async def send_counting_bytes(message: Message) -> None:
+            nonlocal status_code, content_length, response_bytes
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                for name, value in message.get("headers", []):
+                    if name.lower() == b"content-length":
+                        content_length = int(value)
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            elif message["type"] == "http.response.pathsend":
+                # the server sends the file itself
+                response_bytes += content_length
+            await send(message)
+
+        self.metrics.http_requests_in_flight.inc((method,))
+        start_time = time.perf_counter()
+        try:
+            await self.app(scope, receive_counting_bytes, send_counting_bytes)
+        finally:
+            duration_seconds = time.perf_counter() - start_time
+            self.metrics.http_requests_in_flight.dec((method,))
+            # set by the router on the scope once a route matched
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            self.metrics.http_request_duration.observe((method, route, str(status_code)), duration_seconds)
+            if request_bytes:
+                self.metrics.http_request_bytes.inc((method, route), request_bytes)
+            if response_bytes:
+                self.metrics.http_response_bytes.inc((method, route), response_bytes)
+
+
+def instrument_s3_client(s3_client: "S3Client", metrics: Metrics) -> None:
+    """Record the latency, status code and retries of every call made by an S3 client, using botocore's event hooks."""
+
+    def start_timer(model: Any, context: dict, **kwargs) -> None:
+        context[_S3_OPERATION_CONTEXT_KEY] = model.name
+        context[_S3_START_TIME_CONTEXT_KEY] = time.perf_counter()
+
+    def record_response(http_response: Any, parsed: dict, model: Any, context: dict, **kwargs) -> None:
+        start_time = context.get(_S3_START_TIME_CONTEXT_KEY)
+        if start_time is None:
+            return
+        duration_seconds = time.perf_counter() - start_time
+        metrics.s3_request_duration.observe((model.name, str(http_response.status_code)), duration_seconds)
+        retry_attempts = parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+        if retry_attempts:
+            metrics.s3_retries.inc((model.name,), retry_attempts)
+
+    def record_error(exception: Exception, context: dict, **kwargs) -> None:
+        # e.g. a connection error or timeout, once botocore gave up retrying
+        start_time = context.get(_S3_START_TIME_CONTEXT_KEY)
+        if start_time is None:
+            return
+        operation = context[_S3_OPERATION_CONTEXT_KEY]
+        metrics.s3_request_duration.observe((operation, "error"), time.perf_counter() - start_time)
+
+    events = s3_client.meta.events
+    events.register("before-call.s3", start_timer)
+    events.register("after-call.s3", record_response)
+    events.register("after-call-error.s3", record_error)
+
+
+def snapshot_path(directory: str) -> str:
+    """Return the path of the file the snapshots of this process are written to."""
+    return os.path.join(directory, f"{os.getpid()}.json")
+
+
+def write_snapshot(metrics: Metrics, directory: str) -> None:
+    """Write the current values of the metrics of this process to `directory`, for the other workers to read."""
+    os.makedirs(directory, exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(file_descriptor, "w") as file:
+            json.dump(metrics.snapshot(), file)
+        # the rename is atomic: readers never see a partially written snapshot
+        os.replace(temp_path, snapshot_path(directory))
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def remove_snapshot(directory: str) -> None:
+    """Remove the snapshot of this process, when it exits, so the directory does not fill up with exited workers."""
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(snapshot_path(directory))
+
+
+def read_snapshots(directory: str) -> list[dict]:
+    """Read the snapshots written to `directory` by the other worker processes, including any that crashed."""
+    own_file_name = os.path.basename(snapshot_path(directory))
+    snapshots = []
+    for file_name in os.listdir(directory) if os.path.isdir(directory) else []:
+        if not file_name.endswith(".json") or file_name == own_file_name:
+            continue
+        try:
+            with open(os.path.join(directory, file_name)) as file:
+                snapshots.append(json.load(file))
+        except (OSError, ValueError):
+            # removed or replaced meanwhile
+            continue
+    return snapshots
+
+
+async def publish_metrics(metrics: Metrics, directory: str, interval_seconds: float) -> None:
+    """Periodically write a snapshot of the metrics of this process, so `/metrics` on any worker covers all of them."""
+    while True:
+        await asyncio.to_thread(write_snapshot, metrics, directory)
+        await asyncio.sleep(interval_seconds)
+
+
+def _merge_samples(merged: dict, samples: list[list]) -> dict:
+    for labels, value in samples:
+        labels = tuple(labels)
+        if isinstance(value, list):
+            previous = merged.get(labels)
+            merged[labels] = value if previous is None else [a + b for a, b in zip(previous, value)]
+        else:
+            merged[labels] = merged.get(labels, 0.0) + value
+    return merged
+
+
+def _is_process_alive(pid: Optional[int]) -> bool:
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # exists, but belongs to another user
+        return True
+    return True
+
+
+def _format_labels(label_pairs: list[tuple[str, str]]) -> str:
+    if not label_pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in label_pairs) + "}"
+
+
+def _escape_label_value(label_value: str) -> str:
+    return label_value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
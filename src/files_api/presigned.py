@@ -0,0 +1,168 @@
+"""Presigned S3 URLs, letting clients download and upload file contents without passing them through the API."""
+
+import math
+from datetime import (
+    datetime,
+    timedelta,
+    timezone,
+)
+from typing import Optional
+
+from files_api.listing_index import ListingIndex
+from files_api.metadata_cache import (
+    MetadataCache,
+    ObjectMetadata,
+    lookup_object_metadata,
+)
+from files_api.s3.executor import S3Executor
+from files_api.s3.write_objects import (
+    complete_multipart_upload,
+    create_multipart_upload,
+    generate_presigned_put_url,
+    generate_presigned_upload_part_url,
+)
+from files_api.schemas import (
+    PresignedUploadPart,
+    PresignUploadResponse,
+)
+from files_api.settings import (
+    S3_MAX_PARTS,
+    Settings,
+)
+
+try:
+    from mypy_boto3_s3 import S3Client
+except ImportError:
+    ...
+
+
+def upload_part_size(size_bytes: int, min_part_size: int) -> int:
+    """Return the size of the parts of an upload: `min_part_size`, or more if that makes too many parts for S3."""
+    return max(min_part_size, math.ceil(size_bytes / S3_MAX_PARTS))
+
+
+def generate_presigned_upload_part_urls(
+    bucket_name: str,
+    object_key: str,
+    upload_id: str,
+    part_count: int,
+    expires_in_seconds: int,
+    s3_client: "S3Client",
+) -> list[str]:
+    """Sign the URLs of every part of a multipart upload, in order of part number."""
+    return [
+        generate_presigned_upload_part_url(
+            bucket_name=bucket_name,
+            object_key=object_key,
+            upload_id=upload_id,
+            part_number=part_number,
+            expires_in_seconds=expires_in_seconds,
+            s3_client=s3_client,
+        )
+        for part_number in range(1, part_count + 1)
+    ]
+
+
+async def presign_upload(
+    file_path: str,
+    size_bytes: int,
+    content_type: Optional[str],
+    settings: Settings,
+    s3_client: "S3Client",
+    s3_executor: S3Executor,
+) -> PresignUploadResponse:
+    """
+    Issue the URLs a client uploads a file of `size_bytes` bytes to, straight to S3.
+
+    A file fitting in a single part is sent with one PUT. Larger files get a multipart upload, with one URL per
+    part; the client then hands the ETags of the parts to `complete_presigned_upload`.
+    """
+    s3_bucket_name = settings.s3_bucket_name
+    expires_in_seconds = settings.presigned_url_expiration_seconds
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=expires_in_seconds)
+    part_size = upload_part_size(size_bytes, settings.multipart_part_size_bytes)
+
+    if size_bytes <= part_size:
+        url = generate_presigned_put_url(
+            bucket_name=s3_bucket_name,
+            object_key=file_path,
+            expires_in_seconds=expires_in_seconds,
+            content_type=content_type,
+            s3_client=s3_client,
+        )
+        part = PresignedUploadPart(
+            part_number=1, url=url, headers={"Content-Type": content_type or "application/octet-stream"}
+        )
+        return PresignUploadResponse(
+            file_path=file_path, upload_id=None, part_size_bytes=part_size, parts=[part], expires_at=expires_at
+        )
+
+    upload_id = await s3_executor.run(
+        create_multipart_upload,
+        bucket_name=s3_bucket_name,
+        object_key=file_path,
+        content_type=content_type,
+        s3_client=s3_client,
+    )
+    # signing happens locally, but thousands of parts would still hold up the event loop
+    urls = await s3_executor.run(
+        generate_presigned_upload_part_urls,
+        bucket_name=s3_bucket_name,
+        object_key=file_path,
+        upload_id=upload_id,
+        part_count=math.ceil(size_bytes / part_size),
+        expires_in_seconds=expires_in_seconds,
+        s3_client=s3_client,
+    )
+    return PresignUploadResponse(
+        file_path=file_path,
+        upload_id=upload_id,
+        part_size_bytes=part_size,
+        parts=[PresignedUploadPart(part_number=number, url=url) for number, url in enumerate(urls, start=1)],
+        expires_at=expires_at,
+    )
+
+
+async def complete_presigned_upload(
+    file_path: str,
+    upload_id: Optional[str],
+    part_etags: list[str],
+    settings: Settings,
+    s3_client: "S3Client",
+    s3_executor: S3Executor,
+    metadata_cache: MetadataCache,
+    listing_index: Optional[ListingIndex],
+) -> ObjectMetadata:
+    """
+    Finish an upload made with presigned URLs, and bring the metadata cache and listing index up to date.
+
+    Multipart uploads are assembled from their parts; single PUTs only need the caches refreshed.
+
+    :return: The metadata of the uploaded file, which does not exist if a single PUT was never sent.
+    """
+    s3_bucket_name = settings.s3_bucket_name
+    if upload_id is not None:
+        await s3_executor.run(
+            complete_multipart_upload,
+            bucket_name=s3_bucket_name,
+            object_key=file_path,
+            upload_id=upload_id,
+            part_etags=part_etags,
+            s3_client=s3_client,
+        )
+    # The cached metadata describes the previous version of the file, if any
+    metadata_cache.invalidate(s3_bucket_name, file_path)
+    object_metadata = await lookup_object_metadata(
+        bucket_name=s3_bucket_name,
+        object_key=file_path,
+        s3_client=s3_client,
+        s3_executor=s3_executor,
+        metadata_cache=metadata_cache,
+    )
+    if listing_index is not None and object_metadata.exists:
+        listing_index.upsert(
+            file_path,
+            size_bytes=object_metadata.size_bytes,
+            last_modified=object_metadata.last_modified or datetime.now(timezone.utc),
+        )
+    return object_metadata
@@ -0,0 +1,281 @@
+"""Opt-in profiling of single requests, reported in a `Server-Timing` header and kept for `/debug/profiles`."""
+
+import contextvars
+import functools
+import inspect
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import (
+    dataclass,
+    field,
+)
+from datetime import (
+    datetime,
+    timezone,
+)
+from typing import (
+    Any,
+    Callable,
+    Coroutine,
+    Optional,
+)
+
+from fastapi import (
+    Request,
+    Response,
+)
+from fastapi.routing import APIRoute
+from starlette.datastructures import MutableHeaders
+from starlette.types import (
+    ASGIApp,
+    Message,
+    Receive,
+    Scope,
+    Send,
+)
+
+try:
+    from mypy_boto3_s3 import S3Client
+except ImportError:
+    ...
+
+# a request sent with this header is profiled, if profiling by header is enabled
+PROFILE_REQUEST_HEADER = "X-Profile"
+# response header holding the id under which the profile of a request is kept
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+# set in the botocore context of an S3 call only when it is made for a profiled request, which `record_call` reports
+_S3_START_TIME_CONTEXT_KEY = "files_api_profiling_start_time"
+_S3_OPERATION_CONTEXT_KEY = "files_api_profiling_operation"
+
+# the profile of the request being handled, if it is profiled; the S3 executor propagates it to its threads
+_current_profile: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar(
+    "current_profile", default=None
+)
+
+
+@dataclass
+class ProfilePhase:
+    """Time spent in one phase of a request, e.g. validating its parameters or one S3 call."""
+
+    name: str
+    duration_ms: float
+    description: Optional[str] = None
+
+
+@dataclass
+class RequestProfile:
+    """Where the time handling a request went."""
+
+    profile_id: str
+    method: str
+    path: str
+    started_at: datetime
+    # "header" or "sample"
+    trigger: str
+    status_code: Optional[int] = None
+    duration_ms: Optional[float] = None
+    phases: list[ProfilePhase] = field(default_factory=list)
+    # when the endpoint function started and returned, in `time.perf_counter` seconds
+    endpoint_started_at: Optional[float] = field(default=None, repr=False)
+    endpoint_finished_at: Optional[float] = field(default=None, repr=False)
+
+    def add_phase(self, name: str, duration_seconds: float, description: Optional[str] = None) -> None:
+        """Record the time spent in a phase; phases may overlap, e.g. S3 calls happen during the endpoint."""
+        # list.append is atomic, so S3 calls finishing on several threads at once cannot lose a phase
+        self.phases.append(ProfilePhase(name=name, duration_ms=duration_seconds * 1000, description=description))
+
+    def server_timing(self, total_seconds: float) -> str:
+        """Format the phases recorded so far as the value of a `Server-Timing` header."""
+        metrics = []
+        for phase in self.phases:
+            description = f';desc="{phase.description}"' if phase.description else ""
+            metrics.append(f"{phase.name}{description};dur={phase.duration_ms:.3f}")
+        metrics.append(f"total;dur={total_seconds * 1000:.3f}")
+        return ", ".join(metrics)
+
+    def to_dict(self) -> dict:
+        """Return the profile in a JSON-serializable form."""
+        return {
+            "profile_id": self.profile_id,
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at.isoformat(),
+            "trigger": self.trigger,
+            "status_code": self.status_code,
+            "duration_ms": self.duration_ms,
+            "phases": [
+                {"name": phase.name, "duration_ms": phase.duration_ms, "description": phase.description}
+                for phase in self.phases
+            ],
+        }
+
+
+class ProfileStore:
+    """The most recent request profiles, up to `max_profiles`."""
+
+    def __init__(self, max_profiles: int):
+        self.max_profiles = max_profiles
+        self._profiles: deque[RequestProfile] = deque(maxlen=max_profiles)
+        self._lock = threading.Lock()
+
+    def add(self, profile: RequestProfile) -> None:
+        """Keep a profile, dropping the oldest one if full."""
+        with self._lock:
+            self._profiles.append(profile)
+
+    def recent(self) -> list[RequestProfile]:
+        """Return the profiles kept, most recent first."""
+        with self._lock:
+            return list(reversed(self._profiles))
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        """Return the profile with this id, if it is still kept."""
+        with self._lock:
+            return next((profile for profile in self._profiles if profile.profile_id == profile_id), None)
+
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware profiling the requests sent with the profiling header, and a sample of all requests.
+
+    A request that is not profiled costs a header lookup and a random draw; the other hooks do nothing
+    when no profile is set for the current request.
+    """
+
+    def __init__(self, app: ASGIApp, profile_store: ProfileStore, sample_rate: float, header_enabled: bool):
+        self.app = app
+        self.profile_store = profile_store
+        self.sample_rate = sample_rate
+        self.header_enabled = header_enabled
+        self._header_name = PROFILE_REQUEST_HEADER.lower().encode("latin-1")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trigger = self._profiling_trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(
+            profile_id=uuid.uuid4().hex,
+            method=scope["method"],
+            path=scope["path"],
+            started_at=datetime.now(timezone.utc),
+            trigger=trigger,
+        )
+        start_time = time.perf_counter()
+        response_started_at: Optional[float] = None
+
+        async def send_with_server_timing(message: Message) -> None:
+            nonlocal response_started_at
+            if message["type"] == "http.response.start":
+                response_started_at = time.perf_counter()
+                profile.status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", profile.server_timing(response_started_at - start_time))
+                headers.append(PROFILE_ID_HEADER, profile.profile_id)
+            await send(message)
+
+        token = _current_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_with_server_timing)
+        finally:
+            _current_profile.reset(token)
+            finished_at = time.perf_counter()
+            if response_started_at is not None:
+                # sending the body, e.g. streaming a file from S3, comes after the Server-Timing header
+                profile.add_phase("response", finished_at - response_started_at)
+            profile.duration_ms = (finished_at - start_time) * 1000
+            self.profile_store.add(profile)
+
+    def _profiling_trigger(self, scope: Scope) -> Optional[str]:
+        if self.header_enabled and any(name == self._header_name for name, _ in scope["headers"]):
+            return "header"
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+
+class ProfiledAPIRoute(APIRoute):
+    """
+    A route timing the phases of the requests being profiled.
+
+    - validation: reading the body and resolving the parameters and dependencies of the endpoint
+    - endpoint: running the endpoint function
+    - serialization: validating and serializing what the endpoint returned
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        super().__init__(path, _time_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        route_handler = super().get_route_handler()
+
+        async def profiled_route_handler(request: Request) -> Response:
+            profile = _current_profile.get()
+            if profile is None:
+                return await route_handler(request)
+            start_time = time.perf_counter()
+            try:
+                return await route_handler(request)
+            finally:
+                finished_at = time.perf_counter()
+                endpoint_started_at = profile.endpoint_started_at or finished_at
+                profile.add_phase("validation", endpoint_started_at - start_time)
+                if profile.endpoint_finished_at is not None:
+                    profile.add_phase("endpoint", profile.endpoint_finished_at - endpoint_started_at)
+                    profile.add_phase("serialization", finished_at - profile.endpoint_finished_at)
+
+        return profiled_route_handler
+
+
+def _time_endpoint(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+    if not inspect.iscoroutinefunction(endpoint):
+        return endpoint
+
+    # FastAPI reads the parameters of the endpoint through `__wrapped__`
+    @functools.wraps(endpoint)
+    async def timed_endpoint(*args: Any, **kwargs: Any) -> Any:
+        profile = _current_profile.get()
+        if profile is None:
+            return await endpoint(*args, **kwargs)
+        profile.endpoint_started_at = time.perf_counter()
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            profile.endpoint_finished_at = time.perf_counter()
+
+    return timed_endpoint
+
+
+def profile_s3_calls(s3_client: "S3Client") -> None:
+    """Time every S3 call made while handling a profiled request, using botocore's event hooks."""
+
+    def start_timer(model: Any, context: dict, **kwargs) -> None:
+        if _current_profile.get() is not None:
+            context[_S3_OPERATION_CONTEXT_KEY] = model.name
+            context[_S3_START_TIME_CONTEXT_KEY] = time.perf_counter()
+
+    def record_call(context: dict, parsed: Optional[dict] = None, exception: Optional[Exception] = None, **kwargs):
+        profile = _current_profile.get()
+        start_time = context.get(_S3_START_TIME_CONTEXT_KEY)
+        if profile is None or start_time is None:
+            return
+        description = context[_S3_OPERATION_CONTEXT_KEY]
+        retry_attempts = (parsed or {}).get("ResponseMetadata", {}).get("RetryAttempts", 0)
+        if retry_attempts:
+            description += f" ({retry_attempts} retries)"
+        if exception is not None:
+            description += f" ({type(exception).__name__})"
+        profile.add_phase("s3", time.perf_counter() - start_time, description=description)
+
+    events = s3_client.meta.events
+    events.register("before-call.s3", start_timer)
+    events.register("after-call.s3", record_call)
+    events.register("after-call-error.s3", record_call)
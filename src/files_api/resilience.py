@@ -0,0 +1,346 @@
+"""
+Protection of S3, and of the API, when S3 throttles or fails: adaptive rate limiting, a retry budget, deadlines
+and a circuit breaker, applied to every call of the shared S3 client through botocore's event hooks.
+
+- The rate limiter is a token bucket whose rate halves when S3 throttles, and grows back as calls succeed.
+- The retry budget lets botocore retry only a fraction of the calls, so retries cannot multiply the load on S3.
+- Deadlines stop a call from waiting for a token or retrying once its caller no longer waits for it.
+- The circuit breaker fails calls fast, without calling S3, after consecutive failures, then lets one call
+  through from time to time to tell when S3 has recovered.
+
+Refused calls raise `S3UnavailableError`, answered with 503 and `Retry-After`, or `S3DeadlineExceededError`,
+answered with 504.
+"""
+
+import contextvars
+import math
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Optional,
+)
+
+from starlette.types import (
+    ASGIApp,
+    Receive,
+    Scope,
+    Send,
+)
+
+try:
+    from mypy_boto3_s3 import S3Client
+except ImportError:
+    ...
+
+# a request sent with this header, in seconds, gives up on the S3 calls made for it once that time has passed
+REQUEST_TIMEOUT_HEADER = "X-Request-Timeout"
+
+# error codes with which S3 asks its clients to slow down
+THROTTLING_ERROR_CODES = frozenset({"SlowDown", "Throttling", "ThrottlingException", "RequestLimitExceeded"})
+
+# where `start_call` leaves the deadline of a call, for `start_retry` to find in the request of every attempt
+_DEADLINE_CONTEXT_KEY = "files_api_resilience_deadline"
+
+# when the request being handled stops waiting for its S3 calls, in `time.monotonic` seconds
+_request_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+def request_time_left() -> Optional[float]:
+    """Return the seconds left until the deadline of the request being handled, or None if it has none."""
+    request_deadline = _request_deadline.get()
+    return None if request_deadline is None else request_deadline - time.monotonic()
+
+
+def copy_context_without_request_deadline() -> contextvars.Context:
+    """Return a copy of the current context in which S3 calls have no request deadline, e.g. to share them."""
+    context = contextvars.copy_context()
+    context.run(_request_deadline.set, None)
+    return context
+
+
+class S3UnavailableError(Exception):
+    """An S3 call refused by the API itself, to let S3 recover."""
+
+    def __init__(self, message: str, retry_after_seconds: int):
+        super().__init__(message)
+        self.retry_after_seconds = retry_after_seconds
+
+
+class CircuitOpenError(S3UnavailableError):
+    """S3 failed too many calls in a row, so calls fail fast until it had time to recover."""
+
+
+class RetryBudgetExhaustedError(S3UnavailableError):
+    """A call failed and could be retried, but too many calls were retried lately."""
+
+
+class S3DeadlineExceededError(Exception):
+    """An S3 call could not complete before its deadline, waiting for a token or for a retry included."""
+
+
+class AdaptiveRateLimiter:
+    """
+    A token bucket limiting the rate of S3 calls, holding up to one second worth of tokens.
+
+    The rate starts at `max_rate`, halves (down to `min_rate`) when S3 throttles, at most once per second so
+    a burst of throttled calls counts once, and grows back by 5% with every call that is not throttled.
+    """
+
+    def __init__(self, max_rate: float, min_rate: float, clock: Callable[[], float] = time.monotonic):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.rate = max_rate
+        self._clock = clock
+        self._tokens = max_rate
+        self._refilled_at = clock()
+        self._decreased_at = -math.inf
+        self._lock = threading.Lock()
+
+    def reserve(self, timeout_seconds: float) -> Optional[float]:
+        """
+        Take a token, possibly one that is only available later.
+
+        :return: Seconds to wait before using the token, or None if that is longer than `timeout_seconds`,
+            in which case no token is taken.
+        """
+        with self._lock:
+            self._refill()
+            wait_seconds = max(0.0, (1 - self._tokens) / self.rate)
+            if wait_seconds > timeout_seconds:
+                return None
+            # tokens go negative when calls queue up, so each waits for its own token
+            self._tokens -= 1
+            return wait_seconds
+
+    def on_throttled(self) -> None:
+        """Halve the rate, unless it was already halved less than a second ago."""
+        with self._lock:
+            now = self._clock()
+            if now - self._decreased_at < 1:
+                return
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, self.rate)
+            self._decreased_at = now
+
+    def on_success(self) -> None:
+        """Grow the rate back towards `max_rate`."""
+        with self._lock:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate * 1.05)
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.rate, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+
+class RetryBudget:
+    """
+    Retries allowed as a fraction of the calls made: every call adds `ratio` of a retry to the budget, every
+    retry takes one, and up to `max_balance` retries are kept for bursts.
+    """
+
+    def __init__(self, ratio: float, max_balance: float):
+        self.ratio = ratio
+        self.max_balance = max_balance
+        self._balance = max_balance
+        self._lock = threading.Lock()
+
+    @property
+    def balance(self) -> float:
+        return self._balance
+
+    def deposit(self) -> None:
+        """Record a call."""
+        with self._lock:
+            self._balance = min(self.max_balance, self._balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Take a retry from the budget, if there is one left."""
+        with self._lock:
+            if self._balance < 1:
+                return False
+            self._balance -= 1
+            return True
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast once `failure_threshold` calls in a row failed ("open").
+
+    After `reset_timeout_seconds`, one call is let through ("half-open"): the circuit closes again if it
+    succeeds, and stays open for another `reset_timeout_seconds` otherwise.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self, failure_threshold: int, reset_timeout_seconds: float, clock: Callable[[], float] = time.monotonic
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self._clock = clock
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return self.CLOSED
+            return self.HALF_OPEN if self._clock() - self._opened_at >= self.reset_timeout_seconds else self.OPEN
+
+    def allow(self) -> Optional[float]:
+        """
+        Tell whether a call may go through, letting a single one through when it is time to check on S3.
+
+        :return: None if the call may go through, otherwise the seconds left until the next check.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return None
+            retry_after_seconds = self._opened_at + self.reset_timeout_seconds - self._clock()
+            if retry_after_seconds > 0:
+                return retry_after_seconds
+            # the other calls keep failing fast while this one checks on S3, or until it is time for another check
+            self._opened_at = self._clock()
+            return None
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._consecutive_failures = 0
+            self._opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._consecutive_failures >= self.failure_threshold and self._opened_at is None:
+                self._opened_at = self._clock()
+
+
+class S3Resilience:
+    """The rate limiter, retry budget and circuit breaker shared by every S3 call of a worker."""
+
+    def __init__(
+        self,
+        rate_limiter: AdaptiveRateLimiter,
+        retry_budget: RetryBudget,
+        circuit_breaker: CircuitBreaker,
+        call_timeout_seconds: float,
+    ):
+        self.rate_limiter = rate_limiter
+        self.retry_budget = retry_budget
+        self.circuit_breaker = circuit_breaker
+        self.call_timeout_seconds = call_timeout_seconds
+        self._lock = threading.Lock()
+        self._rejected_calls = {"circuit_open": 0, "retry_budget_exhausted": 0, "deadline_exceeded": 0}
+
+    def stats(self) -> dict:
+        """Report the state of each protection, and the number of calls each of them refused."""
+        with self._lock:
+            rejected_calls = dict(self._rejected_calls)
+        return {
+            "circuit_state": self.circuit_breaker.state,
+            "request_rate_limit": self.rate_limiter.rate,
+            "retry_budget_balance": self.retry_budget.balance,
+            "rejected_calls": rejected_calls,
+        }
+
+    def before_attempt(self, deadline: float, is_retry: bool) -> None:
+        """Wait for a token to make an attempt of an S3 call, or raise if it must not be made."""
+        if (retry_after_seconds := self.circuit_breaker.allow()) is not None:
+            self._count_rejection("circuit_open")
+            raise CircuitOpenError("S3 is failing, calls to it are suspended", math.ceil(retry_after_seconds))
+        if is_retry and not self.retry_budget.withdraw():
+            self._count_rejection("retry_budget_exhausted")
+            raise RetryBudgetExhaustedError("Too many S3 calls were retried lately", 1)
+        wait_seconds = self.rate_limiter.reserve(timeout_seconds=deadline - time.monotonic())
+        if wait_seconds is None:
+            self._count_rejection("deadline_exceeded")
+            raise S3DeadlineExceededError("The S3 call could not be made before its deadline")
+        if wait_seconds:
+            # the hooks run on the S3 thread pool, never on the event loop
+            time.sleep(wait_seconds)
+
+    def after_attempt(self, status_code: Optional[int], error_code: Optional[str]) -> None:
+        """Learn from the outcome of an attempt: its HTTP status code and error code, or None if it got no response."""
+        throttled = error_code in THROTTLING_ERROR_CODES or status_code == 503
+        if throttled:
+            self.rate_limiter.on_throttled()
+        else:
+            self.rate_limiter.on_success()
+        if status_code is None or status_code >= 500 or throttled:
+            self.circuit_breaker.record_failure()
+        else:
+            self.circuit_breaker.record_success()
+
+    def _count_rejection(self, reason: str) -> None:
+        with self._lock:
+            self._rejected_calls[reason] += 1
+
+
+def protect_s3_client(s3_client: "S3Client", resilience: S3Resilience) -> None:
+    """Apply the protections of `resilience` to every attempt of every call made by an S3 client."""
+
+    def start_call(context: dict, **kwargs) -> None:
+        deadline = time.monotonic() + resilience.call_timeout_seconds
+        if (request_deadline := _request_deadline.get()) is not None:
+            deadline = min(deadline, request_deadline)
+        context[_DEADLINE_CONTEXT_KEY] = deadline
+        resilience.retry_budget.deposit()
+        resilience.before_attempt(deadline, is_retry=False)
+
+    def start_retry(request: Any, **kwargs) -> None:
+        # botocore creates the request of each attempt anew, the first one included
+        deadline = request.context.get(_DEADLINE_CONTEXT_KEY)
+        if deadline is None or request.context.get("retries", {}).get("attempt", 1) == 1:
+            return
+        resilience.before_attempt(deadline, is_retry=True)
+
+    def record_attempt(response: Optional[tuple] = None, **kwargs) -> None:
+        # called after each attempt, with no response on e.g. a connection error or timeout
+        if response is None:
+            resilience.after_attempt(status_code=None, error_code=None)
+            return
+        http_response, parsed = response
+        resilience.after_attempt(http_response.status_code, parsed.get("Error", {}).get("Code"))
+
+    events = s3_client.meta.events
+    events.register("before-call.s3", start_call)
+    events.register("request-created.s3", start_retry)
+    events.register("needs-retry.s3", record_attempt)
+
+
+class RequestDeadlineMiddleware:
+    """Pure ASGI middleware giving the S3 calls of a request sent with `X-Request-Timeout` a deadline."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._header_name = REQUEST_TIMEOUT_HEADER.lower().encode("latin-1")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        timeout_seconds = self._timeout_seconds(scope) if scope["type"] == "http" else None
+        if timeout_seconds is None:
+            await self.app(scope, receive, send)
+            return
+        token = _request_deadline.set(time.monotonic() + timeout_seconds)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_deadline.reset(token)
+
+    def _timeout_seconds(self, scope: Scope) -> Optional[float]:
+        for name, value in scope["headers"]:
+            if name == self._header_name:
+                try:
+                    timeout_seconds = float(value)
+                except ValueError:
+                    return None
+                return timeout_seconds if math.isfinite(timeout_seconds) and timeout_seconds >= 0 else None
+        return None
@@ -1,46 +1,178 @@
+import asyncio
+import contextlib
 import os
+from datetime import datetime
+from typing import (
+    List,
+    Optional,
+)
+from urllib.parse import quote
 
 from botocore.exceptions import ClientError
 from fastapi import (
     APIRouter,
     Depends,
     FastAPI,
+    Form,
     HTTPException,
+    Query,
     Request,
     Response,
     UploadFile,
     status,
 )
-from fastapi.responses import StreamingResponse
+from fastapi.responses import (
+    FileResponse,
+    RedirectResponse,
+    StreamingResponse,
+)
+from starlette.background import BackgroundTask
 
+from files_api.archives import (
+    archive_base_path,
+    archive_filename,
+    iter_directory_objects,
+    stream_zip_archive,
+)
+from files_api.batch_operations import (
+    delete_s3_objects_in_batches,
+    iter_directory_key_batches,
+    iter_key_batches,
+    lookup_files_metadata,
+    store_uploaded_files,
+)
+from files_api.dependencies import (
+    get_dedup_index,
+    get_disk_cache,
+    get_listing_index,
+    get_metadata_cache,
+    get_metrics,
+    get_profile_store,
+    get_s3_client,
+    get_s3_executor,
+    get_s3_resilience,
+    get_single_flight,
+)
+from files_api.http_headers import (
+    accepts_encoding,
+    is_not_modified,
+    negotiate_media_type,
+    not_modified_headers,
+    parse_http_date,
+    parse_if_none_match,
+    parse_range_header,
+    validator_headers,
+)
+from files_api.compression import (
+    GZIP_CONTENT_ENCODING,
+    gunzip_chunks,
+)
+from files_api.dedup import DedupIndex
+from files_api.disk_cache import (
+    CachedBody,
+    DiskCache,
+)
+from files_api.listing_index import (
+    ListingIndex,
+    decode_page_token,
+    encode_page_token,
+)
+from files_api.listings import (
+    decode_directory_page_token,
+    decode_objects_page_token,
+    encode_directory_page_token,
+    encode_objects_page_token,
+    iter_directory_pages,
+)
+from files_api.metadata_cache import (
+    MISSING_OBJECT,
+    MetadataCache,
+    ObjectMetadata,
+    lookup_object_metadata,
+    uncompressed_size,
+)
+from files_api.metrics import (
+    PROMETHEUS_CONTENT_TYPE,
+    Metrics,
+    read_snapshots,
+)
+from files_api.presigned import (
+    complete_presigned_upload,
+    presign_upload,
+)
+from files_api.profiling import (
+    ProfiledAPIRoute,
+    ProfileStore,
+)
+from files_api.resilience import S3Resilience
 from files_api.s3.delete_objects import delete_s3_object
+from files_api.s3.executor import S3Executor
 from files_api.s3.read_objects import (
+    INVALID_RANGE_ERROR_CODE,
+    NO_SUCH_KEY_ERROR_CODE,
+    NOT_MODIFIED_ERROR_CODE,
+    fetch_s3_directory_page,
     fetch_s3_object,
     fetch_s3_objects_metadata,
     fetch_s3_objects_using_page_token,
-    object_exists_in_s3,
+    generate_presigned_get_url,
+)
+from files_api.s3.write_objects import (
+    INVALID_PARTS_ERROR_CODES,
+    NO_SUCH_UPLOAD_ERROR_CODE,
+    abort_multipart_upload,
 )
-from files_api.s3.write_objects import upload_s3_object
 from files_api.schemas import *
+from files_api.serialization import (
+    RESPONSE_MEDIA_TYPES,
+    batch_head_response,
+    file_metadata_dicts,
+    get_files_response,
+    ndjson_lines,
+)
 from files_api.settings import Settings
+from files_api.single_flight import (
+    SingleFlight,
+    fetch_s3_object_coalesced,
+)
+from files_api.uploads import store_uploaded_file
+
+try:
+    from mypy_boto3_s3 import S3Client
+except ImportError:
+    ...
 
 ##################
 # --- Routes --- #
 ##################
 
-ROUTER = APIRouter()
+ROUTER = APIRouter(route_class=ProfiledAPIRoute)
 
 
 
 @ROUTER.put("/files/{file_path:path}")
-async def upload_file(request: Request, file_path: str, file: UploadFile, response: Response) -> PutFileResponse:
+async def upload_file(
+    request: Request,
+    file_path: str,
+    file: UploadFile,
+    response: Response,
+    s3_client: "S3Client" = Depends(get_s3_client),  # noqa: B008
+    s3_executor: S3Executor = Depends(get_s3_executor),  # noqa: B008
+    metadata_cache: MetadataCache = Depends(get_metadata_cache),  # noqa: B008
+    listing_index: Optional[ListingIndex] = Depends(get_listing_index),  # noqa: B008
+    dedup_index: Optional[DedupIndex] = Depends(get_dedup_index),  # noqa: B008
+) -> PutFileResponse:
     """Upload a file."""
     settings: Settings = request.app.state.settings
-    s3_bucket_name = settings.s3_bucket_name
-    # Check if the file already exists in S3
-    object_already_exists = object_exists_in_s3(
-        bucket_name=s3_bucket_name,
-        object_key=file_path,
+    object_already_exists = await store_uploaded_file(
+        file=file,
+        file_path=file_path,
+        settings=settings,
+        s3_client=s3_client,
+        s3_executor=s3_executor,
+        metadata_cache=metadata_cache,
+        listing_index=listing_index,
+        dedup_index=dedup_index,
     )
     if object_already_exists:
         response_message = f"Existing file updated at path: /{file_path}"
@@ -50,15 +182,6 @@ async def upload_file(request: Request, file_path: str, file: UploadFile, respon
         response_message = f"New file uploaded at path: /{file_path}"
         response.status_code = status.HTTP_201_CREATED
 
-    # Read the file contents and upload to S3
-    file_contents = await file.read()
-    upload_s3_object(
-        bucket_name=s3_bucket_name,
-        object_key=file_path,
-        file_content=file_contents,
-        content_type=file.content_type,
-    )
-
     return PutFileResponse(
         file_path=file_path,
         message=response_message,
@@ -66,81 +189,466 @@ async def upload_file(request: Request, file_path: str, file: UploadFile, respon
 
 
 
+@ROUTER.post("/files:batchUpload")
+async def batch_upload_files(
+    request: Request,
+    files: List[UploadFile],
+    file_paths: List[str] = Form(...),  # noqa: B008
+    s3_client: "S3Client" = Depends(get_s3_client),  # noqa: B008
+    s3_executor: S3Executor = Depends(get_s3_executor),  # noqa: B008
+    metadata_cache: MetadataCache = Depends(get_metadata_cache),  # noqa: B008
+    listing_index: Optional[ListingIndex] = Depends(get_listing_index),  # noqa: B008
+    dedup_index: Optional[DedupIndex] = Depends(get_dedup_index),  # noqa: B008
+) -> BatchPutFilesResponse:
+    """Upload many files in one request.
+
+    The i-th file is stored at the i-th path of `file_paths`. Files are uploaded concurrently, and the
+    result of each upload is reported in the same order, so one failed upload does not fail the others.
+    """
+    if len(files) != len(file_paths):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="files and file_paths must have the same number of items",
+        )
+    if len(set(file_paths)) != len(file_paths):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="file_paths must be unique")
+
+    settings: Settings = request.app.state.settings
+    return await store_uploaded_files(
+        uploads=list(zip(file_paths, files)),
+        settings=settings,
+        s3_client=s3_client,
+        s3_executor=s3_executor,
+        metadata_cache=metadata_cache,
+        listing_index=listing_index,
+        max_concurrency=settings.batch_max_concurrency,
+        dedup_index=dedup_index,
+    )
+
+
+@ROUTER.post("/files:presignUpload")
+async def presign_file_upload(
+    request: Request,
+    presign_request: PresignUploadRequest,
+    s3_client: "S3Client" = Depends(get_s3_client),  # noqa: B008
+    s3_executor: S3Executor = Depends(get_s3_executor),  # noqa: B008
+) -> PresignUploadResponse:
+    """Issue presigned URLs to upload a file straight to S3, without sending its content through the API.
+
+    A file that fits in one part is uploaded with a single PUT to the only URL returned. Larger files are
+    uploaded in parts, each one PUT to its own URL. Either way, the upload is finished with
+    `POST /files:completeUpload`. Uploads made this way are neither deduplicated nor compressed.
+    """
+    settings: Settings = request.app.state.settings
+    return await presign_upload(
+        file_path=presign_request.file_path,
+        size_bytes=presign_request.size_bytes,
+        content_type=presign_request.content_type,
+        settings=settings,
+        s3_client=s3_client,
+        s3_executor=s3_executor,
+    )
+
+
+@ROUTER.post("/files:completeUpload")
+async def complete_file_upload(
+    request: Request,
+    complete_request: CompleteUploadRequest,
+    s3_client: "S3Client" = Depends(get_s3_client),  # noqa: B008
+    s3_executor: S3Executor = Depends(get_s3_executor),  # noqa: B008
+    metadata_cache: MetadataCache = Depends(get_metadata_cache),  # noqa: B008
+    listing_index: Optional[ListingIndex] = Depends(get_listing_index),  # noqa: B008
+) -> PutFileResponse:
+    """Finish an upload made with the URLs issued by `POST /files:presignUpload`.
+
+    Multipart uploads are assembled from the ETags S3 answered the PUT of each part with.
+    """
+    settings: Settings = request.app.state.settings
+    file_path = complete_request.file_path
+    try:
+        object_metadata = await complete_presigned_upload(
+            file_path=file_path,
+            upload_id=complete_request.upload_id,
+            part_etags=complete_request.part_etags,
+            settings=settings,
+            s3_client=s3_client,
+            s3_executor=s3_executor,
+            metadata_cache=metadata_cache,
+            listing_index=listing_index,
+        )
+    except ClientError as err:
+        error_code = err.response.get("Error", {}).get("Code")
+        if error_code == NO_SUCH_UPLOAD_ERROR_CODE:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found") from err
+        if error_code in INVALID_PARTS_ERROR_CODES:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid upload parts") from err
+        raise
+    # A single PUT that was never sent leaves nothing to complete
+    if not object_metadata.exists:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+    return PutFileResponse(file_path=file_path, message=f"File uploaded at path: /{file_path}")
+
+
+@ROUTER.post("/files:abortUpload", status_code=status.HTTP_204_NO_CONTENT)
+async def abort_file_upload(
+    request: Request,
+    abort_request: AbortUploadRequest,
+    s3_client: "S3Client" = Depends(get_s3_client),  # noqa: B008
+    s3_executor: S3Executor = Depends(get_s3_executor),  # noqa: B008
+) -> Response:
+    """Abort a multipart upload issued by `POST /files:presignUpload`, so S3 discards its uploaded parts."""
+    settings: Settings = request.app.state.settings
+    try:
+        await s3_executor.run(
+            abort_multipart_upload,
+            bucket_name=settings.s3_bucket_name,
+            object_key=abort_request.file_path,
+            upload_id=abort_request.upload_id,
+            s3_client=s3_client,
+        )
+    except ClientError as err:
+        if err.response.get("Error", {}).get("Code") == NO_SUCH_UPLOAD_ERROR_CODE:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found") from err
+        raise
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
 @ROUTER.get("/files")
 async def list_files(
     request: Request,  
     query_params: GetFilesQueryParams = Depends(),  # noqa: B008
+    s3_client: "S3Client" = Depends(get_s3_client),  # noqa: B008
+    s3_executor: S3Executor = Depends(get_s3_executor),  # noqa: B008
+    listing_index: Optional[ListingIndex] = Depends(get_listing_index),  # noqa: B008
 ) -> GetFilesResponse:
-    """List files with pagination."""
+    """
+    List files with pagination.
+
+    The page is sent as JSON, or as CSV or MessagePack (if installed) when the `Accept` header prefers them.
+    """
     settings: Settings = request.app.state.settings
+    media_type = negotiate_media_type(request.headers.get("Accept"), RESPONSE_MEDIA_TYPES)
+    if media_type is None:
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail="Not acceptable")
     s3_bucket_name = settings.s3_bucket_name
-    # Validate page size
     if query_params.page_token:
-        # If a page token is provided, fetch the next page of files
-        files, next_page_token = fetch_s3_objects_using_page_token(
+        # Page tokens of non-recursive listings encode the prefix and the S3 continuation token of the next page
+        directory_page_position = decode_directory_page_token(query_params.page_token)
+        # Page tokens issued by the listing index encode the prefix and the key the next page starts after
+        page_position = decode_page_token(query_params.page_token)
+    else:
+        directory_page_position = None if query_params.recursive else (query_params.directory or "", None)
+        page_position = (query_params.directory or "", None)
+
+    directories: list[str] = []
+    if directory_page_position is not None:
+        # List a single level of the tree: S3 rolls the keys of each subdirectory up into one entry
+        prefix, continuation_token = directory_page_position
+        files, directories, next_continuation_token = await s3_executor.run(
+            fetch_s3_directory_page,
             bucket_name=s3_bucket_name,
-            continuation_token=query_params.page_token,
+            prefix=prefix,
             max_keys=query_params.page_size,
+            s3_client=s3_client,
+            continuation_token=continuation_token,
+        )
+        next_page_token = (
+            encode_directory_page_token(prefix, next_continuation_token) if next_continuation_token else None
+        )
+    elif page_position is not None and listing_index is not None and listing_index.ready:
+        # Answer from the in-memory index, without calling S3
+        prefix, start_after = page_position
+        files, next_start_after = listing_index.list_page(
+            prefix=prefix,
+            start_after=start_after,
+            max_keys=query_params.page_size,
+        )
+        next_page_token = encode_page_token(prefix, next_start_after) if next_start_after else None
+    elif page_position is not None:
+        # If no S3 page token is provided, fetch the first page of files (or the page an index token points to)
+        prefix, start_after = page_position
+        files, next_continuation_token = await s3_executor.run(
+            fetch_s3_objects_metadata,
+            bucket_name=s3_bucket_name,
+            prefix=prefix,
+            max_keys=query_params.page_size,
+            s3_client=s3_client,
+            start_after=start_after,
+        )
+        next_page_token = (
+            encode_objects_page_token(prefix, next_continuation_token) if next_continuation_token else None
         )
     else:
-        # If no page token is provided, fetch the first page of files
-        files, next_page_token = fetch_s3_objects_metadata(
+        # If an S3 page token is provided, fetch the next page of files, under the prefix the token was issued for
+        # Bare S3 continuation tokens, issued before page tokens kept the prefix, are still followed
+        page_token_position = decode_objects_page_token(query_params.page_token)
+        prefix, continuation_token = page_token_position or ("", query_params.page_token)
+        files, next_continuation_token = await s3_executor.run(
+            fetch_s3_objects_using_page_token,
             bucket_name=s3_bucket_name,
-            prefix=query_params.directory,
+            continuation_token=continuation_token,
             max_keys=query_params.page_size,
+            s3_client=s3_client,
+            prefix=prefix,
         )
-
-    # Convert the list of files to FileMetadata objects
-    file_metadata_objs = [
-        FileMetadata(
-            file_path=f"{item['Key']}",
-            last_modified=item["LastModified"],
-            size_bytes=item["Size"],
+        next_page_token = (
+            encode_objects_page_token(prefix, next_continuation_token) if next_continuation_token else None
         )
-        for item in files
-    ]
 
-    return GetFilesResponse(
-        files=file_metadata_objs, 
-        next_page_token=next_page_token if next_page_token else None
+    # Serialize the page in one pass, without building a FileMetadata model per file
+    return get_files_response(
+        files=file_metadata_dicts(files),
+        next_page_token=next_page_token if next_page_token else None,
+        media_type=media_type,
+        directories=directories,
+    )
+
+
+@ROUTER.get("/files:stream")
+async def stream_files(
+    request: Request,
+    directory: str = Query(default="", description="Only stream the files under this directory."),
+    s3_client: "S3Client" = Depends(get_s3_client),  # noqa: B008
+    s3_executor: S3Executor = Depends(get_s3_executor),  # noqa: B008
+) -> StreamingResponse:
+    """
+    Stream the metadata of every file under a directory as newline-delimited JSON, one file per line.
+
+    Unlike `GET /files`, the whole directory is listed in a single response: S3 is listed 1000 keys at a
+    time, fetching the next page while the current one is sent.
+    """
+    settings: Settings = request.app.state.settings
+
+    async def iter_lines():
+        pages = iter_directory_pages(
+            bucket_name=settings.s3_bucket_name,
+            prefix=directory,
+            s3_client=s3_client,
+            s3_executor=s3_executor,
+            prefetch=True,
         )
+        async with contextlib.aclosing(pages):
+            async for files in pages:
+                yield ndjson_lines(file_metadata_dicts(files))
+
+    return StreamingResponse(iter_lines(), media_type="application/x-ndjson")
 
 
 @ROUTER.get("/files/{file_path:path}")
 async def get_file(
     request: Request,
     file_path: str,
-) -> StreamingResponse:
-    """Retrieve a file."""
+    presigned: Optional[bool] = None,
+    s3_client: "S3Client" = Depends(get_s3_client),  # noqa: B008
+    s3_executor: S3Executor = Depends(get_s3_executor),  # noqa: B008
+    metadata_cache: MetadataCache = Depends(get_metadata_cache),  # noqa: B008
+    disk_cache: Optional[DiskCache] = Depends(get_disk_cache),  # noqa: B008
+    single_flight: Optional[SingleFlight] = Depends(get_single_flight),  # noqa: B008
+) -> Response:
+    """Retrieve a file.
+
+    With `presigned=true`, or `presigned_downloads_enabled` in the settings, the API only checks that the
+    file exists, then redirects the client to a short-lived presigned S3 URL to download it from.
+    """
 
     # Get the S3 bucket name from the settings
     settings: Settings = request.app.state.settings
     s3_bucket_name = settings.s3_bucket_name
 
-    # Check if the file exists in S3
-    object_exists = object_exists_in_s3(
-        bucket_name=s3_bucket_name,
-        object_key=file_path,
-    )
-    if not object_exists:
+    # Cached metadata can answer without calling S3 at all
+    if_none_match = parse_if_none_match(request.headers.get("If-None-Match"))
+    # If-Modified-Since must be ignored when If-None-Match is present (RFC 9110)
+    if_modified_since = None if if_none_match else parse_http_date(request.headers.get("If-Modified-Since"))
+    object_metadata = metadata_cache.get(s3_bucket_name, file_path)
+    if object_metadata is not None and not object_metadata.exists:
+        # The file may have been uploaded through another worker since, so only S3 can tell GET it does not exist
+        metadata_cache.invalidate(s3_bucket_name, file_path)
+        object_metadata = None
+    redirect_to_s3 = settings.presigned_downloads_enabled if presigned is None else presigned
+    if object_metadata is None and redirect_to_s3:
+        # No URL is handed out for a file that does not exist
+        object_metadata = await lookup_object_metadata(
+            bucket_name=s3_bucket_name,
+            object_key=file_path,
+            s3_client=s3_client,
+            s3_executor=s3_executor,
+            metadata_cache=metadata_cache,
+            single_flight=single_flight,
+        )
+    if object_metadata is not None and not object_metadata.exists:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+    # An unchanged file does not need to be downloaded again
+    if object_metadata is not None and is_not_modified(
+        object_metadata.etag, object_metadata.last_modified, if_none_match, if_modified_since
+    ):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers=validator_headers(object_metadata.etag, object_metadata.last_modified),
+        )
+    # S3 sends files stored gzipped as they are, so clients not accepting gzip still download them through the API
+    if redirect_to_s3 and (
+        object_metadata.content_encoding != GZIP_CONTENT_ENCODING
+        or accepts_encoding(request.headers.get("Accept-Encoding"), GZIP_CONTENT_ENCODING)
+    ):
+        # The client sends its Range and conditional headers again to S3, which evaluates them
+        presigned_url = generate_presigned_get_url(
+            bucket_name=s3_bucket_name,
+            object_key=file_path,
+            expires_in_seconds=settings.presigned_url_expiration_seconds,
+            s3_client=s3_client,
+        )
+        # The URL expires, so the redirect must not be cached
+        return RedirectResponse(
+            presigned_url, status_code=status.HTTP_307_TEMPORARY_REDIRECT, headers={"Cache-Control": "no-store"}
+        )
 
-    # Fetch the file from S3
+    # Fetch the file from S3, or only the requested byte range of it
     # Note: file_path is the full path in S3, including any directories
-    get_object_response = fetch_s3_object(s3_bucket_name, object_key=file_path)
-
+    # A single get_object call both checks that the file exists and fetches it, and S3 evaluates the conditional headers
+    byte_range = parse_range_header(request.headers.get("Range"))
+    # What S3 answers is not cached if the file is written in the meantime
+    cache_generation = metadata_cache.generation(s3_bucket_name, file_path)
+    # A copy of the file on local disk is served instead, as long as it is still the current version
+    cached_body = disk_cache.acquire(s3_bucket_name, file_path) if disk_cache is not None else None
+    try:
+        if cached_body is not None and object_metadata is not None and object_metadata.etag == cached_body.etag:
+            return cached_body_response(disk_cache, cached_body, if_none_match, if_modified_since)
+        if single_flight is not None and cached_body is None and not if_none_match and if_modified_since is None:
+            # Concurrent downloads of the same file share one get_object call, and its body if the file is small
+            get_object_response = await fetch_s3_object_coalesced(
+                s3_bucket_name,
+                object_key=file_path,
+                s3_client=s3_client,
+                s3_executor=s3_executor,
+                single_flight=single_flight,
+                max_shared_body_bytes=settings.single_flight_max_body_bytes,
+                byte_range=byte_range,
+            )
+        else:
+            get_object_response = await s3_executor.run(
+                fetch_s3_object,
+                s3_bucket_name,
+                object_key=file_path,
+                s3_client=s3_client,
+                byte_range=byte_range,
+                # With a copy on disk, S3 is asked whether it changed, and the client's conditions are evaluated here
+                if_none_match=(
+                    cached_body.etag if cached_body else (if_none_match[0] if len(if_none_match) == 1 else None)
+                ),
+                if_modified_since=None if cached_body else if_modified_since,
+            )
+    except ClientError as err:
+        error = err.response.get("Error", {})
+        if error.get("Code") == NOT_MODIFIED_ERROR_CODE and cached_body is not None:
+            return cached_body_response(disk_cache, cached_body, if_none_match, if_modified_since)
+        if error.get("Code") == NOT_MODIFIED_ERROR_CODE:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=not_modified_headers(err.response))
+        if error.get("Code") == NO_SUCH_KEY_ERROR_CODE:
+            metadata_cache.put(s3_bucket_name, file_path, MISSING_OBJECT, generation=cache_generation)
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found") from err
+        if error.get("Code") != INVALID_RANGE_ERROR_CODE:
+            raise
+        # Tell the client how large the file is so it can pick a satisfiable range
+        object_size = error.get("ActualObjectSize")
+        raise HTTPException(
+            status_code=status.HTTP_416_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{object_size}"} if object_size else None,
+        ) from err
+    finally:
+        if cached_body is not None:
+            disk_cache.release(cached_body)
+
+    metadata_cache.put(
+        s3_bucket_name,
+        file_path,
+        ObjectMetadata.from_get_object_response(get_object_response),
+        generation=cache_generation,
+    )
+    headers = validator_headers(get_object_response.get("ETag"), get_object_response.get("LastModified"))
+    # S3 only evaluates a single entity tag, so lists of tags (and conditions not sent to S3) are checked here
+    if is_not_modified(
+        get_object_response.get("ETag"), get_object_response.get("LastModified"), if_none_match, if_modified_since
+    ):
+        get_object_response["Body"].close()
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    # Files stored gzipped are sent as they are to clients accepting gzip, and decompressed for the others
+    content_encoding = get_object_response.get("ContentEncoding")
+    if content_encoding is not None:
+        headers["Vary"] = "Accept-Encoding"
+    if content_encoding == GZIP_CONTENT_ENCODING and not accepts_encoding(
+        request.headers.get("Accept-Encoding"), GZIP_CONTENT_ENCODING
+    ):
+        if "ContentRange" in get_object_response:
+            # A range of the compressed content means nothing to this client, which gets the whole file instead
+            get_object_response["Body"].close()
+            get_object_response = await s3_executor.run(
+                fetch_s3_object,
+                s3_bucket_name,
+                object_key=file_path,
+                s3_client=s3_client,
+            )
+        # The decompressed file is another representation, which only shares a weak entity tag with the stored one
+        if "ETag" in headers:
+            headers["ETag"] = f"W/{headers['ETag']}"
+        if (size_bytes := uncompressed_size(get_object_response)) is not None:
+            headers["Content-Length"] = str(size_bytes)
+        return StreamingResponse(
+            content=gunzip_chunks(s3_executor.iter_body(get_object_response["Body"])),
+            media_type=get_object_response["ContentType"],
+            headers=headers,
+        )
+    if content_encoding is not None:
+        headers["Content-Encoding"] = content_encoding
+
+    headers["Accept-Ranges"] = "bytes"
+    headers["Content-Length"] = str(get_object_response["ContentLength"])
+    status_code = status.HTTP_200_OK
+    if "ContentRange" in get_object_response:
+        headers["Content-Range"] = get_object_response["ContentRange"]
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+
+    content = s3_executor.iter_body(get_object_response["Body"])
+    # Only identity-encoded files are cached on disk, since disk hits are sent as they are stored
+    if (
+        disk_cache is not None
+        and status_code == status.HTTP_200_OK
+        and content_encoding is None
+        and disk_cache.accepts(get_object_response["ContentLength"])
+    ):
+        # Keep a copy of the whole file on disk while sending it
+        content = disk_cache.fill(
+            content,
+            bucket_name=s3_bucket_name,
+            object_key=file_path,
+            etag=get_object_response["ETag"],
+            size_bytes=get_object_response["ContentLength"],
+            content_type=get_object_response["ContentType"],
+            last_modified=get_object_response["LastModified"],
+        )
 
     # Return the file as a streaming response
     # This allows large files to be sent efficiently without loading them fully into memory
     # The StreamingResponse will automatically set the Content-Type header based on the file's MIME type
     return StreamingResponse(
-        content=get_object_response["Body"],
+        content=content,
+        status_code=status_code,
         media_type=get_object_response["ContentType"],
+        headers=headers,
     )
 
 
 @ROUTER.head("/files/{file_path:path}")
-async def get_file_metadata(request: Request, file_path: str, response: Response) -> Response:
+async def get_file_metadata(
+    request: Request,
+    file_path: str,
+    response: Response,
+    s3_client: "S3Client" = Depends(get_s3_client),  # noqa: B008
+    s3_executor: S3Executor = Depends(get_s3_executor),  # noqa: B008
+    metadata_cache: MetadataCache = Depends(get_metadata_cache),  # noqa: B008
+    single_flight: Optional[SingleFlight] = Depends(get_single_flight),  # noqa: B008
+) -> Response:
     """Retrieve file metadata.
 
     Note: by convention, HEAD requests MUST NOT return a body in the response.
@@ -150,24 +658,49 @@ async def get_file_metadata(request: Request, file_path: str, response: Response
     settings: Settings = request.app.state.settings
     s3_bucket_name = settings.s3_bucket_name
 
-    object_exists = object_exists_in_s3(
+    # Fetch the file metadata, from the metadata cache if possible
+    object_metadata = await lookup_object_metadata(
         bucket_name=s3_bucket_name,
         object_key=file_path,
+        s3_client=s3_client,
+        s3_executor=s3_executor,
+        metadata_cache=metadata_cache,
+        single_flight=single_flight,
     )
-    if not object_exists:
+    if not object_metadata.exists:
         # For HEAD requests, we should not return a JSON body even for errors
         # Just set the status code and return an empty response
         response.status_code = status.HTTP_404_NOT_FOUND
-        return response 
-
-    # Check if the file exists in S3
-    # Fetch the file metadata from S3
-    get_object_response = fetch_s3_object(s3_bucket_name, object_key=file_path)
+        return response
 
     # Set the response headers based on the S3 object metadata
-    response.headers["Content-Type"] = get_object_response["ContentType"]
-    response.headers["Content-Length"] = str(get_object_response["ContentLength"])
-    response.headers["Last-Modified"] = get_object_response["LastModified"].strftime("%a, %d %b %Y %H:%M:%S GMT")
+    response.headers.update(validator_headers(object_metadata.etag, object_metadata.last_modified))
+
+    # Evaluate the conditional headers against the metadata
+    # If-Modified-Since must be ignored when If-None-Match is present (RFC 9110)
+    if_none_match = parse_if_none_match(request.headers.get("If-None-Match"))
+    if_modified_since = None if if_none_match else parse_http_date(request.headers.get("If-Modified-Since"))
+    if is_not_modified(object_metadata.etag, object_metadata.last_modified, if_none_match, if_modified_since):
+        response.status_code = status.HTTP_304_NOT_MODIFIED
+        return response
+
+    response.headers["Content-Type"] = object_metadata.content_type
+    # Describe the representation a GET request with the same Accept-Encoding would return
+    content_encoding = object_metadata.content_encoding
+    if content_encoding is not None:
+        response.headers["Vary"] = "Accept-Encoding"
+    if content_encoding == GZIP_CONTENT_ENCODING and not accepts_encoding(
+        request.headers.get("Accept-Encoding"), GZIP_CONTENT_ENCODING
+    ):
+        if object_metadata.etag:
+            response.headers["ETag"] = f"W/{object_metadata.etag}"
+        if object_metadata.uncompressed_size_bytes is not None:
+            response.headers["Content-Length"] = str(object_metadata.uncompressed_size_bytes)
+    else:
+        if content_encoding is not None:
+            response.headers["Content-Encoding"] = content_encoding
+        response.headers["Content-Length"] = str(object_metadata.size_bytes)
+        response.headers["Accept-Ranges"] = "bytes"
 
     # Set the status code to 200 OK
     # HEAD requests do not return a body, so we just set the status code and headers
@@ -176,11 +709,43 @@ async def get_file_metadata(request: Request, file_path: str, response: Response
     return response
 
 
+@ROUTER.post("/files:batchHead")
+async def batch_get_files_metadata(
+    request: Request,
+    batch_head_request: BatchHeadRequest,
+    s3_client: "S3Client" = Depends(get_s3_client),  # noqa: B008
+    s3_executor: S3Executor = Depends(get_s3_executor),  # noqa: B008
+    metadata_cache: MetadataCache = Depends(get_metadata_cache),  # noqa: B008
+) -> BatchHeadResponse:
+    """Retrieve the metadata of many files in one request.
+
+    Files are looked up concurrently and reported in the order of `file_paths`, including the ones that do not exist.
+    The results are sent as JSON, or as CSV or MessagePack (if installed) when the `Accept` header prefers them.
+    """
+    settings: Settings = request.app.state.settings
+    media_type = negotiate_media_type(request.headers.get("Accept"), RESPONSE_MEDIA_TYPES)
+    if media_type is None:
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail="Not acceptable")
+    files = await lookup_files_metadata(
+        file_paths=batch_head_request.file_paths,
+        bucket_name=settings.s3_bucket_name,
+        s3_client=s3_client,
+        s3_executor=s3_executor,
+        metadata_cache=metadata_cache,
+        max_concurrency=settings.batch_max_concurrency,
+    )
+    return batch_head_response(files, media_type=media_type)
+
+
 @ROUTER.delete("/files/{file_path:path}")
 async def delete_file(
     request: Request,
     file_path: str,
     response: Response,
+    s3_client: "S3Client" = Depends(get_s3_client),  # noqa: B008
+    s3_executor: S3Executor = Depends(get_s3_executor),  # noqa: B008
+    metadata_cache: MetadataCache = Depends(get_metadata_cache),  # noqa: B008
+    listing_index: Optional[ListingIndex] = Depends(get_listing_index),  # noqa: B008
 ) -> Response:
     """Delete a file.
 
@@ -190,19 +755,27 @@ async def delete_file(
     s3_bucket_name = settings.s3_bucket_name
 
     # Check if the file exists in S3
-    object_exists = object_exists_in_s3(
+    object_metadata = await lookup_object_metadata(
         bucket_name=s3_bucket_name,
         object_key=file_path,
+        s3_client=s3_client,
+        s3_executor=s3_executor,
+        metadata_cache=metadata_cache,
     )
-    if not object_exists:
+    if not object_metadata.exists:
         # For DELETE requests, we should not return a JSON body even for errors
         # Just set the status code and return an empty response
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found") 
 
-    delete_s3_object(
+    await s3_executor.run(
+        delete_s3_object,
         bucket_name=s3_bucket_name,
         object_key=file_path,
+        s3_client=s3_client,
     )
+    metadata_cache.put(s3_bucket_name, file_path, MISSING_OBJECT)
+    if listing_index is not None:
+        listing_index.remove(file_path)
     # Set the response status code to 204 No Content
     # This indicates that the request was successful and there is no content to return
     response.status_code = status.HTTP_204_NO_CONTENT
@@ -210,3 +783,191 @@ async def delete_file(
     return response
 
 
+@ROUTER.get("/stats")
+async def get_stats(
+    metadata_cache: MetadataCache = Depends(get_metadata_cache),  # noqa: B008
+    listing_index: Optional[ListingIndex] = Depends(get_listing_index),  # noqa: B008
+    disk_cache: Optional[DiskCache] = Depends(get_disk_cache),  # noqa: B008
+    dedup_index: Optional[DedupIndex] = Depends(get_dedup_index),  # noqa: B008
+    s3_resilience: S3Resilience = Depends(get_s3_resilience),  # noqa: B008
+    single_flight: Optional[SingleFlight] = Depends(get_single_flight),  # noqa: B008
+) -> dict:
+    """Report the counters of the in-process caches and indexes, the S3 protections and the coalesced S3 reads."""
+    return {
+        "metadata_cache": metadata_cache.stats(),
+        "listing_index": listing_index.stats() if listing_index is not None else None,
+        "disk_cache": disk_cache.stats() if disk_cache is not None else None,
+        "dedup": dedup_index.stats() if dedup_index is not None else None,
+        "s3_resilience": s3_resilience.stats(),
+        "single_flight": single_flight.stats() if single_flight is not None else None,
+    }
+
+
+@ROUTER.get("/metrics")
+async def export_metrics(
+    request: Request,
+    metrics: Metrics = Depends(get_metrics),  # noqa: B008
+) -> Response:
+    """Expose request and S3 call metrics in the Prometheus text format, merged across workers if configured."""
+    settings: Settings = request.app.state.settings
+    snapshots = []
+    if settings.metrics_multiprocess_dir:
+        snapshots = await asyncio.to_thread(read_snapshots, settings.metrics_multiprocess_dir)
+    return Response(content=metrics.render(snapshots), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@ROUTER.get("/debug/profiles")
+async def list_profiles(
+    profile_store: Optional[ProfileStore] = Depends(get_profile_store),  # noqa: B008
+) -> dict:
+    """List the most recent request profiles, most recent first."""
+    if profile_store is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profiling is disabled")
+    return {"profiles": [profile.to_dict() for profile in profile_store.recent()]}
+
+
+@ROUTER.get("/debug/profiles/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    profile_store: Optional[ProfileStore] = Depends(get_profile_store),  # noqa: B008
+) -> dict:
+    """Return the profile of a request, by the id sent back in its `X-Profile-Id` header."""
+    profile = profile_store.get(profile_id) if profile_store is not None else None
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return profile.to_dict()
+
+
+@ROUTER.delete("/files")
+async def delete_directory(
+    request: Request,
+    directory: str = Query(..., min_length=1),  # noqa: B008
+    s3_client: "S3Client" = Depends(get_s3_client),  # noqa: B008
+    s3_executor: S3Executor = Depends(get_s3_executor),  # noqa: B008
+    metadata_cache: MetadataCache = Depends(get_metadata_cache),  # noqa: B008
+    listing_index: Optional[ListingIndex] = Depends(get_listing_index),  # noqa: B008
+) -> BatchDeleteResponse:
+    """Delete every file under a directory, with batched DeleteObjects calls.
+
+    Unlike deleting a single file, the response has a body: it reports the files that could not be deleted.
+    """
+    settings: Settings = request.app.state.settings
+    s3_bucket_name = settings.s3_bucket_name
+    # without the trailing slash, the prefix would also match sibling directories, e.g. "ab/" for "a"
+    directory_prefix = directory if directory.endswith("/") else f"{directory}/"
+
+    # List and delete the directory one page of (at most 1000) keys at a time, so memory stays flat
+    return await delete_s3_objects_in_batches(
+        key_batches=iter_directory_key_batches(
+            bucket_name=s3_bucket_name,
+            prefix=directory_prefix,
+            s3_client=s3_client,
+            s3_executor=s3_executor,
+        ),
+        bucket_name=s3_bucket_name,
+        s3_client=s3_client,
+        s3_executor=s3_executor,
+        max_concurrency=settings.batch_max_concurrency,
+        on_deleted=lambda deleted_keys: forget_deleted_files(deleted_keys, s3_bucket_name, metadata_cache, listing_index),
+    )
+
+
+@ROUTER.post("/files:batchDelete")
+async def batch_delete_files(
+    request: Request,
+    batch_delete_request: BatchDeleteRequest,
+    s3_client: "S3Client" = Depends(get_s3_client),  # noqa: B008
+    s3_executor: S3Executor = Depends(get_s3_executor),  # noqa: B008
+    metadata_cache: MetadataCache = Depends(get_metadata_cache),  # noqa: B008
+    listing_index: Optional[ListingIndex] = Depends(get_listing_index),  # noqa: B008
+) -> BatchDeleteResponse:
+    """Delete many files at once, with batched DeleteObjects calls.
+
+    Files that do not exist are reported as deleted, like S3 does.
+    """
+    settings: Settings = request.app.state.settings
+    s3_bucket_name = settings.s3_bucket_name
+
+    return await delete_s3_objects_in_batches(
+        key_batches=iter_key_batches(batch_delete_request.file_paths),
+        bucket_name=s3_bucket_name,
+        s3_client=s3_client,
+        s3_executor=s3_executor,
+        max_concurrency=settings.batch_max_concurrency,
+        on_deleted=lambda deleted_keys: forget_deleted_files(deleted_keys, s3_bucket_name, metadata_cache, listing_index),
+    )
+
+
+@ROUTER.get("/archive")
+async def download_directory_archive(
+    request: Request,
+    directory: str = Query(..., min_length=1),  # noqa: B008
+    s3_client: "S3Client" = Depends(get_s3_client),  # noqa: B008
+    s3_executor: S3Executor = Depends(get_s3_executor),  # noqa: B008
+) -> StreamingResponse:
+    """Download every file under a directory as a ZIP archive, built while it is sent."""
+    settings: Settings = request.app.state.settings
+    s3_bucket_name = settings.s3_bucket_name
+
+    objects = iter_directory_objects(
+        bucket_name=s3_bucket_name,
+        prefix=directory,
+        s3_client=s3_client,
+        s3_executor=s3_executor,
+        prefetch=settings.archive_prefetch_objects,
+    )
+    # Open the first file before answering, so an empty directory is reported as not found
+    first_object = await anext(objects, None)
+    if first_object is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Directory not found")
+
+    async def iter_objects():
+        async with contextlib.aclosing(objects):
+            yield first_object
+            async for opened_object in objects:
+                yield opened_object
+
+    filename = archive_filename(directory)
+    return StreamingResponse(
+        content=stream_zip_archive(iter_objects(), base_path=archive_base_path(directory), s3_executor=s3_executor),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"},
+    )
+
+
+def cached_body_response(
+    disk_cache: DiskCache,
+    cached_body: CachedBody,
+    if_none_match: list[str],
+    if_modified_since: Optional[datetime],
+) -> Response:
+    """Answer a GET request from a copy of the file on disk that is known to be current.
+
+    `FileResponse` lets the server send the file with sendfile when it supports it, and answers range requests itself.
+    """
+    headers = validator_headers(cached_body.etag, cached_body.last_modified)
+    if is_not_modified(cached_body.etag, cached_body.last_modified, if_none_match, if_modified_since):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    headers["Accept-Ranges"] = "bytes"
+    # The file must not be deleted by an eviction while it is being sent
+    disk_cache.serve(cached_body)
+    return FileResponse(
+        path=cached_body.path,
+        media_type=cached_body.content_type,
+        headers=headers,
+        background=BackgroundTask(disk_cache.release, cached_body),
+    )
+
+
+def forget_deleted_files(
+    deleted_keys: list[str],
+    s3_bucket_name: str,
+    metadata_cache: MetadataCache,
+    listing_index: Optional[ListingIndex],
+) -> None:
+    """Record deleted files as missing in the metadata cache and drop them from the listing index."""
+    for object_key in deleted_keys:
+        metadata_cache.put(s3_bucket_name, object_key, MISSING_OBJECT)
+        if listing_index is not None:
+            listing_index.remove(object_key)
+
@@ -0,0 +1,74 @@
+"""Construction of the shared S3 client used by the API for all of its S3 calls."""
+
+import asyncio
+import logging
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import (
+    BotoCoreError,
+    ClientError,
+)
+
+from files_api.s3.executor import S3Executor
+from files_api.settings import Settings
+
+try:
+    from mypy_boto3_s3 import S3Client
+except ImportError:
+    ...
+
+LOGGER = logging.getLogger(__name__)
+
+
+def create_s3_client(settings: Settings) -> "S3Client":
+    """
+    Create an S3 client with a connection pool sized and tuned from the settings.
+
+    boto3 clients are thread-safe, so a single client (and its connection pool) can be
+    shared by every request handled by the app.
+
+    :param settings: Settings holding the connection pool size, keep-alive, timeouts and retries.
+
+    :return: A configured S3 client.
+    """
+    config = Config(
+        max_pool_connections=settings.s3_max_pool_connections,
+        connect_timeout=settings.s3_connect_timeout_seconds,
+        read_timeout=settings.s3_read_timeout_seconds,
+        tcp_keepalive=settings.s3_tcp_keepalive,
+        # standard mode backs off exponentially, and more on throttling errors; retries are also limited by the
+        # retry budget of `files_api.resilience`
+        retries={"mode": "standard", "total_max_attempts": settings.s3_max_attempts},
+    )
+    # a dedicated session keeps credential resolution out of boto3's global default session
+    session = boto3.session.Session()
+    return session.client("s3", config=config)
+
+
+async def warm_up_s3_client(
+    s3_client: "S3Client",
+    s3_executor: S3Executor,
+    bucket_name: str,
+    connection_count: int,
+) -> None:
+    """
+    Make the first S3 calls of a worker before it serves requests, rather than while serving them.
+
+    A first call resolves credentials and loads the endpoint rules; `connection_count` concurrent
+    `head_bucket` calls then open as many pooled connections, TLS handshakes included. A failure is only
+    logged: the worker still starts, and its requests report S3 errors as they would otherwise.
+
+    :param s3_client: The shared S3 client to warm up.
+    :param s3_executor: The executor running the blocking S3 calls.
+    :param bucket_name: The bucket the API serves files from.
+    :param connection_count: Number of pooled connections to open.
+    """
+    try:
+        await s3_executor.run(s3_client.head_bucket, Bucket=bucket_name)
+        # the connection of the first call is back in the pool, so concurrent calls each need one of their own
+        await asyncio.gather(
+            *(s3_executor.run(s3_client.head_bucket, Bucket=bucket_name) for _ in range(connection_count))
+        )
+    except (BotoCoreError, ClientError):
+        LOGGER.warning("Failed to warm up the S3 client for bucket %s", bucket_name, exc_info=True)
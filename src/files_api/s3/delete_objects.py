@@ -6,9 +6,13 @@ import boto3
 
 try:
     from mypy_boto3_s3 import S3Client
+    from mypy_boto3_s3.type_defs import ErrorTypeDef
 except ImportError:
     ...
 
+# DeleteObjects accepts at most this many keys per call
+DELETE_OBJECTS_MAX_KEYS = 1_000
+
 
 def delete_s3_object(bucket_name: str, object_key: str, s3_client: Optional["S3Client"] = None) -> None:
     """
@@ -23,3 +27,26 @@ def delete_s3_object(bucket_name: str, object_key: str, s3_client: Optional["S3C
     s3_client.delete_object(Bucket=bucket_name, Key=object_key)
 
 
+def delete_s3_objects(
+    bucket_name: str,
+    object_keys: list[str],
+    s3_client: Optional["S3Client"] = None,
+) -> list["ErrorTypeDef"]:
+    """
+    Delete up to `DELETE_OBJECTS_MAX_KEYS` objects from the S3 bucket with a single DeleteObjects call.
+
+    :param bucket_name: Name of the S3 bucket.
+    :param object_keys: Keys of the objects to delete.
+    :param s3_client: Optional S3 client to use. If not provided, a new client will be created.
+
+    :return: The keys that could not be deleted, with the error code and message S3 reported for each.
+    """
+    if s3_client is None:
+        s3_client = boto3.client('s3')
+    # in quiet mode, S3 only reports the keys it failed to delete
+    response = s3_client.delete_objects(
+        Bucket=bucket_name,
+        Delete={"Objects": [{"Key": object_key} for object_key in object_keys], "Quiet": True},
+    )
+    return response.get("Errors", [])
+
@@ -0,0 +1,65 @@
+"""Run the blocking boto3 calls of the S3 helpers without blocking the event loop."""
+
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    TypeVar,
+)
+
+try:
+    from botocore.response import StreamingBody
+except ImportError:
+    ...
+
+T = TypeVar("T")
+
+DEFAULT_BODY_CHUNK_SIZE = 64 * 1024
+
+
+class S3Executor:
+    """
+    A dedicated, bounded thread pool that makes the synchronous S3 helpers awaitable.
+
+    At most `max_concurrency` S3 calls run at once; further calls wait in the pool's queue
+    instead of piling onto the event loop or onto the default executor shared with the rest of the app.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="s3")
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Run `func(*args, **kwargs)` on the S3 thread pool and await its result.
+
+        Context variables of the caller are propagated to the worker thread, like `asyncio.to_thread` does.
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, func, *args, **kwargs)
+        return await loop.run_in_executor(self._executor, call)
+
+    async def iter_body(
+        self,
+        body: "StreamingBody",
+        chunk_size: int = DEFAULT_BODY_CHUNK_SIZE,
+    ) -> AsyncIterator[bytes]:
+        """
+        Stream an S3 object body in chunks, reading each chunk on the S3 thread pool.
+
+        The body is closed once it is exhausted or the consumer stops iterating early.
+        """
+        try:
+            while chunk := await self.run(body.read, chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    def shutdown(self) -> None:
+        """Wait for running S3 calls to finish and drop the ones that have not started."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
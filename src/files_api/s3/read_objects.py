@@ -1,6 +1,10 @@
 """Functions for reading objects from an S3 bucket--the "R" in CRUD."""
 
-from typing import Optional
+from datetime import datetime
+from typing import (
+    Iterator,
+    Optional,
+)
 
 import boto3
 from botocore.exceptions import ClientError
@@ -9,6 +13,7 @@ try:
     from mypy_boto3_s3 import S3Client
     from mypy_boto3_s3.type_defs import (
         GetObjectOutputTypeDef,
+        HeadObjectOutputTypeDef,
         ObjectTypeDef,
         ListObjectsV2OutputTypeDef,
     )
@@ -20,6 +25,13 @@ DEFAULT_MAX_KEYS = 1_000
 
 OBJECT_NOT_FOUND_ERROR_CODE = "404"
 
+# get_object reports a missing object with this code instead of OBJECT_NOT_FOUND_ERROR_CODE
+NO_SUCH_KEY_ERROR_CODE = "NoSuchKey"
+
+INVALID_RANGE_ERROR_CODE = "InvalidRange"
+
+NOT_MODIFIED_ERROR_CODE = "304"
+
 
 
 def object_exists_in_s3(bucket_name: str, object_key: str, s3_client: Optional["S3Client"] = None) -> bool:
@@ -49,13 +61,22 @@ def fetch_s3_object(
     bucket_name: str,
     object_key: str,
     s3_client: Optional["S3Client"] = None,
+    byte_range: Optional[str] = None,
+    if_none_match: Optional[str] = None,
+    if_modified_since: Optional[datetime] = None,
 ) -> "GetObjectOutputTypeDef":
     """
     Fetch metadata of an object in the S3 bucket.
 
+    If a condition is given and the object has not changed, S3 answers with an error
+    whose code is `NOT_MODIFIED_ERROR_CODE` instead of sending the object again.
+
     :param bucket_name: Name of the S3 bucket.
     :param object_key: Key of the object to fetch.
     :param s3_client: Optional S3 client to use. If not provided, a new client will be created.
+    :param byte_range: Optional HTTP byte range, e.g. "bytes=0-99", to fetch only part of the object.
+    :param if_none_match: Optional ETag; the object is only returned if its ETag differs.
+    :param if_modified_since: Optional timestamp; the object is only returned if it was modified after it.
 
     :return: Metadata of the object.
     """
@@ -63,7 +84,74 @@ def fetch_s3_object(
     if s3_client is None:
         s3_client = boto3.client('s3')
 
-    response: GetObjectOutputTypeDef = s3_client.get_object(Bucket=bucket_name, Key=object_key)
+    get_object_kwargs = {"Bucket": bucket_name, "Key": object_key}
+    if byte_range is not None:
+        get_object_kwargs["Range"] = byte_range
+    if if_none_match is not None:
+        get_object_kwargs["IfNoneMatch"] = if_none_match
+    if if_modified_since is not None:
+        get_object_kwargs["IfModifiedSince"] = if_modified_since
+
+    response: GetObjectOutputTypeDef = s3_client.get_object(**get_object_kwargs)
+
+    return response
+
+
+def generate_presigned_get_url(
+    bucket_name: str,
+    object_key: str,
+    expires_in_seconds: int,
+    s3_client: Optional["S3Client"] = None,
+) -> str:
+    """
+    Sign a URL letting its holder download an object straight from S3, until it expires.
+
+    Signing happens locally, without calling S3, so the URL is issued whether or not the object exists.
+
+    :param bucket_name: Name of the S3 bucket.
+    :param object_key: Key of the object to download.
+    :param expires_in_seconds: Seconds the URL stays valid for.
+    :param s3_client: Optional S3 client to use. If not provided, a new client will be created.
+
+    :return: The presigned URL, answering GET requests (with a `Range` header too).
+    """
+    if s3_client is None:
+        s3_client = boto3.client('s3')
+    return s3_client.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": bucket_name, "Key": object_key},
+        ExpiresIn=expires_in_seconds,
+    )
+
+
+def fetch_s3_object_metadata(
+    bucket_name: str,
+    object_key: str,
+    s3_client: Optional["S3Client"] = None,
+    if_none_match: Optional[str] = None,
+    if_modified_since: Optional[datetime] = None,
+) -> "HeadObjectOutputTypeDef":
+    """
+    Fetch metadata of an object in the S3 bucket using head_object, without its content.
+
+    :param bucket_name: Name of the S3 bucket.
+    :param object_key: Key of the object to fetch.
+    :param s3_client: Optional S3 client to use. If not provided, a new client will be created.
+    :param if_none_match: Optional ETag; S3 answers `NOT_MODIFIED_ERROR_CODE` if the object still has it.
+    :param if_modified_since: Optional timestamp; S3 answers `NOT_MODIFIED_ERROR_CODE` if not modified since.
+
+    :return: Metadata of the object.
+    """
+    if s3_client is None:
+        s3_client = boto3.client('s3')
+
+    head_object_kwargs = {"Bucket": bucket_name, "Key": object_key}
+    if if_none_match is not None:
+        head_object_kwargs["IfNoneMatch"] = if_none_match
+    if if_modified_since is not None:
+        head_object_kwargs["IfModifiedSince"] = if_modified_since
+
+    response: HeadObjectOutputTypeDef = s3_client.head_object(**head_object_kwargs)
 
     return response
 
@@ -73,6 +161,7 @@ def fetch_s3_objects_using_page_token(
     continuation_token: str,
     max_keys: int | None = None,
     s3_client: Optional["S3Client"] = None,
+    prefix: Optional[str] = None,
 ) -> tuple[list["ObjectTypeDef"], Optional[str]]:
     """
     Fetch list of object keys and their metadata using a continuation token.
@@ -81,6 +170,7 @@ def fetch_s3_objects_using_page_token(
     :param continuation_token: Token for fetching the next page of results where the last page left off.
     :param max_keys: Maximum number of keys to return within this page.
     :param s3_client: Optional S3 client to use. If not provided, a new client will be created.
+    :param prefix: The prefix of the listing the token comes from; the token alone does not restrict the keys to it.
 
     :return: Tuple of a list of objects and the next continuation token.
         1. Possibly empty list of objects in the current page.
@@ -92,7 +182,11 @@ def fetch_s3_objects_using_page_token(
     if max_keys is None:
         max_keys = DEFAULT_MAX_KEYS
 
-    response: ListObjectsV2OutputTypeDef = s3_client.list_objects_v2(Bucket=bucket_name, ContinuationToken=continuation_token, MaxKeys=max_keys)
+    list_objects_kwargs = {"Bucket": bucket_name, "ContinuationToken": continuation_token, "MaxKeys": max_keys}
+    if prefix:
+        list_objects_kwargs["Prefix"] = prefix
+
+    response: ListObjectsV2OutputTypeDef = s3_client.list_objects_v2(**list_objects_kwargs)
     files: list["ObjectTypeDef"] = response.get("Contents", [])
     next_continuation_token: str | None = response.get("NextContinuationToken")
 
@@ -104,6 +198,7 @@ def fetch_s3_objects_metadata(
     prefix: Optional[str] = None,
     max_keys: Optional[int] = DEFAULT_MAX_KEYS,
     s3_client: Optional["S3Client"] = None,
+    start_after: Optional[str] = None,
 ) -> tuple[list["ObjectTypeDef"], Optional[str]]:
     """
     Fetch list of object keys and their metadata.
@@ -112,6 +207,7 @@ def fetch_s3_objects_metadata(
     :param prefix: Prefix to filter objects by.
     :param max_keys: Maximum number of keys to return within this page.
     :param s3_client: Optional S3 client to use. If not provided, a new client will be created.
+    :param start_after: Optional key to start listing after, instead of at the beginning of the prefix.
 
     :return: Tuple of a list of objects and the next continuation token.
         1. Possibly empty list of objects in the current page.
@@ -126,9 +222,90 @@ def fetch_s3_objects_metadata(
     if prefix is None:
         prefix = ""
 
-    response: ListObjectsV2OutputTypeDef = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=prefix, MaxKeys=max_keys)
+    list_objects_kwargs = {"Bucket": bucket_name, "Prefix": prefix, "MaxKeys": max_keys}
+    if start_after:
+        list_objects_kwargs["StartAfter"] = start_after
+
+    response: ListObjectsV2OutputTypeDef = s3_client.list_objects_v2(**list_objects_kwargs)
     files: list["ObjectTypeDef"] = response.get("Contents", [])
     next_continuation_token: str | None = response.get("NextContinuationToken")
 
     return files, next_continuation_token
-    
+
+
+def fetch_s3_directory_page(
+    bucket_name: str,
+    prefix: str,
+    max_keys: Optional[int] = DEFAULT_MAX_KEYS,
+    s3_client: Optional["S3Client"] = None,
+    continuation_token: Optional[str] = None,
+    delimiter: str = "/",
+) -> tuple[list["ObjectTypeDef"], list[str], Optional[str]]:
+    """
+    Fetch one level of the tree of keys under a prefix: its objects, and its subdirectories rolled up by `delimiter`.
+
+    S3 counts every subdirectory as a single key towards `max_keys`, whatever the number of keys below it.
+
+    :param bucket_name: Name of the S3 bucket to list objects from.
+    :param prefix: Prefix of the level to list, e.g. "photos/2024/".
+    :param max_keys: Maximum number of objects and subdirectories, together, within this page.
+    :param s3_client: Optional S3 client to use. If not provided, a new client will be created.
+    :param continuation_token: Optional token of the page to fetch, from the previous page of the same listing.
+    :param delimiter: Character separating the levels of the tree.
+
+    :return: Tuple of the objects, the subdirectories and the next continuation token.
+        1. Possibly empty list of objects directly under the prefix in the current page.
+        2. Possibly empty list of subdirectories (common prefixes, ending with the delimiter) in the current page.
+        3. Next continuation token if there are more pages, otherwise None.
+    """
+    if s3_client is None:
+        s3_client = boto3.client('s3')
+
+    if max_keys is None:
+        max_keys = DEFAULT_MAX_KEYS
+
+    list_objects_kwargs = {"Bucket": bucket_name, "Prefix": prefix, "Delimiter": delimiter, "MaxKeys": max_keys}
+    if continuation_token:
+        list_objects_kwargs["ContinuationToken"] = continuation_token
+
+    response: ListObjectsV2OutputTypeDef = s3_client.list_objects_v2(**list_objects_kwargs)
+    files: list["ObjectTypeDef"] = response.get("Contents", [])
+    directories = [common_prefix["Prefix"] for common_prefix in response.get("CommonPrefixes", [])]
+    next_continuation_token: str | None = response.get("NextContinuationToken")
+
+    return files, directories, next_continuation_token
+
+
+def iter_s3_object_pages(
+    bucket_name: str,
+    prefix: Optional[str] = None,
+    max_keys: Optional[int] = DEFAULT_MAX_KEYS,
+    s3_client: Optional["S3Client"] = None,
+) -> Iterator[list["ObjectTypeDef"]]:
+    """
+    Iterate over every page of objects under a prefix, following the continuation tokens.
+
+    :param bucket_name: Name of the S3 bucket to list objects from.
+    :param prefix: Prefix to filter objects by.
+    :param max_keys: Maximum number of keys within each page.
+    :param s3_client: Optional S3 client to use. If not provided, a new client will be created.
+
+    :return: Iterator of possibly empty pages of objects, in lexicographic key order.
+    """
+    if s3_client is None:
+        s3_client = boto3.client('s3')
+
+    files, next_continuation_token = fetch_s3_objects_metadata(
+        bucket_name, prefix=prefix, max_keys=max_keys, s3_client=s3_client
+    )
+    yield files
+    while next_continuation_token:
+        files, next_continuation_token = fetch_s3_objects_using_page_token(
+            bucket_name,
+            continuation_token=next_continuation_token,
+            max_keys=max_keys,
+            s3_client=s3_client,
+            prefix=prefix,
+        )
+        yield files
+
@@ -1,6 +1,5 @@
 """Functions for writing objects from an S3 bucket--the "C" and "U" in CRUD."""
 
-from posix import read
 from typing import Optional
 import boto3
 
@@ -9,6 +8,14 @@ try:
 except ImportError:
     print("Mypy S3Client not found")
 
+# S3 answers a conditional write whose condition does not hold with this error code (HTTP 412)
+PRECONDITION_FAILED_ERROR_CODE = "PreconditionFailed"
+
+# S3 answers with this code when a multipart upload was never started, or was already completed or aborted
+NO_SUCH_UPLOAD_ERROR_CODE = "NoSuchUpload"
+
+# codes S3 rejects the completion of a multipart upload with, when the parts listed do not make up a valid object
+INVALID_PARTS_ERROR_CODES = ("InvalidPart", "InvalidPartOrder", "EntityTooSmall")
 
 def upload_s3_object(
     bucket_name: str,
@@ -16,7 +23,10 @@ def upload_s3_object(
     file_content: bytes,
     content_type: Optional[str] = None,
     s3_client: Optional["S3Client"] = None,
-) -> None:
+    if_none_match: Optional[str] = None,
+    metadata: Optional[dict[str, str]] = None,
+    content_encoding: Optional[str] = None,
+) -> str:
     """
     Upload a file to an S3 bucket.
 
@@ -25,13 +35,245 @@ def upload_s3_object(
     :param file_content: The content of the file to upload.
     :param content_type: The MIME type of the file, e.g. "text/plain" for a text file.
     :param s3_client: An optional boto3 S3 client. If not provided, one will be created.
+    :param if_none_match: Optional "*" to only create the object if it does not exist yet; otherwise
+        S3 answers with an error whose code is `PRECONDITION_FAILED_ERROR_CODE`.
+    :param metadata: Optional user-defined metadata to store with the object.
+    :param content_encoding: Optional coding the content is stored in, e.g. "gzip".
+
+    :return: The ETag of the uploaded object.
+    """
+    if s3_client is None:
+        s3_client = boto3.client('s3')
+    content_type = content_type or "application/octet-stream"
+    put_object_kwargs = {"Bucket": bucket_name, "Key": object_key, "Body": file_content, "ContentType": content_type}
+    if if_none_match is not None:
+        put_object_kwargs["IfNoneMatch"] = if_none_match
+    if metadata is not None:
+        put_object_kwargs["Metadata"] = metadata
+    if content_encoding is not None:
+        put_object_kwargs["ContentEncoding"] = content_encoding
+    response = s3_client.put_object(**put_object_kwargs)
+    return response["ETag"]
+
+
+def generate_presigned_put_url(
+    bucket_name: str,
+    object_key: str,
+    expires_in_seconds: int,
+    content_type: Optional[str] = None,
+    s3_client: Optional["S3Client"] = None,
+) -> str:
+    """
+    Sign a URL letting its holder upload an object straight to S3 with a single PUT, until it expires.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param object_key: path to the object in the S3 bucket.
+    :param expires_in_seconds: Seconds the URL stays valid for.
+    :param content_type: The MIME type of the file; the PUT must send it as its `Content-Type` header.
+    :param s3_client: An optional boto3 S3 client. If not provided, one will be created.
+
+    :return: The presigned URL.
+    """
+    if s3_client is None:
+        s3_client = boto3.client('s3')
+    content_type = content_type or "application/octet-stream"
+    return s3_client.generate_presigned_url(
+        "put_object",
+        Params={"Bucket": bucket_name, "Key": object_key, "ContentType": content_type},
+        ExpiresIn=expires_in_seconds,
+    )
+
+
+def copy_s3_object(
+    bucket_name: str,
+    source_key: str,
+    object_key: str,
+    source_etag: str,
+    content_type: Optional[str] = None,
+    metadata: Optional[dict[str, str]] = None,
+    s3_client: Optional["S3Client"] = None,
+    content_encoding: Optional[str] = None,
+) -> str:
+    """
+    Copy an object within an S3 bucket, server-side, without transferring its content through the API.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param source_key: path to the object to copy.
+    :param object_key: path to the copy; may be the source itself, to replace its content type and metadata.
+    :param source_etag: ETag the source must still have; otherwise S3 answers with an error whose code is
+        `PRECONDITION_FAILED_ERROR_CODE`.
+    :param content_type: The MIME type of the copy, e.g. "text/plain" for a text file.
+    :param metadata: Optional user-defined metadata to store with the copy.
+    :param s3_client: An optional boto3 S3 client. If not provided, one will be created.
+    :param content_encoding: Optional coding the content of the source is stored in, e.g. "gzip".
+
+    :return: The ETag of the copy.
+    """
+    if s3_client is None:
+        s3_client = boto3.client('s3')
+    copy_object_kwargs = {
+        "Bucket": bucket_name,
+        "Key": object_key,
+        "CopySource": {"Bucket": bucket_name, "Key": source_key},
+        "CopySourceIfMatch": source_etag,
+        # the content type and metadata of the copy replace those of the source
+        "MetadataDirective": "REPLACE",
+        "ContentType": content_type or "application/octet-stream",
+        "Metadata": metadata or {},
+    }
+    if content_encoding is not None:
+        copy_object_kwargs["ContentEncoding"] = content_encoding
+    response = s3_client.copy_object(**copy_object_kwargs)
+    return response["CopyObjectResult"]["ETag"]
+
+
+def create_multipart_upload(
+    bucket_name: str,
+    object_key: str,
+    content_type: Optional[str] = None,
+    s3_client: Optional["S3Client"] = None,
+    metadata: Optional[dict[str, str]] = None,
+    content_encoding: Optional[str] = None,
+) -> str:
+    """
+    Start a multipart upload of an object to an S3 bucket.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param object_key: path to the object in the S3 bucket.
+    :param content_type: The MIME type of the file, e.g. "text/plain" for a text file.
+    :param s3_client: An optional boto3 S3 client. If not provided, one will be created.
+    :param metadata: Optional user-defined metadata to store with the object.
+    :param content_encoding: Optional coding the content is stored in, e.g. "gzip".
+
+    :return: The id of the multipart upload, needed to upload, complete or abort its parts.
     """
     if s3_client is None:
         s3_client = boto3.client('s3')
     content_type = content_type or "application/octet-stream"
-    print(s3_client.put_object(
+    create_multipart_upload_kwargs = {
+        "Bucket": bucket_name,
+        "Key": object_key,
+        "ContentType": content_type,
+        "Metadata": metadata or {},
+    }
+    if content_encoding is not None:
+        create_multipart_upload_kwargs["ContentEncoding"] = content_encoding
+    response = s3_client.create_multipart_upload(**create_multipart_upload_kwargs)
+    return response["UploadId"]
+
+
+def upload_part(
+    bucket_name: str,
+    object_key: str,
+    upload_id: str,
+    part_number: int,
+    part_content: bytes,
+    s3_client: Optional["S3Client"] = None,
+) -> str:
+    """
+    Upload one part of a multipart upload.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param object_key: path to the object in the S3 bucket.
+    :param upload_id: The id returned by `create_multipart_upload`.
+    :param part_number: 1-based position of the part within the object.
+    :param part_content: The content of the part. All parts but the last must be at least 5 MiB.
+    :param s3_client: An optional boto3 S3 client. If not provided, one will be created.
+
+    :return: The ETag of the uploaded part, needed to complete the upload.
+    """
+    if s3_client is None:
+        s3_client = boto3.client('s3')
+    response = s3_client.upload_part(
         Bucket=bucket_name,
         Key=object_key,
-        Body=file_content,
-        ContentType=content_type
-    ))   
+        UploadId=upload_id,
+        PartNumber=part_number,
+        Body=part_content,
+    )
+    return response["ETag"]
+
+
+def generate_presigned_upload_part_url(
+    bucket_name: str,
+    object_key: str,
+    upload_id: str,
+    part_number: int,
+    expires_in_seconds: int,
+    s3_client: Optional["S3Client"] = None,
+) -> str:
+    """
+    Sign a URL letting its holder upload one part of a multipart upload straight to S3, until it expires.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param object_key: path to the object in the S3 bucket.
+    :param upload_id: The id returned by `create_multipart_upload`.
+    :param part_number: 1-based position of the part within the object.
+    :param expires_in_seconds: Seconds the URL stays valid for.
+    :param s3_client: An optional boto3 S3 client. If not provided, one will be created.
+
+    :return: The presigned URL; S3 answers the PUT of the part with its ETag, needed to complete the upload.
+    """
+    if s3_client is None:
+        s3_client = boto3.client('s3')
+    return s3_client.generate_presigned_url(
+        "upload_part",
+        Params={"Bucket": bucket_name, "Key": object_key, "UploadId": upload_id, "PartNumber": part_number},
+        ExpiresIn=expires_in_seconds,
+    )
+
+
+def complete_multipart_upload(
+    bucket_name: str,
+    object_key: str,
+    upload_id: str,
+    part_etags: list[str],
+    s3_client: Optional["S3Client"] = None,
+    if_none_match: Optional[str] = None,
+) -> str:
+    """
+    Assemble the uploaded parts into the final object.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param object_key: path to the object in the S3 bucket.
+    :param upload_id: The id returned by `create_multipart_upload`.
+    :param part_etags: ETags of the uploaded parts, ordered by part number.
+    :param s3_client: An optional boto3 S3 client. If not provided, one will be created.
+    :param if_none_match: Optional "*" to only create the object if it does not exist yet; otherwise S3
+        answers with an error whose code is `PRECONDITION_FAILED_ERROR_CODE` and the upload can still be completed.
+
+    :return: The ETag of the assembled object.
+    """
+    if s3_client is None:
+        s3_client = boto3.client('s3')
+    complete_multipart_upload_kwargs = {
+        "Bucket": bucket_name,
+        "Key": object_key,
+        "UploadId": upload_id,
+        "MultipartUpload": {
+            "Parts": [{"ETag": etag, "PartNumber": part_number} for part_number, etag in enumerate(part_etags, start=1)]
+        },
+    }
+    if if_none_match is not None:
+        complete_multipart_upload_kwargs["IfNoneMatch"] = if_none_match
+    response = s3_client.complete_multipart_upload(**complete_multipart_upload_kwargs)
+    return response["ETag"]
+
+
+def abort_multipart_upload(
+    bucket_name: str,
+    object_key: str,
+    upload_id: str,
+    s3_client: Optional["S3Client"] = None,
+) -> None:
+    """
+    Abort a multipart upload so S3 discards (and stops billing for) its uploaded parts.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param object_key: path to the object in the S3 bucket.
+    :param upload_id: The id returned by `create_multipart_upload`.
+    :param s3_client: An optional boto3 S3 client. If not provided, one will be created.
+    """
+    if s3_client is None:
+        s3_client = boto3.client('s3')
+    s3_client.abort_multipart_upload(Bucket=bucket_name, Key=object_key, UploadId=upload_id)
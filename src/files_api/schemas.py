@@ -1,10 +1,14 @@
 # src/files_api/schemas.py
 from datetime import datetime
 from typing import (
+    Dict,
     List,
     Optional,
 )
-from typing_extensions import Self
+from typing_extensions import (
+    Self,
+    TypedDict,
+)
 
 from pydantic import (
     BaseModel,
@@ -12,6 +16,11 @@ from pydantic import (
     model_validator,
 )
 
+from files_api.settings import (
+    S3_MAX_OBJECT_SIZE_BYTES,
+    S3_MAX_PARTS,
+)
+
 ####################################
 # --- Request/response schemas --- #
 ####################################
@@ -22,6 +31,8 @@ DEFAULT_GET_FILES_PAGE_SIZE = 10
 DEFAULT_GET_FILES_MIN_PAGE_SIZE = 10
 DEFAULT_GET_FILES_MAX_PAGE_SIZE = 100
 DEFAULT_GET_FILES_DIRECTORY = ""
+DEFAULT_BATCH_MAX_FILE_PATHS = 10_000
+DEFAULT_BATCH_HEAD_MAX_FILE_PATHS = 1_000
 
 
 # read (cRud)
@@ -33,36 +44,178 @@ class FileMetadata(BaseModel):
 # read (cRud)
 class GetFilesResponse(BaseModel):
     files: List[FileMetadata]
+    # immediate subdirectories of the listed directory, ending with "/"; only listed when not recursive
+    directories: List[str] = Field(default_factory=list)
     next_page_token: Optional[str]
 
 
 # read (cRud)
 class GetFilesQueryParams(BaseModel):
-    page_size: int = Field(
-        DEFAULT_GET_FILES_PAGE_SIZE,
+    # page_size and directory default to None rather than to their default values: FastAPI passes every
+    # query parameter to the model, so None is the only way to tell that a parameter was not sent.
+    # The defaults are filled in by `check_mutually_exclusive_params`.
+    page_size: Optional[int] = Field(
+        None,
         ge=DEFAULT_GET_FILES_MIN_PAGE_SIZE,
         le=DEFAULT_GET_FILES_MAX_PAGE_SIZE,
     )
     directory: Optional[str] = Field(
-        DEFAULT_GET_FILES_DIRECTORY,
+        None,
     )
+    # False lists a single level of the tree: the files directly in `directory`, and its subdirectories
+    recursive: Optional[bool] = None
     page_token: Optional[str] = None
 
     @model_validator(mode="after")
     def check_mutually_exclusive_params(self) -> Self:
         if self.page_token:
-            get_files_query_params: dict = self.model_dump(exclude_unset=True)
-            page_size_set = "page_size" in get_files_query_params.keys()
-            directory_set = "directory" in get_files_query_params.keys()
-            if page_size_set or directory_set:
-                raise ValueError("page_token is mutually exclusive with page_size and directory")
+            page_size_set = self.page_size is not None
+            directory_set = self.directory is not None
+            recursive_set = self.recursive is not None
+            if page_size_set or directory_set or recursive_set:
+                raise ValueError("page_token is mutually exclusive with page_size, directory and recursive")
+        if self.page_size is None:
+            self.page_size = DEFAULT_GET_FILES_PAGE_SIZE
+        if self.directory is None:
+            self.directory = DEFAULT_GET_FILES_DIRECTORY
+        if self.recursive is None:
+            self.recursive = True
         return self
+# read (cRud)
+class BatchHeadRequest(BaseModel):
+    file_paths: List[str] = Field(..., min_length=1, max_length=DEFAULT_BATCH_HEAD_MAX_FILE_PATHS)
+
+
+# read (cRud)
+class FileHeadResult(BaseModel):
+    file_path: str
+    exists: bool
+    size_bytes: Optional[int] = None
+    content_type: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[datetime] = None
+
+
+# read (cRud)
+class BatchHeadResponse(BaseModel):
+    files: List[FileHeadResult]
+
+
 # delete (cruD)
 class DeleteFileResponse(BaseModel):
     message: str
 
 
+# delete (cruD)
+class BatchDeleteRequest(BaseModel):
+    file_paths: List[str] = Field(..., min_length=1, max_length=DEFAULT_BATCH_MAX_FILE_PATHS)
+
+
+# delete (cruD)
+class DeleteFileError(BaseModel):
+    file_path: str
+    code: str
+    message: str
+
+
+# delete (cruD)
+class BatchDeleteResponse(BaseModel):
+    deleted_count: int
+    errors: List[DeleteFileError]
+
+
 # create/update (CrUd)
 class PutFileResponse(BaseModel):
     file_path: str
-    message: str
\ No newline at end of file
+    message: str
+
+
+# create/update (CrUd)
+class BatchPutFileResult(PutFileResponse):
+    status_code: int
+
+
+# create/update (CrUd)
+class BatchPutFilesResponse(BaseModel):
+    results: List[BatchPutFileResult]
+
+
+# create/update (CrUd)
+class PresignUploadRequest(BaseModel):
+    file_path: str = Field(..., min_length=1)
+    size_bytes: int = Field(..., ge=0, le=S3_MAX_OBJECT_SIZE_BYTES)
+    content_type: Optional[str] = None
+
+
+# create/update (CrUd)
+class PresignedUploadPart(BaseModel):
+    part_number: int
+    url: str
+    # headers the PUT must be sent with, since they are signed along with the URL
+    headers: Dict[str, str] = Field(default_factory=dict)
+
+
+# create/update (CrUd)
+class PresignUploadResponse(BaseModel):
+    file_path: str
+    # only set for multipart uploads; every part but the last is exactly `part_size_bytes` long
+    upload_id: Optional[str]
+    part_size_bytes: int
+    parts: List[PresignedUploadPart]
+    expires_at: datetime
+
+
+# create/update (CrUd)
+class CompleteUploadRequest(BaseModel):
+    file_path: str = Field(..., min_length=1)
+    upload_id: Optional[str] = None
+    # the ETags S3 answered the PUT of each part with, ordered by part number
+    part_etags: List[str] = Field(default_factory=list, max_length=S3_MAX_PARTS)
+
+    @model_validator(mode="after")
+    def check_part_etags(self) -> Self:
+        if self.upload_id is not None and not self.part_etags:
+            raise ValueError("part_etags is required to complete a multipart upload")
+        if self.upload_id is None and self.part_etags:
+            raise ValueError("part_etags is only accepted with an upload_id")
+        return self
+
+
+# create/update (CrUd)
+class AbortUploadRequest(BaseModel):
+    file_path: str = Field(..., min_length=1)
+    upload_id: str
+
+
+########################################
+# --- Fast-path serialization shapes --- #
+########################################
+
+# Plain-dict mirrors of the response models above, for the routes returning many items: they are serialized
+# (see `files_api.serialization`) into the same JSON as the models, without building and validating a model per item.
+# Keys are serialized in the order they were inserted, so build the dicts in the order of the models' fields.
+
+
+class FileMetadataDict(TypedDict):
+    file_path: str
+    last_modified: datetime
+    size_bytes: int
+
+
+class GetFilesDict(TypedDict):
+    files: List[FileMetadataDict]
+    directories: List[str]
+    next_page_token: Optional[str]
+
+
+class FileHeadResultDict(TypedDict):
+    file_path: str
+    exists: bool
+    size_bytes: Optional[int]
+    content_type: Optional[str]
+    etag: Optional[str]
+    last_modified: Optional[datetime]
+
+
+class BatchHeadDict(TypedDict):
+    files: List[FileHeadResultDict]
@@ -0,0 +1,118 @@
+"""
+Fast-path serialization of the listing and metadata responses, in JSON or in a compact format negotiated with `Accept`.
+
+The routes returning many items build plain dicts shaped like the `files_api.schemas` response models and serialize
+them in one pass, instead of building a model per item that FastAPI then validates and serializes again. The JSON is
+produced by the same pydantic serializer FastAPI uses for the models, so it is byte-for-byte identical.
+"""
+
+import csv
+import io
+from typing import (
+    Any,
+    Optional,
+)
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+from files_api.schemas import (
+    BatchHeadDict,
+    FileHeadResultDict,
+    FileMetadataDict,
+    GetFilesDict,
+)
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    from mypy_boto3_s3.type_defs import ObjectTypeDef
+except ImportError:
+    ...
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+CSV_MEDIA_TYPE = "text/csv"
+
+# a CSV body only holds the files, so the token of the next page of a listing is sent in this header
+NEXT_PAGE_TOKEN_HEADER = "X-Next-Page-Token"
+
+# the formats responses can be sent in, by order of preference; MessagePack needs the optional msgpack package
+RESPONSE_MEDIA_TYPES = [JSON_MEDIA_TYPE, CSV_MEDIA_TYPE] + ([MSGPACK_MEDIA_TYPE] if msgpack is not None else [])
+
+_FILE_METADATA_ADAPTER = TypeAdapter(FileMetadataDict)
+_GET_FILES_ADAPTER = TypeAdapter(GetFilesDict)
+_BATCH_HEAD_ADAPTER = TypeAdapter(BatchHeadDict)
+
+
+def file_metadata_dicts(files: list["ObjectTypeDef"]) -> list[FileMetadataDict]:
+    """Describe the objects of a ListObjectsV2 page like `FileMetadata` does."""
+    return [
+        {"file_path": item["Key"], "last_modified": item["LastModified"], "size_bytes": item["Size"]} for item in files
+    ]
+
+
+def ndjson_lines(files: list[FileMetadataDict]) -> bytes:
+    """Serialize file metadata as newline-delimited JSON, one file per line."""
+    return b"".join(_FILE_METADATA_ADAPTER.dump_json(file) + b"\n" for file in files)
+
+
+def get_files_response(
+    files: list[FileMetadataDict],
+    next_page_token: Optional[str],
+    media_type: str = JSON_MEDIA_TYPE,
+    directories: Optional[list[str]] = None,
+) -> Response:
+    """
+    Serialize a page of a listing, like a `GetFilesResponse`.
+
+    In CSV, the subdirectories are rows of their own, after the files, with only a `file_path` (ending with "/").
+    """
+    payload: GetFilesDict = {"files": files, "directories": directories or [], "next_page_token": next_page_token}
+    if media_type != CSV_MEDIA_TYPE:
+        return _encode_response(_GET_FILES_ADAPTER, payload, media_type)
+    rows = _GET_FILES_ADAPTER.dump_python(payload, mode="json")["files"]
+    rows += [{"file_path": directory} for directory in payload["directories"]]
+    headers = {NEXT_PAGE_TOKEN_HEADER: next_page_token} if next_page_token else None
+    return _csv_response(rows, list(FileMetadataDict.__annotations__), headers)
+
+
+def batch_head_response(files: list[FileHeadResultDict], media_type: str = JSON_MEDIA_TYPE) -> Response:
+    """Serialize the metadata of many files, like a `BatchHeadResponse`."""
+    payload: BatchHeadDict = {"files": files}
+    if media_type == CSV_MEDIA_TYPE:
+        rows = _BATCH_HEAD_ADAPTER.dump_python(payload, mode="json")["files"]
+        return _csv_response(rows, list(FileHeadResultDict.__annotations__))
+    return _encode_response(_BATCH_HEAD_ADAPTER, payload, media_type)
+
+
+def _encode_response(adapter: TypeAdapter, payload: Any, media_type: str) -> Response:
+    if media_type == MSGPACK_MEDIA_TYPE:
+        # the values are encoded like in JSON, e.g. dates as ISO 8601 strings
+        content = msgpack.packb(adapter.dump_python(payload, mode="json"))
+    else:
+        content = adapter.dump_json(payload)
+    # the same URL answers in several formats
+    return Response(content=content, media_type=media_type, headers={"Vary": "Accept"})
+
+
+def _csv_response(
+    rows: list[dict[str, Any]], columns: list[str], headers: Optional[dict[str, str]] = None
+) -> Response:
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n")
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_csv_value(row.get(column)) for column in columns])
+    return Response(content=output.getvalue(), media_type=CSV_MEDIA_TYPE, headers={"Vary": "Accept", **(headers or {})})
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
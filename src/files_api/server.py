@@ -0,0 +1,120 @@
+"""
+Production entry point of the files API, installed as the `files-api` command.
+
+Serves the app built by `create_app` with uvicorn, in one worker process per available CPU core by default,
+with uvloop and httptools when they are installed (`pip install cloud-course-project[server]`). Each worker
+warms up its S3 client before accepting connections. On SIGTERM or SIGINT, workers stop accepting connections
+and let in-flight requests, streamed downloads included, finish for up to `timeout_graceful_shutdown_seconds`.
+
+Options are read from `SERVER_*` environment variables, see `ServerSettings`, and can be overridden on the
+command line. The app itself is configured as usual, e.g. with `S3_BUCKET_NAME`.
+
+Example:
+    S3_BUCKET_NAME=some-bucket files-api --workers 4 --port 8080
+"""
+
+import argparse
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+from typing import (
+    Any,
+    Optional,
+)
+
+from files_api.settings import (
+    ServerSettings,
+    Settings,
+)
+
+# the app factory each worker imports and calls to build its app
+APP_FACTORY = "files_api.main:create_app"
+
+
+def available_cpu_count() -> int:
+    """Return the number of CPU cores this process may run on, which a container or `taskset` may restrict."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def resolve_event_loop(loop: str) -> str:
+    """Return the event loop to run, resolving "auto" to uvloop when it is installed."""
+    if loop != "auto":
+        return loop
+    return "uvloop" if importlib.util.find_spec("uvloop") is not None else "asyncio"
+
+
+def resolve_http_protocol(http: str) -> str:
+    """Return the HTTP/1.1 implementation to use, resolving "auto" to httptools when it is installed."""
+    if http != "auto":
+        return http
+    return "httptools" if importlib.util.find_spec("httptools") is not None else "h11"
+
+
+def uvicorn_options(server_settings: ServerSettings) -> dict[str, Any]:
+    """Translate the server settings into keyword arguments for `uvicorn.run`."""
+    return {
+        "host": server_settings.host,
+        "port": server_settings.port,
+        "workers": server_settings.workers or available_cpu_count(),
+        "loop": resolve_event_loop(server_settings.loop),
+        "http": resolve_http_protocol(server_settings.http),
+        "backlog": server_settings.backlog,
+        "timeout_keep_alive": server_settings.timeout_keep_alive_seconds,
+        "timeout_graceful_shutdown": server_settings.timeout_graceful_shutdown_seconds,
+        # the app is built in each worker, after the worker process has started
+        "factory": True,
+    }
+
+
+def parse_args(argv: Optional[list[str]] = None) -> ServerSettings:
+    """Read the server settings from the environment, overridden by the options given on the command line."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--loop", choices=["auto", "asyncio", "uvloop"])
+    parser.add_argument("--http", choices=["auto", "h11", "httptools"])
+    parser.add_argument("--backlog", type=int)
+    parser.add_argument("--timeout-keep-alive-seconds", type=int)
+    parser.add_argument("--timeout-graceful-shutdown-seconds", type=int)
+    args = parser.parse_args(argv)
+    overrides = {name: value for name, value in vars(args).items() if value is not None}
+    return ServerSettings(**overrides)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    server_settings = parse_args(argv)
+    # fail here rather than in every worker
+    if "S3_BUCKET_NAME" not in os.environ:
+        print("S3_BUCKET_NAME must be set to the name of the bucket to serve files from", file=sys.stderr)
+        return 2
+    # imported here, so the module can be imported without the server dependencies installed
+    import uvicorn  # pylint: disable=import-outside-toplevel
+
+    options = uvicorn_options(server_settings)
+    created_metrics_dir = None
+    if options["workers"] > 1 and "METRICS_MULTIPROCESS_DIR" not in os.environ:
+        # let `/metrics` of any worker report the metrics of all of them
+        created_metrics_dir = tempfile.mkdtemp(prefix="files-api-metrics-")
+        os.environ["METRICS_MULTIPROCESS_DIR"] = created_metrics_dir
+    if options["workers"] > 1 and Settings().listing_index_enabled:
+        print(
+            f"warning: each of the {options['workers']} workers keeps its own listing index, so `GET /files` may"
+            " miss the files written through the other workers until the index is next reconciled with the bucket",
+            file=sys.stderr,
+        )
+
+    try:
+        uvicorn.run(APP_FACTORY, **options)
+    finally:
+        if created_metrics_dir is not None:
+            shutil.rmtree(created_metrics_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
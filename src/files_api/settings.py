@@ -1,14 +1,144 @@
+from typing import (
+    Literal,
+    Optional,
+)
+
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+MiB = 1024 * 1024
+
+# S3 rejects multipart uploads whose parts (other than the last one) are smaller than this
+S3_MIN_PART_SIZE_BYTES = 5 * MiB
+
+# S3 assembles multipart uploads of at most this many parts, into objects of at most 5 TiB
+S3_MAX_PARTS = 10_000
+S3_MAX_OBJECT_SIZE_BYTES = 5 * 1024 * 1024 * MiB
+
+# presigned URLs signed with SigV4 are valid for at most 7 days
+PRESIGNED_URL_MAX_EXPIRATION_SECONDS = 7 * 24 * 60 * 60
+
 class Settings(BaseSettings):
     """
     Settings for the files API.
 
     Attributes:
         s3_bucket_name: The name of the S3 bucket to use for storing files.
+        s3_max_pool_connections: Maximum number of pooled HTTP connections kept by the shared S3 client.
+        s3_connect_timeout_seconds: Seconds to wait when opening a new connection to S3.
+        s3_read_timeout_seconds: Seconds to wait for S3 to send data on an open connection.
+        s3_tcp_keepalive: Whether to enable TCP keep-alive on pooled S3 connections.
+        s3_max_concurrency: Maximum number of S3 calls a worker runs at once on its S3 thread pool.
+        s3_warm_up_connections: Number of S3 connections opened when a worker starts, before it serves requests.
+        s3_max_attempts: Maximum number of attempts of an S3 call, the first one included.
+        s3_call_timeout_seconds: Seconds after which an S3 call is no longer retried nor waits for the rate limiter.
+        s3_max_request_rate: Maximum rate of S3 calls per second of a worker, which it lowers when S3 throttles.
+        s3_min_request_rate: Rate of S3 calls per second a worker keeps, however much S3 throttles.
+        s3_retry_budget_ratio: Fraction of S3 calls that may be retried.
+        s3_retry_budget_max_retries: Retries kept in the retry budget for bursts of failed S3 calls.
+        s3_circuit_breaker_failure_threshold: Number of failed S3 calls in a row after which calls fail fast.
+        s3_circuit_breaker_reset_seconds: Seconds S3 calls fail fast before one is let through to check on S3.
+        multipart_part_size_bytes: Size of each part of a multipart upload; smaller files are sent with one PUT.
+        multipart_max_concurrency: Maximum number of parts of a single upload sent to S3 at the same time.
+        metadata_cache_max_entries: Maximum number of objects whose metadata is cached; 0 disables the cache.
+        metadata_cache_ttl_seconds: Seconds before cached metadata is looked up again in S3.
+        listing_index_enabled: Whether to serve `GET /files` from an in-memory index of the bucket's keys.
+        listing_index_reconcile_interval_seconds: Seconds between full scans reconciling the index with the bucket.
+            Each worker keeps its own index, which only sees the files written or deleted through the other
+            workers, or directly in the bucket, at its next scan; with several workers, listings may lag by
+            up to this long.
+        batch_max_concurrency: Maximum number of S3 calls in flight at once for a single batch request.
+        archive_prefetch_objects: Number of objects opened ahead of the one being written into a ZIP archive.
+        disk_cache_dir: Local directory to cache the bodies of downloaded files in; None disables the disk cache.
+        disk_cache_max_bytes: Maximum total size of the file bodies kept in the disk cache.
+        disk_cache_max_object_bytes: Files larger than this are never stored in the disk cache.
+        dedup_enabled: Whether to copy uploaded content already in the bucket server-side instead of uploading it again.
+        dedup_index_max_entries: Maximum number of content digests remembered for deduplication.
+        compression_enabled: Whether to store uploaded files of compressible content types gzipped.
+        compression_content_types: MIME types to compress; "text/*" matches every subtype of "text".
+        compression_level: gzip compression level, from 1 (fastest) to 9 (smallest).
+        metrics_multiprocess_dir: Directory where each worker publishes its metrics, so `/metrics` merges them all.
+        metrics_publish_interval_seconds: Seconds between two publications of a worker's metrics.
+        profiling_header_enabled: Whether requests sent with an `X-Profile` header are profiled.
+        profiling_sample_rate: Fraction of all requests profiled, from 0 (none) to 1 (all).
+        profiling_max_stored_profiles: Number of the most recent request profiles kept for `/debug/profiles`.
+        presigned_downloads_enabled: Whether `GET /files/{file_path}` redirects to a presigned S3 URL by default.
+        presigned_url_expiration_seconds: Seconds the presigned download and upload URLs stay valid for.
+        single_flight_enabled: Whether concurrent identical metadata lookups and downloads share one S3 call.
+        single_flight_max_body_bytes: Largest body, or byte range, of a file whose download is shared in memory.
         model_config: Configuration for the settings.
     """
 
     s3_bucket_name: str = Field(...)
-    model_config = SettingsConfigDict(case_sensitive=False)
\ No newline at end of file
+    s3_max_pool_connections: int = Field(default=50, ge=1)
+    s3_connect_timeout_seconds: float = Field(default=5.0, gt=0)
+    s3_read_timeout_seconds: float = Field(default=60.0, gt=0)
+    s3_tcp_keepalive: bool = Field(default=True)
+    s3_max_concurrency: int = Field(default=32, ge=1)
+    s3_warm_up_connections: int = Field(default=4, ge=0)
+    s3_max_attempts: int = Field(default=3, ge=1)
+    s3_call_timeout_seconds: float = Field(default=30.0, gt=0)
+    s3_max_request_rate: float = Field(default=1000.0, gt=0)
+    s3_min_request_rate: float = Field(default=1.0, gt=0)
+    s3_retry_budget_ratio: float = Field(default=0.1, ge=0, le=1)
+    s3_retry_budget_max_retries: int = Field(default=10, ge=0)
+    s3_circuit_breaker_failure_threshold: int = Field(default=5, ge=1)
+    s3_circuit_breaker_reset_seconds: float = Field(default=10.0, gt=0)
+    multipart_part_size_bytes: int = Field(default=8 * MiB, ge=S3_MIN_PART_SIZE_BYTES)
+    multipart_max_concurrency: int = Field(default=4, ge=1)
+    metadata_cache_max_entries: int = Field(default=10_000, ge=0)
+    metadata_cache_ttl_seconds: float = Field(default=30.0, gt=0)
+    listing_index_enabled: bool = Field(default=False)
+    listing_index_reconcile_interval_seconds: float = Field(default=300.0, gt=0)
+    batch_max_concurrency: int = Field(default=8, ge=1)
+    archive_prefetch_objects: int = Field(default=4, ge=0)
+    disk_cache_dir: Optional[str] = Field(default=None)
+    disk_cache_max_bytes: int = Field(default=1024 * MiB, ge=0)
+    disk_cache_max_object_bytes: int = Field(default=64 * MiB, ge=0)
+    dedup_enabled: bool = Field(default=False)
+    dedup_index_max_entries: int = Field(default=100_000, ge=1)
+    compression_enabled: bool = Field(default=False)
+    compression_content_types: list[str] = Field(
+        default=["text/*", "application/json", "application/x-ndjson", "application/xml", "application/csv"]
+    )
+    compression_level: int = Field(default=6, ge=1, le=9)
+    metrics_multiprocess_dir: Optional[str] = Field(default=None)
+    metrics_publish_interval_seconds: float = Field(default=5.0, gt=0)
+    profiling_header_enabled: bool = Field(default=False)
+    profiling_sample_rate: float = Field(default=0.0, ge=0, le=1)
+    profiling_max_stored_profiles: int = Field(default=100, ge=1)
+    presigned_downloads_enabled: bool = Field(default=False)
+    presigned_url_expiration_seconds: int = Field(default=300, ge=1, le=PRESIGNED_URL_MAX_EXPIRATION_SECONDS)
+    single_flight_enabled: bool = Field(default=True)
+    single_flight_max_body_bytes: int = Field(default=1 * MiB, ge=0)
+    model_config = SettingsConfigDict(case_sensitive=False)
+
+
+class ServerSettings(BaseSettings):
+    """
+    Settings for the production server started by the `files-api` command, read from `SERVER_*` variables.
+
+    Attributes:
+        host: The interface to listen on.
+        port: The port to listen on.
+        workers: Number of worker processes; None starts one per CPU core available to the process.
+        loop: The event loop; "auto" picks uvloop if it is installed.
+        http: The HTTP/1.1 implementation; "auto" picks httptools if it is installed.
+        backlog: Maximum number of connections waiting to be accepted.
+        timeout_keep_alive_seconds: Seconds an idle keep-alive connection stays open. Behind a load balancer,
+            this must exceed the load balancer's own idle timeout (60 seconds on AWS), or it may reuse a
+            connection the server is closing.
+        timeout_graceful_shutdown_seconds: Seconds a worker told to stop waits for in-flight requests, e.g.
+            long downloads, before closing their connections.
+        model_config: Configuration for the settings.
+    """
+
+    host: str = Field(default="0.0.0.0")
+    port: int = Field(default=8000, ge=0, le=65535)
+    workers: Optional[int] = Field(default=None, ge=1)
+    loop: Literal["auto", "asyncio", "uvloop"] = Field(default="auto")
+    http: Literal["auto", "h11", "httptools"] = Field(default="auto")
+    backlog: int = Field(default=2048, ge=1)
+    timeout_keep_alive_seconds: int = Field(default=65, ge=1)
+    timeout_graceful_shutdown_seconds: int = Field(default=30, ge=0)
+    model_config = SettingsConfigDict(case_sensitive=False, env_prefix="SERVER_")
@@ -0,0 +1,159 @@
+"""
+Coalescing of concurrent identical S3 reads, so a burst of requests for the same hot object makes one S3 call.
+
+A read is identified by its operation, bucket, key and byte range. A read made while an identical one is in
+flight waits for that one and shares its outcome, result or error, instead of calling S3 again.
+"""
+
+import asyncio
+import io
+from collections import defaultdict
+from functools import partial
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Hashable,
+    Optional,
+    TypeVar,
+)
+
+from botocore.response import StreamingBody
+
+from files_api.resilience import (
+    S3DeadlineExceededError,
+    copy_context_without_request_deadline,
+    request_time_left,
+)
+from files_api.s3.executor import S3Executor
+from files_api.s3.read_objects import fetch_s3_object
+
+try:
+    from mypy_boto3_s3 import S3Client
+    from mypy_boto3_s3.type_defs import GetObjectOutputTypeDef
+except ImportError:
+    ...
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Runs at most one call at a time per key, the other callers of the same key sharing its outcome.
+
+    Keys are tuples starting with the name of the operation, which the counters are reported by. The call runs
+    in its own task, so a caller that is cancelled, e.g. because its client disconnected, does not cancel the
+    call the other callers wait for.
+
+    The task runs in a copy of the context of the caller that made the call, whose profile, if it is profiled,
+    records the call. The deadline of that caller's request is left out of it, so the call is not cut short for
+    the callers joining it; every caller instead stops waiting for the call at the deadline of its own request.
+    """
+
+    def __init__(self):
+        self._calls: dict[tuple[Hashable, ...], asyncio.Future] = {}
+        self._counts: defaultdict[str, dict[str, int]] = defaultdict(lambda: {"calls": 0, "coalesced": 0})
+
+    async def do(
+        self,
+        key: tuple[Hashable, ...],
+        call: Callable[[], Awaitable[T]],
+        on_abandoned: Optional[Callable[[T], None]] = None,
+    ) -> tuple[T, bool]:
+        """
+        Run `call`, unless a call with the same key is in flight, in which case wait for that one instead.
+
+        :param on_abandoned: Called with the result of the call if the caller that made it stops waiting for
+            it, e.g. to release a resource in the result only that caller would have used.
+
+        :return: The result of the call, and whether this caller made it rather than joining one in flight.
+        """
+        operation = str(key[0])
+        future = self._calls.get(key)
+        made_call = future is None
+        if future is None:
+            future = copy_context_without_request_deadline().run(asyncio.ensure_future, call())
+            self._calls[key] = future
+            future.add_done_callback(lambda _: self._forget(key, future))
+            self._counts[operation]["calls"] += 1
+        else:
+            self._counts[operation]["coalesced"] += 1
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout=request_time_left())
+        except (asyncio.CancelledError, asyncio.TimeoutError) as err:
+            if made_call and on_abandoned is not None:
+                future.add_done_callback(partial(self._abandon, on_abandoned))
+            if isinstance(err, asyncio.TimeoutError):
+                raise S3DeadlineExceededError("The shared S3 call did not complete before the deadline") from None
+            raise
+        return result, made_call
+
+    def stats(self) -> dict:
+        """Report, per operation, the calls made, the calls coalesced into them, and the calls in flight."""
+        in_flight: defaultdict[str, int] = defaultdict(int)
+        for key in self._calls:
+            in_flight[str(key[0])] += 1
+        return {
+            operation: {**counts, "in_flight": in_flight[operation]} for operation, counts in self._counts.items()
+        }
+
+    @staticmethod
+    def _abandon(on_abandoned: Callable[[Any], None], future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is None:
+            on_abandoned(future.result())
+
+    def _forget(self, key: tuple[Hashable, ...], future: asyncio.Future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        # the error is raised to the callers, if any are left, so it need not be logged as never retrieved
+        if not future.cancelled():
+            future.exception()
+
+
+async def fetch_s3_object_coalesced(
+    bucket_name: str,
+    object_key: str,
+    s3_client: "S3Client",
+    s3_executor: S3Executor,
+    single_flight: SingleFlight,
+    max_shared_body_bytes: int,
+    byte_range: Optional[str] = None,
+) -> "GetObjectOutputTypeDef":
+    """
+    Fetch an object, or a byte range of it, sharing the download with the identical fetches in flight.
+
+    Bodies of at most `max_shared_body_bytes` are read into memory and handed to every caller. A larger body
+    can only be streamed once, by the caller that fetched it; the others fetch the object again themselves.
+    If the caller that fetched it stops waiting, the body is closed, releasing its pooled connection.
+
+    :return: The `get_object` response, with a body of its own for each caller.
+    """
+
+    async def fetch() -> tuple[Any, Optional[bytes]]:
+        response = await s3_executor.run(
+            fetch_s3_object, bucket_name, object_key=object_key, s3_client=s3_client, byte_range=byte_range
+        )
+        if response["ContentLength"] > max_shared_body_bytes:
+            return response, None
+        try:
+            content = await s3_executor.run(response["Body"].read)
+        finally:
+            response["Body"].close()
+        return response, content
+
+    def close_unshared_body(result: tuple[Any, Optional[bytes]]) -> None:
+        # nobody else streams a body that was not read into memory
+        response, content = result
+        if content is None:
+            response["Body"].close()
+
+    (response, content), made_call = await single_flight.do(
+        ("get_object", bucket_name, object_key, byte_range), fetch, on_abandoned=close_unshared_body
+    )
+    if content is not None:
+        return {**response, "Body": StreamingBody(io.BytesIO(content), len(content))}
+    if made_call:
+        return response
+    return await s3_executor.run(
+        fetch_s3_object, bucket_name, object_key=object_key, s3_client=s3_client, byte_range=byte_range
+    )
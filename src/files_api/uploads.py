@@ -0,0 +1,346 @@
+"""Stream uploaded files into S3 without holding the whole file in memory."""
+
+import asyncio
+from dataclasses import dataclass
+from datetime import (
+    datetime,
+    timezone,
+)
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Optional,
+)
+
+from botocore.exceptions import ClientError
+from fastapi import UploadFile
+
+from files_api.compression import (
+    GZIP_CONTENT_ENCODING,
+    UNCOMPRESSED_SIZE_METADATA_KEY,
+    gzip_chunks,
+    is_compressible,
+)
+from files_api.dedup import (
+    DIGEST_METADATA_KEY,
+    DedupIndex,
+    StoredContent,
+    hash_file,
+    store_duplicate_content,
+)
+from files_api.listing_index import ListingIndex
+from files_api.metadata_cache import (
+    MetadataCache,
+    lookup_object_metadata,
+)
+from files_api.s3.executor import S3Executor
+from files_api.s3.read_objects import (
+    OBJECT_NOT_FOUND_ERROR_CODE,
+    fetch_s3_object_metadata,
+)
+from files_api.s3.write_objects import (
+    PRECONDITION_FAILED_ERROR_CODE,
+    abort_multipart_upload,
+    complete_multipart_upload,
+    create_multipart_upload,
+    upload_part,
+    upload_s3_object,
+)
+from files_api.settings import Settings
+
+try:
+    from mypy_boto3_s3 import S3Client
+except ImportError:
+    ...
+
+# single-part uploads up to this size are written with `If-None-Match: *` without looking the object up first
+CONDITIONAL_PUT_MAX_BYTES = 64 * 1024
+
+
+@dataclass(frozen=True)
+class UploadedObject:
+    """The outcome of an upload to S3."""
+
+    size_bytes: int
+    etag: str
+    # whether the upload replaced an existing object rather than creating a new one
+    replaced: bool
+
+
+async def iter_upload_file(file: UploadFile, chunk_size: int) -> AsyncIterator[bytes]:
+    """Read an uploaded file in chunks of at most `chunk_size` bytes."""
+    while chunk := await file.read(chunk_size):
+        yield chunk
+
+
+async def iter_parts(chunks: AsyncIterator[bytes], part_size: int) -> AsyncIterator[bytes]:
+    """Regroup a stream of chunks into parts of exactly `part_size` bytes; only the last part may be smaller."""
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= part_size:
+            yield bytes(buffer[:part_size])
+            del buffer[:part_size]
+    if buffer:
+        yield bytes(buffer)
+
+
+async def object_exists(bucket_name: str, object_key: str, s3_client: "S3Client", s3_executor: S3Executor) -> bool:
+    """Tell whether an object exists, with one `head_object` call."""
+    try:
+        await s3_executor.run(fetch_s3_object_metadata, bucket_name, object_key=object_key, s3_client=s3_client)
+    except ClientError as err:
+        if err.response.get("Error", {}).get("Code") != OBJECT_NOT_FOUND_ERROR_CODE:
+            raise
+        return False
+    return True
+
+
+async def upload_stream_to_s3(
+    chunks: AsyncIterator[bytes],
+    bucket_name: str,
+    object_key: str,
+    s3_client: "S3Client",
+    s3_executor: S3Executor,
+    part_size: int,
+    max_concurrency: int,
+    content_type: Optional[str] = None,
+    known_to_exist: bool = False,
+    metadata: Optional[dict[str, str]] = None,
+    content_encoding: Optional[str] = None,
+) -> UploadedObject:
+    """
+    Upload a stream of bytes to S3, using a parallel multipart upload when it spans more than one part.
+
+    A stream that fits in a single part is sent with one `put_object`. Larger streams are cut into
+    `part_size` parts, up to `max_concurrency` of which are uploaded at the same time. A part is only
+    read from the stream once an upload slot is free, so at most `max_concurrency + 1` parts are held
+    in memory regardless of the size of the stream. If anything fails, the multipart upload is aborted.
+
+    Unless the object is known to exist, it is first written with `If-None-Match: *`: S3 then tells
+    whether the object is new, and only replacing an existing object takes a second, unconditional write.
+    For a multipart upload, only `complete_multipart_upload` is sent twice. A single part, though, would be
+    sent twice in full, so above `CONDITIONAL_PUT_MAX_BYTES` a `head_object` call first tells whether the
+    object exists: new objects pay for one more round trip, but replaced ones are never uploaded twice.
+
+    :param chunks: The content to upload.
+    :param bucket_name: The name of the S3 bucket.
+    :param object_key: path to the object in the S3 bucket.
+    :param s3_client: The S3 client to upload with.
+    :param s3_executor: The executor running the blocking S3 calls.
+    :param part_size: Size of each part of a multipart upload, at least 5 MiB.
+    :param max_concurrency: Maximum number of parts uploaded at the same time.
+    :param content_type: The MIME type of the file, e.g. "text/plain" for a text file.
+    :param known_to_exist: Whether the object is known to exist already, e.g. from cached metadata.
+    :param metadata: Optional user-defined metadata to store with the object.
+    :param content_encoding: Optional coding the chunks are in, e.g. "gzip".
+
+    :return: The size and ETag of the uploaded object, and whether it replaced an existing object.
+    """
+
+    async def write_object(write: Callable[..., str], **kwargs: Any) -> tuple[str, bool]:
+        if known_to_exist:
+            return await s3_executor.run(write, **kwargs), True
+        try:
+            return await s3_executor.run(write, if_none_match="*", **kwargs), False
+        except ClientError as err:
+            if err.response.get("Error", {}).get("Code") != PRECONDITION_FAILED_ERROR_CODE:
+                raise
+        return await s3_executor.run(write, **kwargs), True
+
+    parts = iter_parts(chunks, part_size)
+    first_part = await anext(parts, b"")
+    second_part = await anext(parts, None)
+
+    # fast path: the whole stream fits in a single part
+    if second_part is None:
+        if not known_to_exist and len(first_part) > CONDITIONAL_PUT_MAX_BYTES:
+            known_to_exist = await object_exists(bucket_name, object_key, s3_client, s3_executor)
+        etag, replaced = await write_object(
+            upload_s3_object,
+            bucket_name=bucket_name,
+            object_key=object_key,
+            file_content=first_part,
+            content_type=content_type,
+            metadata=metadata,
+            content_encoding=content_encoding,
+            s3_client=s3_client,
+        )
+        return UploadedObject(size_bytes=len(first_part), etag=etag, replaced=replaced)
+
+    upload_id = await s3_executor.run(
+        create_multipart_upload,
+        bucket_name=bucket_name,
+        object_key=object_key,
+        content_type=content_type,
+        metadata=metadata,
+        content_encoding=content_encoding,
+        s3_client=s3_client,
+    )
+    upload_slots = asyncio.Semaphore(max_concurrency)
+    part_uploads: list[asyncio.Task[str]] = []
+
+    async def send_part(part_number: int, part_content: bytes) -> str:
+        try:
+            return await s3_executor.run(
+                upload_part,
+                bucket_name=bucket_name,
+                object_key=object_key,
+                upload_id=upload_id,
+                part_number=part_number,
+                part_content=part_content,
+                s3_client=s3_client,
+            )
+        finally:
+            upload_slots.release()
+
+    try:
+        read_ahead: list[bytes] = [first_part, second_part]
+        part_number = 0
+        size_bytes = 0
+        while True:
+            # wait for a free slot *before* reading the next part to bound memory
+            await upload_slots.acquire()
+            part_content = read_ahead.pop(0) if read_ahead else await anext(parts, None)
+            if part_content is None:
+                upload_slots.release()
+                break
+            # stop reading early when a part has already failed
+            for part_upload in part_uploads:
+                if part_upload.done() and part_upload.exception() is not None:
+                    raise part_upload.exception()  # type: ignore[misc]
+            part_number += 1
+            size_bytes += len(part_content)
+            part_uploads.append(asyncio.create_task(send_part(part_number, part_content)))
+
+        part_etags = await asyncio.gather(*part_uploads)
+        etag, replaced = await write_object(
+            complete_multipart_upload,
+            bucket_name=bucket_name,
+            object_key=object_key,
+            upload_id=upload_id,
+            part_etags=part_etags,
+            s3_client=s3_client,
+        )
+        return UploadedObject(size_bytes=size_bytes, etag=etag, replaced=replaced)
+    except BaseException:
+        for part_upload in part_uploads:
+            part_upload.cancel()
+        await asyncio.gather(*part_uploads, return_exceptions=True)
+        await s3_executor.run(
+            abort_multipart_upload,
+            bucket_name=bucket_name,
+            object_key=object_key,
+            upload_id=upload_id,
+            s3_client=s3_client,
+        )
+        raise
+
+
+async def index_stored_file(
+    bucket_name: str,
+    object_key: str,
+    s3_client: "S3Client",
+    s3_executor: S3Executor,
+    metadata_cache: MetadataCache,
+    listing_index: ListingIndex,
+) -> None:
+    """
+    Record a file just written in the listing index, as S3 lists it.
+
+    Neither `put_object` nor `complete_multipart_upload` tell when S3 considers the object last modified, so the
+    file is looked up: the index then lists the same size and time as S3 would, and the lookup is cached.
+    """
+    object_metadata = await lookup_object_metadata(
+        bucket_name=bucket_name,
+        object_key=object_key,
+        s3_client=s3_client,
+        s3_executor=s3_executor,
+        metadata_cache=metadata_cache,
+    )
+    if object_metadata.exists:
+        listing_index.upsert(
+            object_key,
+            size_bytes=object_metadata.size_bytes,
+            last_modified=object_metadata.last_modified or datetime.now(timezone.utc),
+        )
+
+
+async def store_uploaded_file(
+    file: UploadFile,
+    file_path: str,
+    settings: Settings,
+    s3_client: "S3Client",
+    s3_executor: S3Executor,
+    metadata_cache: MetadataCache,
+    listing_index: Optional[ListingIndex],
+    dedup_index: Optional[DedupIndex] = None,
+) -> bool:
+    """
+    Stream an uploaded file to S3 and keep the metadata cache and listing index up to date.
+
+    With a deduplication index, content that is already in the bucket is copied server-side instead of uploaded.
+    With compression enabled, files of compressible content types are stored gzipped.
+
+    :return: Whether the upload replaced an existing file.
+    """
+    s3_bucket_name = settings.s3_bucket_name
+    chunks = iter_upload_file(file, chunk_size=settings.multipart_part_size_bytes)
+    metadata: dict[str, str] = {}
+    content_encoding = None
+    if settings.compression_enabled and is_compressible(file.content_type, settings.compression_content_types):
+        chunks = gzip_chunks(chunks, level=settings.compression_level)
+        content_encoding = GZIP_CONTENT_ENCODING
+        # Starlette has already spooled the whole upload, so its size is known up front
+        metadata[UNCOMPRESSED_SIZE_METADATA_KEY] = str(file.size)
+
+    if dedup_index is not None:
+        # Starlette has already spooled the whole upload, so it is hashed before anything is sent to S3
+        digest, size_bytes = await asyncio.to_thread(hash_file, file.file)
+        object_already_exists = await store_duplicate_content(
+            bucket_name=s3_bucket_name,
+            object_key=file_path,
+            digest=digest,
+            size_bytes=size_bytes,
+            content_type=file.content_type,
+            content_encoding=content_encoding,
+            s3_client=s3_client,
+            s3_executor=s3_executor,
+            metadata_cache=metadata_cache,
+            dedup_index=dedup_index,
+        )
+        if object_already_exists is not None:
+            if listing_index is not None:
+                await index_stored_file(
+                    s3_bucket_name, file_path, s3_client, s3_executor, metadata_cache, listing_index
+                )
+            return object_already_exists
+        metadata[DIGEST_METADATA_KEY] = digest
+
+    # The upload itself tells whether the file already existed, unless the cache already knows it does
+    cached_metadata = metadata_cache.get(s3_bucket_name, file_path)
+
+    # Stream the file contents to S3 part by part instead of reading the whole file into memory
+    uploaded_object = await upload_stream_to_s3(
+        chunks=chunks,
+        bucket_name=s3_bucket_name,
+        object_key=file_path,
+        content_type=file.content_type,
+        s3_client=s3_client,
+        s3_executor=s3_executor,
+        part_size=settings.multipart_part_size_bytes,
+        max_concurrency=settings.multipart_max_concurrency,
+        known_to_exist=cached_metadata is not None and cached_metadata.exists,
+        metadata=metadata or None,
+        content_encoding=content_encoding,
+    )
+    # Forget the metadata of the replaced file, if any, which the next lookup would otherwise return
+    metadata_cache.invalidate(s3_bucket_name, file_path)
+    if listing_index is not None:
+        await index_stored_file(s3_bucket_name, file_path, s3_client, s3_executor, metadata_cache, listing_index)
+    if dedup_index is not None:
+        stored_content = StoredContent(file_path, uploaded_object.etag, content_encoding)
+        dedup_index.put(s3_bucket_name, metadata[DIGEST_METADATA_KEY], stored_content)
+
+    return uploaded_object.replaced
@@ -20,4 +20,5 @@ pytest_plugins = [
     # e.g. "tests/fixtures/mocked_aws.py" should be registered as:
     "tests.fixtures.mocked_aws",
     "tests.fixtures.api_client",
+    "tests.fixtures.s3_calls",
 ]
@@ -1,16 +1,28 @@
 import pytest
+from contextlib import ExitStack
 from fastapi.testclient import TestClient
-from typing import Generator
+from typing import Callable, Generator
 from files_api.settings import Settings
 from files_api.main import create_app
 from tests.consts import TEST_BUCKET_NAME
 
+# builds a test client of an app whose settings are the test settings with the given overrides
+MakeClient = Callable[..., TestClient]
+
+
+# Fixture building FastAPI test clients of apps configured with non-default settings, shut down after the test
+@pytest.fixture
+def make_client(mocked_aws) -> Generator[MakeClient, None, None]:  # pylint: disable=unused-argument
+    with ExitStack() as clients:
+
+        def make(**settings_overrides) -> TestClient:
+            settings: Settings = Settings(**{"s3_bucket_name": TEST_BUCKET_NAME, **settings_overrides})
+            return clients.enter_context(TestClient(create_app(settings=settings)))
+
+        yield make
 
 
 # Fixture for FastAPI test client
 @pytest.fixture
-def client(mocked_aws) -> Generator[TestClient, None, None]:  # pylint: disable=unused-argument
-    settings: Settings = Settings(s3_bucket_name=TEST_BUCKET_NAME)
-    app = create_app(settings=settings)
-    with TestClient(app) as client:
-        yield client
+def client(make_client: MakeClient) -> TestClient:
+    return make_client()
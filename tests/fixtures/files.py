@@ -0,0 +1,24 @@
+from typing import (
+    AsyncIterator,
+    Iterable,
+    Mapping,
+    Union,
+)
+
+import boto3
+
+from tests.consts import TEST_BUCKET_NAME
+
+
+def put_files(files: Union[Iterable[str], Mapping[str, bytes]]) -> None:
+    """Put objects straight into the test bucket, holding the given contents, or b"content" when only keys are given."""
+    s3_client = boto3.client("s3")
+    contents = files if isinstance(files, Mapping) else dict.fromkeys(files, b"content")
+    for object_key, content in contents.items():
+        s3_client.put_object(Bucket=TEST_BUCKET_NAME, Key=object_key, Body=content)
+
+
+async def as_chunks(content: bytes, chunk_size: int) -> AsyncIterator[bytes]:
+    """Stream content in chunks of `chunk_size` bytes, as an upload or a download would."""
+    for start in range(0, len(content), chunk_size):
+        yield content[start : start + chunk_size]
@@ -0,0 +1,28 @@
+import time
+from collections import Counter
+
+from fastapi.testclient import TestClient
+from pytest import fixture
+
+
+def count_s3_calls(client: TestClient, delay_seconds: float = 0) -> Counter:
+    """
+    Count the S3 operations made by the app's shared S3 client, by operation name, from now on.
+
+    A delay makes every call that much slower, e.g. so that concurrent requests overlap.
+    """
+    calls: Counter = Counter()
+
+    def count(model, **kwargs):
+        calls[model.name] += 1
+        if delay_seconds:
+            time.sleep(delay_seconds)
+
+    client.app.state.s3_client.meta.events.register("before-call.s3", count)
+    return calls
+
+
+# Fixture counting the S3 calls made while handling the requests sent with the `client` fixture
+@fixture
+def s3_calls(client: TestClient) -> Counter:
+    return count_s3_calls(client)
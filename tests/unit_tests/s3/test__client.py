@@ -0,0 +1,52 @@
+"""Test cases for `s3.client`."""
+
+import boto3
+import pytest
+from fastapi.testclient import TestClient
+
+from files_api.s3.client import create_s3_client
+from files_api.settings import Settings
+from tests.consts import TEST_BUCKET_NAME
+from tests.fixtures.api_client import MakeClient
+
+
+def test__create_s3_client__uses_pool_settings(mocked_aws: None):
+    settings = Settings(
+        s3_bucket_name=TEST_BUCKET_NAME,
+        s3_max_pool_connections=7,
+        s3_connect_timeout_seconds=2,
+        s3_read_timeout_seconds=3,
+        s3_tcp_keepalive=False,
+    )
+    s3_client = create_s3_client(settings)
+
+    assert s3_client.meta.config.max_pool_connections == 7
+    assert s3_client.meta.config.connect_timeout == 2
+    assert s3_client.meta.config.read_timeout == 3
+    assert s3_client.meta.config.tcp_keepalive is False
+
+
+def test__routes__use_shared_s3_client(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    # any fallback to a per-call client would now blow up
+    def fail(*args, **kwargs):
+        raise AssertionError("routes must use the shared S3 client")
+
+    monkeypatch.setattr(boto3, "client", fail)
+
+    response = client.put("/files/test.txt", files={"file": ("test.txt", b"content", "text/plain")})
+    assert response.status_code == 201
+    assert client.get("/files/test.txt").content == b"content"
+    assert client.head("/files/test.txt").status_code == 200
+    assert client.get("/files").status_code == 200
+    assert client.delete("/files/test.txt").status_code == 204
+
+
+def test__warm_up__runs_before_the_first_request(make_client: MakeClient):
+    client = make_client(s3_warm_up_connections=3)
+    lines = client.get("/metrics").text.splitlines()
+    assert 'files_api_s3_request_duration_seconds_count{operation="HeadBucket",status="200"} 4' in lines
+
+
+def test__warm_up__failure_does_not_stop_the_app(make_client: MakeClient):
+    client = make_client(s3_bucket_name="no-such-bucket")
+    assert client.get("/files/test.txt").status_code == 500
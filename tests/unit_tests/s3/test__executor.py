@@ -0,0 +1,61 @@
+"""Test cases for `s3.executor`."""
+
+import asyncio
+import io
+import threading
+import time
+
+from botocore.response import StreamingBody
+
+from files_api.s3.executor import S3Executor
+
+
+def test__run__does_not_block_event_loop():
+    executor = S3Executor(max_concurrency=4)
+
+    async def main() -> float:
+        started = time.perf_counter()
+        # four blocking "S3 calls" of 0.2s each run side by side on the pool
+        await asyncio.gather(*(executor.run(time.sleep, 0.2) for _ in range(4)))
+        return time.perf_counter() - started
+
+    elapsed = asyncio.run(main())
+    executor.shutdown()
+    assert elapsed < 0.6
+
+
+def test__run__caps_concurrency():
+    executor = S3Executor(max_concurrency=2)
+    lock = threading.Lock()
+    in_flight = 0
+    peak = 0
+
+    def blocking_call() -> None:
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight -= 1
+
+    async def main() -> None:
+        await asyncio.gather(*(executor.run(blocking_call) for _ in range(8)))
+
+    asyncio.run(main())
+    executor.shutdown()
+    assert peak == 2
+
+
+def test__iter_body__streams_and_closes_body():
+    executor = S3Executor(max_concurrency=1)
+    content = b"x" * 10 + b"y" * 5
+    body = StreamingBody(io.BytesIO(content), len(content))
+
+    async def main() -> list[bytes]:
+        return [chunk async for chunk in executor.iter_body(body, chunk_size=10)]
+
+    chunks = asyncio.run(main())
+    executor.shutdown()
+    assert chunks == [b"x" * 10, b"y" * 5]
+    assert body._raw_stream.closed
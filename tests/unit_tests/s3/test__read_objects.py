@@ -3,6 +3,7 @@
 import boto3
 
 from files_api.s3.read_objects import (
+    fetch_s3_directory_page,
     fetch_s3_objects_metadata,
     fetch_s3_objects_using_page_token,
     object_exists_in_s3,
@@ -127,4 +128,23 @@ def test_directory_queries(mocked_aws: None):
     assert files[2].get("Key") == "folder1/file2.txt"
     assert files[3].get("Key") == "folder2/file3.txt"
     assert files[4].get("Key") == "folder2/subfolder1/file4.txt"
-    assert next_page_token is None
\ No newline at end of file
+    assert next_page_token is None
+
+
+def test_directory_page(mocked_aws: None):
+    s3_client = boto3.client("s3", region_name="us-east-1")
+    for key in ["photos/a.jpg", "photos/2023/x.jpg", "photos/2023/deep/y.jpg", "photos/2024/z.jpg", "photos/b.jpg"]:
+        s3_client.put_object(Bucket=TEST_BUCKET_NAME, Key=key, Body=b"content")
+
+    # each subdirectory counts as a single key, however many keys are below it
+    files, directories, next_continuation_token = fetch_s3_directory_page(TEST_BUCKET_NAME, "photos/", max_keys=3)
+    assert [file["Key"] for file in files] == ["photos/a.jpg"]
+    assert directories == ["photos/2023/", "photos/2024/"]
+    assert next_continuation_token is not None
+
+    files, directories, next_continuation_token = fetch_s3_directory_page(
+        TEST_BUCKET_NAME, "photos/", max_keys=3, continuation_token=next_continuation_token
+    )
+    assert [file["Key"] for file in files] == ["photos/b.jpg"]
+    assert directories == []
+    assert next_continuation_token is None
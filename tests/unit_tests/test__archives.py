@@ -0,0 +1,98 @@
+"""Test cases for `archives`."""
+
+import io
+import zipfile
+
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api.archives import (
+    ZipStreamSink,
+    archive_base_path,
+    archive_entry_name,
+    archive_filename,
+)
+from tests.fixtures.files import put_files
+
+
+def test__archive_naming():
+    assert archive_base_path("photos/2024/") == "photos/2024/"
+    assert archive_base_path("photos/20") == "photos/"
+    assert archive_base_path("photos") == ""
+    assert archive_filename("photos/2024/") == "2024.zip"
+    assert archive_filename("photos") == "photos.zip"
+    assert archive_filename("/") == "archive.zip"
+
+
+def test__archive_entry_name():
+    assert archive_entry_name("photos/2024/a.jpg", "photos/") == "2024/a.jpg"
+    assert archive_entry_name("photos//etc/./a.jpg", "photos/") == "etc/a.jpg"
+    assert archive_entry_name("photos/sub\\a.jpg", "photos/") == "sub/a.jpg"
+    assert archive_entry_name("photos/../../a.jpg", "photos/") is None
+    assert archive_entry_name("photos/..\\a.jpg", "photos/") is None
+    assert archive_entry_name("photos//", "photos/") is None
+
+
+def test__zip_stream_sink__is_not_seekable():
+    sink = ZipStreamSink()
+    with zipfile.ZipFile(sink, mode="w") as archive:
+        archive.writestr("a.txt", b"a")
+        assert archive._seekable is False  # pylint: disable=protected-access
+    data = sink.pop()
+    assert sink.pop() == b""
+    assert zipfile.ZipFile(io.BytesIO(data)).read("a.txt") == b"a"
+
+
+def test__download_directory_archive(client: TestClient):
+    big_content = bytes(range(256)) * 1024
+    put_files(
+        {
+            "folder/a.txt": b"content of a",
+            "folder/sub/b.bin": big_content,
+            "folder/sub/": b"",
+            "folder2/c.txt": b"not in the archive",
+        }
+    )
+
+    response = client.get("/archive", params={"directory": "folder/"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["Content-Type"] == "application/zip"
+    assert response.headers["Content-Disposition"] == "attachment; filename*=UTF-8''folder.zip"
+
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == ["a.txt", "sub/b.bin"]
+        assert archive.read("a.txt") == b"content of a"
+        assert archive.read("sub/b.bin") == big_content
+
+
+def test__download_directory_archive__unsafe_keys(client: TestClient):
+    put_files({"folder/../../x.txt": b"x", "folder//etc/y.txt": b"y", "folder/z.txt": b"z"})
+
+    response = client.get("/archive", params={"directory": "folder/"})
+    assert response.status_code == status.HTTP_200_OK
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        # no entry escapes the directory the archive is extracted to
+        assert archive.namelist() == ["etc/y.txt", "z.txt"]
+
+
+def test__download_directory_archive__many_files(client: TestClient):
+    # many more files than are prefetched at once, which must still be archived in key order
+    files = {f"folder/{index:03}.txt": f"file {index}".encode() for index in range(25)}
+    put_files(files)
+
+    response = client.get("/archive", params={"directory": "folder/"})
+    assert response.status_code == status.HTTP_200_OK
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert archive.namelist() == [object_key.removeprefix("folder/") for object_key in files]
+        assert all(archive.read(object_key.removeprefix("folder/")) == content for object_key, content in files.items())
+
+
+def test__download_directory_archive__empty_directory(client: TestClient):
+    put_files({"folder/a.txt": b"a"})
+
+    response = client.get("/archive", params={"directory": "nothing-here/"})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json() == {"detail": "Directory not found"}
+
+    assert client.get("/archive").status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
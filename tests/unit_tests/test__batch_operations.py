@@ -0,0 +1,274 @@
+"""Test cases for `batch_operations`."""
+
+import asyncio
+import time
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from fastapi import status
+from fastapi.testclient import TestClient
+
+import files_api.batch_operations
+from files_api.batch_operations import (
+    delete_s3_objects_in_batches,
+    gather_or_cancel,
+    iter_directory_key_batches,
+    iter_key_batches,
+)
+from files_api.s3.executor import S3Executor
+from tests.consts import TEST_BUCKET_NAME
+from tests.fixtures.files import put_files
+from tests.fixtures.s3_calls import count_s3_calls
+
+
+def remaining_keys() -> list[str]:
+    response = boto3.client("s3").list_objects_v2(Bucket=TEST_BUCKET_NAME)
+    return [item["Key"] for item in response.get("Contents", [])]
+
+
+def test__delete_directory(client: TestClient):
+    put_files(["folder/a.txt", "folder/sub/b.txt", "folder2/c.txt", "d.txt"])
+    # cache the metadata of a file that is about to be deleted
+    assert client.head("/files/folder/a.txt").status_code == status.HTTP_200_OK
+
+    response = client.delete("/files", params={"directory": "folder/"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"deleted_count": 2, "errors": []}
+    assert remaining_keys() == ["d.txt", "folder2/c.txt"]
+    assert client.head("/files/folder/a.txt").status_code == status.HTTP_404_NOT_FOUND
+
+
+def test__delete_directory__spares_sibling_prefixes(client: TestClient):
+    put_files(["a/x.txt", "ab/x.txt", "a.txt"])
+
+    response = client.delete("/files", params={"directory": "a"})
+    assert response.json() == {"deleted_count": 1, "errors": []}
+    assert remaining_keys() == ["a.txt", "ab/x.txt"]
+
+
+def test__delete_directory__requires_a_directory(client: TestClient):
+    put_files(["a.txt"])
+
+    assert client.delete("/files").status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert client.delete("/files", params={"directory": ""}).status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert remaining_keys() == ["a.txt"]
+
+
+def test__batch_delete(client: TestClient):
+    put_files(["a.txt", "b.txt", "c.txt"])
+    s3_calls = count_s3_calls(client)
+
+    response = client.post("/files:batchDelete", json={"file_paths": ["a.txt", "c.txt"]})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"deleted_count": 2, "errors": []}
+    assert remaining_keys() == ["b.txt"]
+    assert s3_calls == {"DeleteObjects": 1}
+
+
+def test__batch_delete__rejects_empty_list(client: TestClient):
+    response = client.post("/files:batchDelete", json={"file_paths": []})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test__delete_in_batches__pages_through_directory(mocked_aws: None):
+    put_files(f"folder/{i}.txt" for i in range(7))
+    s3_client = boto3.client("s3")
+    s3_executor = S3Executor(max_concurrency=4)
+    deleted_batches: list[list[str]] = []
+
+    response = asyncio.run(
+        delete_s3_objects_in_batches(
+            key_batches=iter_directory_key_batches(TEST_BUCKET_NAME, "folder/", s3_client, s3_executor, batch_size=3),
+            bucket_name=TEST_BUCKET_NAME,
+            s3_client=s3_client,
+            s3_executor=s3_executor,
+            max_concurrency=2,
+            on_deleted=deleted_batches.append,
+        )
+    )
+    s3_executor.shutdown()
+
+    assert response.deleted_count == 7
+    assert sorted(len(batch) for batch in deleted_batches) == [1, 3, 3]
+    assert remaining_keys() == []
+
+
+def test__delete_in_batches__reports_failed_keys(mocked_aws: None, monkeypatch: pytest.MonkeyPatch):
+    def delete_s3_objects_denying_b(bucket_name, object_keys, s3_client):
+        return [{"Key": "b.txt", "Code": "AccessDenied", "Message": "Access Denied"}]
+
+    monkeypatch.setattr(files_api.batch_operations, "delete_s3_objects", delete_s3_objects_denying_b)
+    s3_executor = S3Executor(max_concurrency=1)
+
+    response = asyncio.run(
+        delete_s3_objects_in_batches(
+            key_batches=iter_key_batches(["a.txt", "b.txt"]),
+            bucket_name=TEST_BUCKET_NAME,
+            s3_client=boto3.client("s3"),
+            s3_executor=s3_executor,
+            max_concurrency=1,
+        )
+    )
+    s3_executor.shutdown()
+
+    assert response.deleted_count == 1
+    assert [error.model_dump() for error in response.errors] == [
+        {"file_path": "b.txt", "code": "AccessDenied", "message": "Access Denied"}
+    ]
+
+
+def test__delete_in_batches__awaits_cancelled_deletions(mocked_aws: None, monkeypatch: pytest.MonkeyPatch):
+    def slow_delete_s3_objects(bucket_name, object_keys, s3_client):
+        time.sleep(0.1)
+        return []
+
+    async def failing_key_batches():
+        yield ["a.txt"]
+        raise ValueError("listing failed")
+
+    async def run():
+        with pytest.raises(ValueError):
+            await delete_s3_objects_in_batches(
+                key_batches=failing_key_batches(),
+                bucket_name=TEST_BUCKET_NAME,
+                s3_client=boto3.client("s3"),
+                s3_executor=s3_executor,
+                max_concurrency=2,
+            )
+        # the deletion in flight was cancelled and is done by the time the error is raised
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+
+    monkeypatch.setattr(files_api.batch_operations, "delete_s3_objects", slow_delete_s3_objects)
+    s3_executor = S3Executor(max_concurrency=1)
+    asyncio.run(run())
+    s3_executor.shutdown()
+
+
+def batch_upload(client: TestClient, contents: dict[str, bytes]):
+    return client.post(
+        "/files:batchUpload",
+        files=[("files", (file_path, content, "text/plain")) for file_path, content in contents.items()],
+        data={"file_paths": list(contents)},
+    )
+
+
+def test__batch_upload(client: TestClient):
+    put_files(["b.txt"])
+
+    response = batch_upload(client, {"a.txt": b"a", "b.txt": b"bb", "folder/c.txt": b"ccc"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["results"] == [
+        {"file_path": "a.txt", "message": "New file uploaded at path: /a.txt", "status_code": 201},
+        {"file_path": "b.txt", "message": "Existing file updated at path: /b.txt", "status_code": 200},
+        {"file_path": "folder/c.txt", "message": "New file uploaded at path: /folder/c.txt", "status_code": 201},
+    ]
+    assert client.get("/files/folder/c.txt").content == b"ccc"
+    assert client.get("/files/b.txt").content == b"bb"
+
+
+def test__batch_upload__reports_failures_per_file(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    original_store_uploaded_file = files_api.batch_operations.store_uploaded_file
+
+    async def store_uploaded_file_failing_for_b(**kwargs):
+        if kwargs["file_path"] == "b.txt":
+            raise ClientError({"Error": {"Code": "SlowDown", "Message": "Slow Down"}}, "PutObject")
+        return await original_store_uploaded_file(**kwargs)
+
+    monkeypatch.setattr(files_api.batch_operations, "store_uploaded_file", store_uploaded_file_failing_for_b)
+
+    response = batch_upload(client, {"a.txt": b"a", "b.txt": b"b"})
+    assert response.status_code == status.HTTP_200_OK
+    assert [result["status_code"] for result in response.json()["results"]] == [201, 500]
+    assert remaining_keys() == ["a.txt"]
+
+
+def test__batch_upload__circuit_opens_partway(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    original_store_uploaded_file = files_api.batch_operations.store_uploaded_file
+    circuit_breaker = client.app.state.s3_resilience.circuit_breaker
+
+    async def store_uploaded_file_then_open_circuit(**kwargs):
+        result = await original_store_uploaded_file(**kwargs)
+        # S3 starts failing once the first file is stored
+        for _ in range(circuit_breaker.failure_threshold):
+            circuit_breaker.record_failure()
+        return result
+
+    monkeypatch.setattr(files_api.batch_operations, "store_uploaded_file", store_uploaded_file_then_open_circuit)
+    client.app.state.settings.batch_max_concurrency = 1
+
+    response = batch_upload(client, {"a.txt": b"a", "b.txt": b"b", "c.txt": b"c"})
+    assert response.status_code == status.HTTP_200_OK
+    assert [result["status_code"] for result in response.json()["results"]] == [201, 503, 503]
+    assert remaining_keys() == ["a.txt"]
+
+
+def test__gather_or_cancel__cancels_the_others_on_failure():
+    cancelled = []
+
+    async def wait():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(None)
+            raise
+
+    async def fail():
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        asyncio.run(gather_or_cancel([wait(), fail(), wait()]))
+    assert len(cancelled) == 2
+
+
+def test__batch_upload__validates_file_paths(client: TestClient):
+    response = client.post(
+        "/files:batchUpload",
+        files=[("files", ("a.txt", b"a", "text/plain")), ("files", ("b.txt", b"b", "text/plain"))],
+        data={"file_paths": ["a.txt"]},
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    response = client.post(
+        "/files:batchUpload",
+        files=[("files", ("a.txt", b"a", "text/plain")), ("files", ("b.txt", b"b", "text/plain"))],
+        data={"file_paths": ["a.txt", "a.txt"]},
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert remaining_keys() == []
+
+
+def test__batch_head(client: TestClient):
+    put_files(["b.txt", "a.txt"])
+    s3_calls = count_s3_calls(client)
+
+    response = client.post("/files:batchHead", json={"file_paths": ["b.txt", "missing.txt", "a.txt"]})
+    assert response.status_code == status.HTTP_200_OK
+    files = response.json()["files"]
+    assert [(item["file_path"], item["exists"]) for item in files] == [
+        ("b.txt", True),
+        ("missing.txt", False),
+        ("a.txt", True),
+    ]
+    assert files[0]["size_bytes"] == len(b"content")
+    assert files[0]["content_type"] == "binary/octet-stream"
+    assert files[0]["etag"].startswith('"')
+    assert files[0]["last_modified"] is not None
+    assert files[1] == {
+        "file_path": "missing.txt",
+        "exists": False,
+        "size_bytes": None,
+        "content_type": None,
+        "etag": None,
+        "last_modified": None,
+    }
+    assert s3_calls == {"HeadObject": 3}
+
+    # a second lookup is answered from the metadata cache
+    client.post("/files:batchHead", json={"file_paths": ["b.txt", "missing.txt", "a.txt"]})
+    assert s3_calls == {"HeadObject": 3}
+
+
+def test__batch_head__caps_number_of_paths(client: TestClient):
+    response = client.post("/files:batchHead", json={"file_paths": [f"{i}.txt" for i in range(1001)]})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
@@ -0,0 +1,53 @@
+"""Test cases for the benchmark suite in `benchmarks/`."""
+
+import asyncio
+
+import pytest
+
+from benchmarks.files_api_benchmark import (
+    BenchmarkConfig,
+    compare_with_baseline,
+    percentile,
+    run_benchmark,
+)
+
+
+def make_report(throughput_rps: float, latency_ms: float, errors: int = 0, peak_rss_bytes: int = 100) -> dict:
+    scenario = {
+        "requests": 10,
+        "errors": errors,
+        "throughput_rps": throughput_rps,
+        "latency_p50_ms": latency_ms,
+        "latency_p95_ms": latency_ms,
+    }
+    return {"peak_rss_bytes": peak_rss_bytes, "scenarios": {"get/1024B": scenario}}
+
+
+def test__percentile__nearest_rank():
+    values = [float(value) for value in range(1, 101)]
+    assert (percentile(values, 50), percentile(values, 95), percentile(values, 99)) == (50.0, 95.0, 99.0)
+    assert percentile([], 50) == 0.0
+
+
+@pytest.mark.parametrize(
+    "report, expected_regression_count",
+    [
+        (make_report(throughput_rps=90, latency_ms=11), 0),
+        (make_report(throughput_rps=70, latency_ms=10), 1),
+        # p50 and p95 both regressed
+        (make_report(throughput_rps=100, latency_ms=13), 2),
+        (make_report(throughput_rps=100, latency_ms=10, errors=1), 1),
+        (make_report(throughput_rps=100, latency_ms=10, peak_rss_bytes=130), 1),
+    ],
+)
+def test__compare_with_baseline(report: dict, expected_regression_count: int):
+    baseline = make_report(throughput_rps=100, latency_ms=10)
+    assert len(compare_with_baseline(report, baseline, tolerance=0.2)) == expected_regression_count
+
+
+@pytest.mark.slow
+def test__run_benchmark__every_route_succeeds():
+    report = asyncio.run(run_benchmark(BenchmarkConfig(concurrency=2, key_count=4, object_sizes_bytes=(16,))))
+
+    assert set(report["scenarios"]) == {"put/16B", "head/16B", "get/16B", "list/16B", "delete/16B"}
+    assert compare_with_baseline(report, baseline=report) == []
@@ -0,0 +1,129 @@
+"""Test cases for `compression`."""
+
+import asyncio
+import gzip
+import io
+import json
+import zipfile
+from typing import AsyncIterator
+
+import boto3
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api.compression import (
+    gunzip_chunks,
+    gzip_chunks,
+    is_compressible,
+)
+from tests.consts import TEST_BUCKET_NAME
+from tests.fixtures.api_client import MakeClient
+from tests.fixtures.files import as_chunks
+
+TEST_FILE_PATH = "logs/records.json"
+TEST_FILE_CONTENT = json.dumps([{"id": index, "message": "hello, world"} for index in range(500)]).encode()
+# clients that cannot decode gzip
+IDENTITY_ONLY = {"Accept-Encoding": "identity"}
+
+
+async def join(chunks: AsyncIterator[bytes]) -> bytes:
+    return b"".join([chunk async for chunk in chunks])
+
+
+@pytest.fixture
+def compression_client(make_client: MakeClient) -> TestClient:
+    client = make_client(compression_enabled=True)
+    client.put(f"/files/{TEST_FILE_PATH}", files={"file": ("records.json", TEST_FILE_CONTENT, "application/json")})
+    return client
+
+
+@pytest.mark.parametrize(
+    "content_type, expected",
+    [
+        ("application/json", True),
+        ("text/csv; charset=utf-8", True),
+        ("TEXT/PLAIN", True),
+        ("image/png", False),
+        ("application/octet-stream", False),
+        (None, False),
+    ],
+)
+def test__is_compressible(content_type, expected):
+    assert is_compressible(content_type, ["text/*", "application/json"]) == expected
+
+
+def test__gzip_chunks__round_trip():
+    compressed = asyncio.run(join(gzip_chunks(as_chunks(TEST_FILE_CONTENT, chunk_size=1000), level=6)))
+    assert gzip.decompress(compressed) == TEST_FILE_CONTENT
+    assert asyncio.run(join(gunzip_chunks(as_chunks(compressed, chunk_size=100)))) == TEST_FILE_CONTENT
+
+
+def test__gunzip_chunks__bounds_decompressed_chunks():
+    content = b"0" * 100_000
+    compressed = gzip.compress(content)
+
+    async def collect() -> list[bytes]:
+        return [chunk async for chunk in gunzip_chunks(as_chunks(compressed, chunk_size=len(compressed)), 4096)]
+
+    decompressed_chunks = asyncio.run(collect())
+    assert max(len(chunk) for chunk in decompressed_chunks) <= 4096
+    assert b"".join(decompressed_chunks) == content
+
+
+def test__upload__compressible_file_is_stored_gzipped(compression_client: TestClient):
+    head_response = boto3.client("s3").head_object(Bucket=TEST_BUCKET_NAME, Key=TEST_FILE_PATH)
+    assert head_response["ContentEncoding"] == "gzip"
+    assert head_response["ContentLength"] < len(TEST_FILE_CONTENT)
+    assert head_response["Metadata"] == {"uncompressed-size": str(len(TEST_FILE_CONTENT))}
+
+
+def test__upload__other_files_are_stored_as_they_are(compression_client: TestClient):
+    compression_client.put("/files/image.png", files={"file": ("image.png", b"\x89PNG", "image/png")})
+
+    head_response = boto3.client("s3").head_object(Bucket=TEST_BUCKET_NAME, Key="image.png")
+    assert "ContentEncoding" not in head_response
+    assert compression_client.get("/files/image.png").content == b"\x89PNG"
+
+
+def test__get_file__gzip_client_gets_stored_bytes(compression_client: TestClient):
+    response = compression_client.get(f"/files/{TEST_FILE_PATH}", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert int(response.headers["Content-Length"]) < len(TEST_FILE_CONTENT)
+    # the test client decodes the body, like browsers do
+    assert response.content == TEST_FILE_CONTENT
+
+
+def test__get_file__other_clients_get_decompressed_file(compression_client: TestClient):
+    etag = compression_client.head(f"/files/{TEST_FILE_PATH}").headers["ETag"]
+
+    response = compression_client.get(f"/files/{TEST_FILE_PATH}", headers=IDENTITY_ONLY)
+    assert response.status_code == status.HTTP_200_OK
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Content-Length"] == str(len(TEST_FILE_CONTENT))
+    assert response.headers["ETag"] == f"W/{etag}"
+    assert response.content == TEST_FILE_CONTENT
+
+    # a range of the compressed content is meaningless to them, so they get the whole file
+    response = compression_client.get(f"/files/{TEST_FILE_PATH}", headers={**IDENTITY_ONLY, "Range": "bytes=0-9"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.content == TEST_FILE_CONTENT
+
+
+def test__head__describes_negotiated_representation(compression_client: TestClient):
+    response = compression_client.head(f"/files/{TEST_FILE_PATH}", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert int(response.headers["Content-Length"]) < len(TEST_FILE_CONTENT)
+
+    response = compression_client.head(f"/files/{TEST_FILE_PATH}", headers=IDENTITY_ONLY)
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Content-Length"] == str(len(TEST_FILE_CONTENT))
+    assert response.headers["ETag"].startswith("W/")
+
+
+def test__archive__holds_decompressed_files(compression_client: TestClient):
+    response = compression_client.get("/archive", params={"directory": "logs/"})
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert archive.read("records.json") == TEST_FILE_CONTENT
@@ -0,0 +1,140 @@
+"""Test cases for `dedup`."""
+
+import hashlib
+import io
+
+import boto3
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api.dedup import (
+    DedupIndex,
+    StoredContent,
+    hash_file,
+)
+from tests.consts import TEST_BUCKET_NAME
+from tests.fixtures.api_client import MakeClient
+from tests.fixtures.s3_calls import count_s3_calls
+
+TEST_FILE_CONTENT = b"the same payload, uploaded again and again"
+
+
+def put_file(client: TestClient, file_path: str, content: bytes = TEST_FILE_CONTENT, content_type: str = "text/plain"):
+    return client.put(f"/files/{file_path}", files={"file": ("file.txt", content, content_type)})
+
+
+@pytest.fixture
+def dedup_client(make_client: MakeClient) -> TestClient:
+    return make_client(dedup_enabled=True)
+
+
+def test__hash_file__rewinds_the_file():
+    file = io.BytesIO(TEST_FILE_CONTENT)
+    file.seek(5)
+
+    assert hash_file(file, chunk_size=4) == (hashlib.sha256(TEST_FILE_CONTENT).hexdigest(), len(TEST_FILE_CONTENT))
+    assert file.tell() == 0
+
+
+def test__dedup_index__evicts_least_recently_used_digests():
+    dedup_index = DedupIndex(max_entries=2)
+    dedup_index.put(TEST_BUCKET_NAME, "a", StoredContent("a.txt", '"a"'))
+    dedup_index.put(TEST_BUCKET_NAME, "b", StoredContent("b.txt", '"b"'))
+    dedup_index.get(TEST_BUCKET_NAME, "a")
+    dedup_index.put(TEST_BUCKET_NAME, "c", StoredContent("c.txt", '"c"'))
+
+    assert dedup_index.get(TEST_BUCKET_NAME, "b") is None
+    assert dedup_index.get(TEST_BUCKET_NAME, "a") == StoredContent("a.txt", '"a"')
+
+
+def test__upload__duplicate_content_is_copied(dedup_client: TestClient):
+    assert put_file(dedup_client, "a.txt").status_code == status.HTTP_201_CREATED
+    s3_calls = count_s3_calls(dedup_client)
+
+    assert put_file(dedup_client, "copies/b.txt").status_code == status.HTTP_201_CREATED
+    assert s3_calls == {"HeadObject": 1, "CopyObject": 1}
+    assert dedup_client.get("/files/copies/b.txt").content == TEST_FILE_CONTENT
+
+    head_response = boto3.client("s3").head_object(Bucket=TEST_BUCKET_NAME, Key="copies/b.txt")
+    assert head_response["Metadata"] == {"sha256": hashlib.sha256(TEST_FILE_CONTENT).hexdigest()}
+    stats = dedup_client.get("/stats").json()["dedup"]
+    assert (stats["deduplicated_uploads"], stats["bytes_saved"]) == (1, len(TEST_FILE_CONTENT))
+
+
+def test__upload__same_content_at_same_path_writes_nothing(dedup_client: TestClient):
+    put_file(dedup_client, "a.txt")
+    s3_calls = count_s3_calls(dedup_client)
+
+    assert put_file(dedup_client, "a.txt").status_code == status.HTTP_200_OK
+    assert s3_calls == {"HeadObject": 1}
+
+
+def test__upload__same_content_at_same_path_with_new_content_type(dedup_client: TestClient):
+    put_file(dedup_client, "a.txt")
+    s3_calls = count_s3_calls(dedup_client)
+
+    assert put_file(dedup_client, "a.txt", content_type="application/json").status_code == status.HTTP_200_OK
+    # the object is copied onto itself to replace its content type, without uploading the content again
+    assert s3_calls == {"HeadObject": 1, "CopyObject": 1}
+    response = dedup_client.get("/files/a.txt")
+    assert response.headers["Content-Type"] == "application/json"
+    assert response.content == TEST_FILE_CONTENT
+
+
+def test__upload__changed_source_is_uploaded_again(dedup_client: TestClient):
+    put_file(dedup_client, "a.txt")
+    # the recorded copy of the content disappears behind the API's back
+    boto3.client("s3").delete_object(Bucket=TEST_BUCKET_NAME, Key="a.txt")
+    s3_calls = count_s3_calls(dedup_client)
+
+    assert put_file(dedup_client, "b.txt").status_code == status.HTTP_201_CREATED
+    assert s3_calls["PutObject"] == 1
+    assert dedup_client.get("/files/b.txt").content == TEST_FILE_CONTENT
+    assert dedup_client.get("/stats").json()["dedup"]["deduplicated_uploads"] == 0
+
+    # b.txt is now the recorded copy of the content
+    s3_calls.clear()
+    assert put_file(dedup_client, "c.txt").status_code == status.HTTP_201_CREATED
+    assert s3_calls["CopyObject"] == 1
+
+
+def test__upload__new_content_is_uploaded(dedup_client: TestClient):
+    put_file(dedup_client, "a.txt")
+    s3_calls = count_s3_calls(dedup_client)
+
+    assert put_file(dedup_client, "b.txt", content=b"different content").status_code == status.HTTP_201_CREATED
+    assert s3_calls == {"PutObject": 1}
+
+
+def test__dedup_disabled_by_default(client: TestClient):
+    assert client.get("/stats").json()["dedup"] is None
+
+
+def test__upload__duplicate_of_compressed_content(make_client: MakeClient):
+    client = make_client(dedup_enabled=True, compression_enabled=True)
+    put_file(client, "a.txt")
+    s3_calls = count_s3_calls(client)
+    assert put_file(client, "b.txt").status_code == status.HTTP_201_CREATED
+    assert s3_calls["CopyObject"] == 1
+
+    # the copy is stored compressed too
+    response = client.get("/files/b.txt", headers={"Accept-Encoding": "identity"})
+    assert response.content == TEST_FILE_CONTENT
+    assert response.headers["Content-Length"] == str(len(TEST_FILE_CONTENT))
+
+
+def test__upload__duplicate_of_compressed_content__size(make_client: MakeClient):
+    client = make_client(dedup_enabled=True, compression_enabled=True, listing_index_enabled=True)
+    put_file(client, "a.txt")
+    put_file(client, "b.txt")
+
+    # the uploaded file and its copy are listed at their size in S3, and modification time, as S3 lists them
+    files, _ = client.app.state.listing_index.list_page(prefix="", start_after=None, max_keys=10)
+    s3_client = boto3.client("s3")
+    stored_objects = [s3_client.head_object(Bucket=TEST_BUCKET_NAME, Key=key) for key in ["a.txt", "b.txt"]]
+    stored_sizes = [stored_object["ContentLength"] for stored_object in stored_objects]
+    assert [item["Size"] for item in files] == stored_sizes
+    assert [item["LastModified"] for item in files] == [item["LastModified"] for item in stored_objects]
+    # the compressed size, not the size of the uploaded content
+    assert stored_sizes[1] != len(TEST_FILE_CONTENT)
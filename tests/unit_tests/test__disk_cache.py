@@ -0,0 +1,159 @@
+"""Test cases for `disk_cache`."""
+
+import asyncio
+import os
+from datetime import (
+    datetime,
+    timezone,
+)
+from pathlib import Path
+
+import boto3
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api.disk_cache import DiskCache
+from tests.consts import TEST_BUCKET_NAME
+from tests.fixtures.api_client import MakeClient
+from tests.fixtures.files import as_chunks
+from tests.fixtures.s3_calls import count_s3_calls
+
+NOW = datetime(2024, 1, 1, tzinfo=timezone.utc)
+TEST_FILE_PATH = "folder/test.txt"
+TEST_FILE_CONTENT = b"Hello, world!"
+
+
+def fill(disk_cache: DiskCache, object_key: str, content: bytes, size_bytes: int = -1) -> list[bytes]:
+    async def collect() -> list[bytes]:
+        filling = disk_cache.fill(
+            as_chunks(content, chunk_size=len(content)),
+            bucket_name=TEST_BUCKET_NAME,
+            object_key=object_key,
+            etag='"etag"',
+            size_bytes=len(content) if size_bytes < 0 else size_bytes,
+            content_type="text/plain",
+            last_modified=NOW,
+        )
+        return [chunk async for chunk in filling]
+
+    return asyncio.run(collect())
+
+
+def test__disk_cache__fill_and_acquire(tmp_path: Path):
+    disk_cache = DiskCache(str(tmp_path), max_bytes=100, max_object_bytes=100)
+
+    assert fill(disk_cache, "a.txt", b"content") == [b"content"]
+    cached_body = disk_cache.acquire(TEST_BUCKET_NAME, "a.txt")
+    assert cached_body is not None
+    assert Path(cached_body.path).read_bytes() == b"content"
+    assert cached_body.path.startswith(disk_cache.directory)
+    disk_cache.release(cached_body)
+
+    disk_cache.close()
+    assert not os.path.exists(disk_cache.directory)
+
+
+def test__disk_cache__incomplete_fill_is_discarded(tmp_path: Path):
+    disk_cache = DiskCache(str(tmp_path), max_bytes=100, max_object_bytes=100)
+
+    fill(disk_cache, "a.txt", b"content", size_bytes=100)
+    assert disk_cache.acquire(TEST_BUCKET_NAME, "a.txt") is None
+    assert os.listdir(disk_cache.directory) == []
+
+
+def test__disk_cache__evicts_least_recently_used_bodies(tmp_path: Path):
+    disk_cache = DiskCache(str(tmp_path), max_bytes=10, max_object_bytes=10)
+    fill(disk_cache, "a.txt", b"aaaa")
+    fill(disk_cache, "b.txt", b"bbbb")
+    # reading a.txt makes b.txt the least recently used
+    disk_cache.release(disk_cache.acquire(TEST_BUCKET_NAME, "a.txt"))
+
+    fill(disk_cache, "c.txt", b"cccc")
+    assert disk_cache.acquire(TEST_BUCKET_NAME, "b.txt") is None
+    assert disk_cache.acquire(TEST_BUCKET_NAME, "a.txt") is not None
+    stats = disk_cache.stats()
+    assert (stats["entries"], stats["size_bytes"], stats["evictions"]) == (2, 8, 1)
+    assert len(os.listdir(disk_cache.directory)) == 2
+
+
+def test__disk_cache__evicted_body_is_kept_until_released(tmp_path: Path):
+    disk_cache = DiskCache(str(tmp_path), max_bytes=4, max_object_bytes=4)
+    fill(disk_cache, "a.txt", b"aaaa")
+    cached_body = disk_cache.acquire(TEST_BUCKET_NAME, "a.txt")
+
+    fill(disk_cache, "b.txt", b"bbbb")
+    assert disk_cache.acquire(TEST_BUCKET_NAME, "a.txt") is None
+    assert Path(cached_body.path).read_bytes() == b"aaaa"
+
+    disk_cache.release(cached_body)
+    assert not os.path.exists(cached_body.path)
+
+
+def test__disk_cache__does_not_accept_large_objects(tmp_path: Path):
+    disk_cache = DiskCache(str(tmp_path), max_bytes=100, max_object_bytes=10)
+    assert disk_cache.accepts(10)
+    assert not disk_cache.accepts(11)
+
+
+@pytest.fixture
+def disk_cache_client(make_client: MakeClient, tmp_path: Path) -> TestClient:
+    boto3.client("s3").put_object(Bucket=TEST_BUCKET_NAME, Key=TEST_FILE_PATH, Body=TEST_FILE_CONTENT)
+    return make_client(disk_cache_dir=str(tmp_path))
+
+
+def test__get_file__hot_file_served_from_disk(disk_cache_client: TestClient):
+    assert disk_cache_client.get(f"/files/{TEST_FILE_PATH}").content == TEST_FILE_CONTENT
+    s3_calls = count_s3_calls(disk_cache_client)
+
+    response = disk_cache_client.get(f"/files/{TEST_FILE_PATH}")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.content == TEST_FILE_CONTENT
+    assert response.headers["Content-Type"] == "binary/octet-stream"
+    assert sum(s3_calls.values()) == 0
+
+    stats = disk_cache_client.get("/stats").json()["disk_cache"]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["bytes_saved"] == len(TEST_FILE_CONTENT)
+    assert stats["size_bytes"] == len(TEST_FILE_CONTENT)
+
+
+def test__get_file__disk_copy_revalidated_with_s3(disk_cache_client: TestClient):
+    etag = disk_cache_client.get(f"/files/{TEST_FILE_PATH}").headers["ETag"]
+    # without cached metadata, S3 is asked whether the copy on disk is still current
+    disk_cache_client.app.state.metadata_cache.invalidate(TEST_BUCKET_NAME, TEST_FILE_PATH)
+    s3_calls = count_s3_calls(disk_cache_client)
+
+    response = disk_cache_client.get(f"/files/{TEST_FILE_PATH}")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.content == TEST_FILE_CONTENT
+    assert response.headers["ETag"] == etag
+    assert s3_calls == {"GetObject": 1}
+    assert disk_cache_client.get("/stats").json()["disk_cache"]["hits"] == 1
+
+    # the client's own conditions are evaluated against the copy on disk
+    disk_cache_client.app.state.metadata_cache.invalidate(TEST_BUCKET_NAME, TEST_FILE_PATH)
+    response = disk_cache_client.get(f"/files/{TEST_FILE_PATH}", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+def test__get_file__stale_disk_copy_is_replaced(disk_cache_client: TestClient):
+    disk_cache_client.get(f"/files/{TEST_FILE_PATH}")
+    # changed behind the API's back, once the cached metadata has expired
+    boto3.client("s3").put_object(Bucket=TEST_BUCKET_NAME, Key=TEST_FILE_PATH, Body=b"new content")
+    disk_cache_client.app.state.metadata_cache.invalidate(TEST_BUCKET_NAME, TEST_FILE_PATH)
+
+    assert disk_cache_client.get(f"/files/{TEST_FILE_PATH}").content == b"new content"
+    assert disk_cache_client.get(f"/files/{TEST_FILE_PATH}").content == b"new content"
+    stats = disk_cache_client.get("/stats").json()["disk_cache"]
+    assert (stats["entries"], stats["hits"]) == (1, 1)
+
+
+def test__get_file__range_served_from_disk(disk_cache_client: TestClient):
+    disk_cache_client.get(f"/files/{TEST_FILE_PATH}")
+
+    response = disk_cache_client.get(f"/files/{TEST_FILE_PATH}", headers={"Range": "bytes=0-4"})
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert response.content == TEST_FILE_CONTENT[:5]
+    assert response.headers["Content-Range"] == f"bytes 0-4/{len(TEST_FILE_CONTENT)}"
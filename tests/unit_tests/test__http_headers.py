@@ -0,0 +1,90 @@
+"""Test cases for `http_headers`."""
+
+from datetime import (
+    datetime,
+    timezone,
+)
+
+import pytest
+
+from files_api.http_headers import (
+    accepts_encoding,
+    format_http_date,
+    negotiate_media_type,
+    parse_http_date,
+    parse_if_none_match,
+    parse_range_header,
+)
+
+
+@pytest.mark.parametrize(
+    "range_header, expected",
+    [
+        (None, None),
+        ("", None),
+        ("bytes=0-99", "bytes=0-99"),
+        ("bytes=100-", "bytes=100-"),
+        ("bytes=-100", "bytes=-100"),
+        ("bytes = 0 - 99", "bytes=0-99"),
+        # unsupported or malformed ranges are ignored
+        ("bytes=0-1,5-6", None),
+        ("bytes=-", None),
+        ("bytes=9-1", None),
+        ("items=0-1", None),
+    ],
+)
+def test__parse_range_header(range_header, expected):
+    assert parse_range_header(range_header) == expected
+
+
+def test__parse_if_none_match():
+    assert parse_if_none_match(None) == []
+    assert parse_if_none_match('"abc"') == ['"abc"']
+    assert parse_if_none_match('"abc", W/"def"') == ['"abc"', '"def"']
+    assert parse_if_none_match("*") == ["*"]
+
+
+def test__parse_http_date():
+    assert parse_http_date("Sun, 06 Nov 1994 08:49:37 GMT") == datetime(1994, 11, 6, 8, 49, 37, tzinfo=timezone.utc)
+    assert parse_http_date("not a date") is None
+    assert parse_http_date(None) is None
+
+
+def test__format_http_date():
+    assert format_http_date(datetime(1994, 11, 6, 8, 49, 37, tzinfo=timezone.utc)) == "Sun, 06 Nov 1994 08:49:37 GMT"
+
+
+@pytest.mark.parametrize(
+    "accept_encoding_header, expected",
+    [
+        ("gzip", True),
+        ("gzip, deflate, br", True),
+        ("deflate, GZIP;q=0.5", True),
+        ("*", True),
+        ("gzip;q=0", False),
+        ("*, gzip;q=0", False),
+        ("identity", False),
+        ("", False),
+        (None, False),
+    ],
+)
+def test__accepts_encoding(accept_encoding_header, expected):
+    assert accepts_encoding(accept_encoding_header, "gzip") == expected
+
+
+@pytest.mark.parametrize(
+    "accept_header, expected",
+    [
+        (None, "application/json"),
+        ("*/*", "application/json"),
+        ("text/csv", "text/csv"),
+        ("text/*", "text/csv"),
+        ("application/json;q=0.5, text/csv", "text/csv"),
+        # a specific entry overrides the range covering it
+        ("*/*;q=0.1, application/json;q=0", "text/csv"),
+        ("application/xml", None),
+        ("text/csv;q=0", None),
+    ],
+)
+def test__negotiate_media_type(accept_header, expected):
+    assert negotiate_media_type(accept_header, ["application/json", "text/csv"]) == expected
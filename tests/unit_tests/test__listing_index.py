@@ -0,0 +1,126 @@
+"""Test cases for `listing_index`."""
+
+import time
+from array import array
+from datetime import (
+    datetime,
+    timezone,
+)
+
+import boto3
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api.listing_index import (
+    ListingIndex,
+    decode_page_token,
+    encode_page_token,
+)
+from tests.consts import TEST_BUCKET_NAME
+from tests.fixtures.api_client import MakeClient
+from tests.fixtures.s3_calls import count_s3_calls
+
+NOW = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def build_index(keys: list[str]) -> ListingIndex:
+    listing_index = ListingIndex()
+    listing_index.begin_rebuild()
+    listing_index.finish_rebuild(
+        keys=list(keys),
+        sizes=array("q", [1] * len(keys)),
+        timestamps=array("d", [NOW.timestamp()] * len(keys)),
+    )
+    return listing_index
+
+
+def wait_until_ready(listing_index: ListingIndex, timeout_seconds: float = 5) -> None:
+    deadline = time.monotonic() + timeout_seconds
+    while not listing_index.ready:
+        assert time.monotonic() < deadline, "the listing index was not bootstrapped in time"
+        time.sleep(0.01)
+
+
+def test__page_token__round_trip():
+    page_token = encode_page_token("folder/", "folder/b.txt")
+    assert decode_page_token(page_token) == ("folder/", "folder/b.txt")
+    # S3 continuation tokens and garbage are not index page tokens
+    assert decode_page_token("1ueGcxLPRx1Tr/XYExHnhbYLgveDs2J/wm36Hy4vbOwM=") is None
+    assert decode_page_token("idx:not-base64-json") is None
+
+
+def test__list_page__paginates_a_prefix():
+    listing_index = build_index(["a.txt", "folder/a.txt", "folder/b.txt", "folder/c.txt", "other.txt"])
+
+    files, start_after = listing_index.list_page(prefix="folder/", start_after=None, max_keys=2)
+    assert [item["Key"] for item in files] == ["folder/a.txt", "folder/b.txt"]
+    assert files[0]["LastModified"] == NOW
+    assert start_after == "folder/b.txt"
+
+    files, start_after = listing_index.list_page(prefix="folder/", start_after=start_after, max_keys=2)
+    assert [item["Key"] for item in files] == ["folder/c.txt"]
+    assert start_after is None
+
+
+def test__upsert_and_remove__keep_keys_sorted():
+    listing_index = build_index(["b.txt", "d.txt"])
+    listing_index.upsert("c.txt", size_bytes=5, last_modified=NOW)
+    listing_index.upsert("a.txt", size_bytes=5, last_modified=NOW)
+    listing_index.upsert("b.txt", size_bytes=7, last_modified=NOW)
+    listing_index.remove("d.txt")
+
+    files, _ = listing_index.list_page(prefix="", start_after=None, max_keys=10)
+    assert [(item["Key"], item["Size"]) for item in files] == [("a.txt", 5), ("b.txt", 7), ("c.txt", 5)]
+
+
+def test__rebuild__replays_writes_made_during_the_scan():
+    listing_index = build_index(["a.txt"])
+    listing_index.begin_rebuild()
+    # written through the API while the scan is running, after the scan went past it
+    listing_index.upsert("new.txt", size_bytes=1, last_modified=NOW)
+    listing_index.finish_rebuild(keys=["a.txt", "b.txt"], sizes=array("q", [1, 1]), timestamps=array("d", [0, 0]))
+
+    files, _ = listing_index.list_page(prefix="", start_after=None, max_keys=10)
+    assert [item["Key"] for item in files] == ["a.txt", "b.txt", "new.txt"]
+
+
+def test__list_files__served_from_index(make_client: MakeClient):
+    s3_client = boto3.client("s3")
+    for i in range(15):
+        s3_client.put_object(Bucket=TEST_BUCKET_NAME, Key=f"folder/file{i:02d}.txt", Body=b"content")
+
+    client = make_client(listing_index_enabled=True)
+    wait_until_ready(client.app.state.listing_index)
+    s3_calls = count_s3_calls(client)
+
+    response = client.get("/files?directory=folder/&page_size=10")
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert [item["file_path"] for item in data["files"]] == [f"folder/file{i:02d}.txt" for i in range(10)]
+    assert data["files"][0]["size_bytes"] == len(b"content")
+
+    response = client.get(f"/files?page_token={data['next_page_token']}")
+    data = response.json()
+    assert [item["file_path"] for item in data["files"]] == [f"folder/file{i:02d}.txt" for i in range(10, 15)]
+    assert data["next_page_token"] is None
+    assert s3_calls["ListObjectsV2"] == 0
+
+    # writes through the API are visible right away
+    client.put("/files/folder/new.txt", files={"file": ("new.txt", b"new", "text/plain")})
+    client.delete("/files/folder/file00.txt")
+    files = client.get("/files?directory=folder/&page_size=100").json()["files"]
+    assert "folder/new.txt" in [item["file_path"] for item in files]
+    assert "folder/file00.txt" not in [item["file_path"] for item in files]
+    assert s3_calls["ListObjectsV2"] == 0
+
+    assert client.get("/stats").json()["listing_index"]["objects"] == 15
+
+
+def test__list_files__index_page_token_falls_back_to_s3(client: TestClient):
+    for i in range(3):
+        client.put(f"/files/file{i}.txt", files={"file": (f"file{i}.txt", b"content", "text/plain")})
+
+    # e.g. a token issued by a worker that has the listing index enabled
+    response = client.get(f"/files?page_token={encode_page_token('', 'file0.txt')}")
+    assert response.status_code == status.HTTP_200_OK
+    assert [item["file_path"] for item in response.json()["files"]] == ["file1.txt", "file2.txt"]
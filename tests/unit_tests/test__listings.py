@@ -0,0 +1,65 @@
+"""Test cases for `listings` and the streamed listing of a directory."""
+
+import asyncio
+import json
+
+import boto3
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api.listings import iter_directory_pages
+from files_api.s3.executor import S3Executor
+from tests.consts import TEST_BUCKET_NAME
+from tests.fixtures.files import put_files
+from tests.fixtures.s3_calls import count_s3_calls
+
+
+def list_pages(prefix: str, page_size: int, prefetch: bool, max_pages: int = -1) -> list[list[str]]:
+    async def collect() -> list[list[str]]:
+        s3_executor = S3Executor(max_concurrency=2)
+        pages = iter_directory_pages(
+            bucket_name=TEST_BUCKET_NAME,
+            prefix=prefix,
+            s3_client=boto3.client("s3"),
+            s3_executor=s3_executor,
+            page_size=page_size,
+            prefetch=prefetch,
+        )
+        keys = []
+        async for files in pages:
+            keys.append([item["Key"] for item in files])
+            if len(keys) == max_pages:
+                await pages.aclose()
+                break
+        s3_executor.shutdown()
+        return keys
+
+    return asyncio.run(collect())
+
+
+def test__iter_directory_pages__prefetch(mocked_aws: None):  # pylint: disable=unused-argument
+    put_files([f"folder/{index}.txt" for index in range(5)] + ["other.txt"])
+
+    expected_pages = [["folder/0.txt", "folder/1.txt"], ["folder/2.txt", "folder/3.txt"], ["folder/4.txt"]]
+    assert list_pages("folder/", page_size=2, prefetch=True) == expected_pages
+    assert list_pages("folder/", page_size=2, prefetch=False) == expected_pages
+    assert list_pages("folder/", page_size=2, prefetch=True, max_pages=1) == expected_pages[:1]
+
+
+def test__stream_files(client: TestClient):
+    put_files(["folder/a.txt", "folder/b.txt", "other.txt"])
+    s3_calls = count_s3_calls(client)
+
+    response = client.get("/files:stream", params={"directory": "folder/"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["Content-Type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["file_path"] for line in lines] == ["folder/a.txt", "folder/b.txt"]
+    assert lines[0]["size_bytes"] == len(b"content")
+    assert s3_calls == {"ListObjectsV2": 1}
+
+
+def test__stream_files__empty_directory(client: TestClient):
+    response = client.get("/files:stream", params={"directory": "missing/"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.text == ""
@@ -0,0 +1,135 @@
+"""Test cases for `metadata_cache`."""
+
+import boto3
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api.metadata_cache import (
+    MISSING_OBJECT,
+    MetadataCache,
+    ObjectMetadata,
+)
+from tests.consts import TEST_BUCKET_NAME
+from tests.fixtures.s3_calls import count_s3_calls
+
+METADATA = ObjectMetadata(exists=True, size_bytes=3, content_type="text/plain", etag='"abc"')
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test__metadata_cache__expires_entries_after_ttl():
+    clock = FakeClock()
+    cache = MetadataCache(max_entries=10, ttl_seconds=5, clock=clock)
+    cache.put(TEST_BUCKET_NAME, "a.txt", METADATA)
+
+    clock.now = 4.9
+    assert cache.get(TEST_BUCKET_NAME, "a.txt") == METADATA
+    clock.now = 5.0
+    assert cache.get(TEST_BUCKET_NAME, "a.txt") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test__metadata_cache__evicts_least_recently_used():
+    cache = MetadataCache(max_entries=2, ttl_seconds=60)
+    cache.put(TEST_BUCKET_NAME, "a.txt", METADATA)
+    cache.put(TEST_BUCKET_NAME, "b.txt", METADATA)
+    # touch "a.txt" so that "b.txt" becomes the least recently used entry
+    cache.get(TEST_BUCKET_NAME, "a.txt")
+    cache.put(TEST_BUCKET_NAME, "c.txt", MISSING_OBJECT)
+
+    assert cache.get(TEST_BUCKET_NAME, "b.txt") is None
+    assert cache.get(TEST_BUCKET_NAME, "a.txt") == METADATA
+    assert cache.get(TEST_BUCKET_NAME, "c.txt") == MISSING_OBJECT
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert (stats["hits"], stats["misses"]) == (3, 1)
+
+
+def test__metadata_cache__disabled_with_zero_entries():
+    cache = MetadataCache(max_entries=0, ttl_seconds=60)
+    cache.put(TEST_BUCKET_NAME, "a.txt", METADATA)
+    assert cache.get(TEST_BUCKET_NAME, "a.txt") is None
+
+
+def test__metadata_cache__drops_stale_lookups():
+    cache = MetadataCache(max_entries=1, ttl_seconds=60)
+    generation = cache.generation(TEST_BUCKET_NAME, "a.txt")
+    # the file is uploaded while its lookup waits for S3, which said it did not exist
+    cache.invalidate(TEST_BUCKET_NAME, "a.txt")
+    cache.put(TEST_BUCKET_NAME, "a.txt", MISSING_OBJECT, generation=generation)
+    assert cache.get(TEST_BUCKET_NAME, "a.txt") is None
+
+    generation = cache.generation(TEST_BUCKET_NAME, "a.txt")
+    cache.invalidate(TEST_BUCKET_NAME, "a.txt")
+    # the generation of "a.txt" is forgotten, but the lookup is still known to be stale
+    cache.invalidate(TEST_BUCKET_NAME, "b.txt")
+    cache.put(TEST_BUCKET_NAME, "a.txt", MISSING_OBJECT, generation=generation)
+    assert cache.get(TEST_BUCKET_NAME, "a.txt") is None
+
+    cache.put(TEST_BUCKET_NAME, "a.txt", METADATA, generation=cache.generation(TEST_BUCKET_NAME, "a.txt"))
+    assert cache.get(TEST_BUCKET_NAME, "a.txt") == METADATA
+
+
+def test__head__upload_during_lookup__is_not_cached_as_missing(client: TestClient):
+    def upload_while_s3_answers(**kwargs):
+        client.app.state.metadata_cache.invalidate(client.app.state.settings.s3_bucket_name, "test.txt")
+
+    client.app.state.s3_client.meta.events.register("after-call.s3.HeadObject", upload_while_s3_answers)
+    assert client.head("/files/test.txt").status_code == status.HTTP_404_NOT_FOUND
+    client.app.state.s3_client.meta.events.unregister("after-call.s3.HeadObject", upload_while_s3_answers)
+
+    # the upload reaches S3 without going through this worker's cache
+    boto3.client("s3").put_object(Bucket=TEST_BUCKET_NAME, Key="test.txt", Body=b"content")
+    assert client.head("/files/test.txt").status_code == status.HTTP_200_OK
+
+
+def test__head__hot_key__served_from_cache(client: TestClient):
+    client.put("/files/test.txt", files={"file": ("test.txt", b"content", "text/plain")})
+    s3_calls = count_s3_calls(client)
+
+    for _ in range(3):
+        response = client.head("/files/test.txt")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["Content-Length"] == str(len(b"content"))
+
+    assert s3_calls["HeadObject"] == 1
+
+
+def test__put_and_delete__keep_cache_consistent(client: TestClient):
+    client.put("/files/test.txt", files={"file": ("test.txt", b"content", "text/plain")})
+    assert client.head("/files/test.txt").headers["Content-Length"] == "7"
+
+    # an update through the API is visible right away
+    client.put("/files/test.txt", files={"file": ("test.txt", b"new content", "text/plain")})
+    assert client.head("/files/test.txt").headers["Content-Length"] == "11"
+
+    # so is a deletion, without asking S3 again
+    client.delete("/files/test.txt")
+    s3_calls = count_s3_calls(client)
+    assert client.head("/files/test.txt").status_code == status.HTTP_404_NOT_FOUND
+    assert sum(s3_calls.values()) == 0
+
+
+def test__get__does_not_trust_cached_missing_files(client: TestClient):
+    assert client.head("/files/test.txt").status_code == status.HTTP_404_NOT_FOUND
+    # another worker, whose cache this one does not see, uploads the file
+    boto3.client("s3").put_object(Bucket=TEST_BUCKET_NAME, Key="test.txt", Body=b"content")
+
+    assert client.get("/files/test.txt").content == b"content"
+    assert client.head("/files/test.txt").status_code == status.HTTP_200_OK
+
+
+def test__stats__reports_metadata_cache_counters(client: TestClient):
+    client.head("/files/test.txt")
+    client.head("/files/test.txt")
+
+    stats = client.get("/stats").json()["metadata_cache"]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
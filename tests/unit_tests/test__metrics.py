@@ -0,0 +1,120 @@
+"""Test cases for `metrics`."""
+
+import json
+import os
+from pathlib import Path
+
+from botocore.awsrequest import AWSResponse
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api.main import create_app
+from files_api.metrics import (
+    PROMETHEUS_CONTENT_TYPE,
+    Metrics,
+    write_snapshot,
+)
+from files_api.settings import Settings
+from tests.consts import TEST_BUCKET_NAME
+
+TEST_FILE_PATH = "folder/test.txt"
+TEST_FILE_CONTENT = b"Hello, world!"
+
+# a pid no process can have, standing for a worker that exited
+EXITED_WORKER_PID = 2**22 + 1
+
+
+class ServiceUnavailableBody:
+    def stream(self, **kwargs):
+        yield b""
+
+
+def test__histogram__renders_cumulative_buckets():
+    metrics = Metrics()
+    metrics.s3_request_duration.observe(("GetObject", "200"), 0.007)
+    metrics.s3_request_duration.observe(("GetObject", "200"), 0.02)
+    metrics.s3_request_duration.observe(("GetObject", "200"), 60.0)
+
+    lines = metrics.render().splitlines()
+    assert "# TYPE files_api_s3_request_duration_seconds histogram" in lines
+    assert 'files_api_s3_request_duration_seconds_bucket{operation="GetObject",status="200",le="0.005"} 0' in lines
+    assert 'files_api_s3_request_duration_seconds_bucket{operation="GetObject",status="200",le="0.01"} 1' in lines
+    assert 'files_api_s3_request_duration_seconds_bucket{operation="GetObject",status="200",le="30"} 2' in lines
+    assert 'files_api_s3_request_duration_seconds_bucket{operation="GetObject",status="200",le="+Inf"} 3' in lines
+    assert 'files_api_s3_request_duration_seconds_count{operation="GetObject",status="200"} 3' in lines
+    assert 'files_api_s3_request_duration_seconds_sum{operation="GetObject",status="200"} 60.027' in lines
+
+
+def test__label_values_are_escaped():
+    metrics = Metrics()
+    metrics.http_request_bytes.inc(("PUT", 'a"b\\c\nd'), 3)
+
+    assert 'files_api_http_request_bytes_total{method="PUT",route="a\\"b\\\\c\\nd"} 3' in metrics.render()
+
+
+def test__metrics__requests_labelled_by_route_template(client: TestClient):
+    client.put(f"/files/{TEST_FILE_PATH}", files={"file": ("test.txt", TEST_FILE_CONTENT, "text/plain")})
+    client.get(f"/files/{TEST_FILE_PATH}")
+    client.get("/no/such/route")
+
+    response = client.get("/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["Content-Type"] == PROMETHEUS_CONTENT_TYPE
+    lines = response.text.splitlines()
+    route_labels = 'method="GET",route="/files/{file_path:path}"'
+    assert f'files_api_http_request_duration_seconds_count{{{route_labels},status="200"}} 1' in lines
+    assert f"files_api_http_response_bytes_total{{{route_labels}}} {len(TEST_FILE_CONTENT)}" in lines
+    assert 'files_api_http_request_duration_seconds_count{method="GET",route="unmatched",status="404"} 1' in lines
+    # the request for /metrics is still in flight
+    assert 'files_api_http_requests_in_flight{method="GET"} 1' in lines
+    assert 'files_api_http_requests_in_flight{method="PUT"} 0' in lines
+    put_bytes = [line for line in lines if line.startswith('files_api_http_request_bytes_total{method="PUT"')]
+    assert len(put_bytes) == 1 and int(put_bytes[0].split()[-1]) > len(TEST_FILE_CONTENT)
+
+
+def test__metrics__s3_calls_and_retries(client: TestClient):
+    responses_left = [503]
+
+    def fail_once(request, **kwargs):
+        if responses_left:
+            return AWSResponse(request.url, responses_left.pop(), {}, ServiceUnavailableBody())
+        return None
+
+    # runs before moto, which answers every request otherwise
+    client.app.state.s3_client.meta.events.register_first("before-send.s3", fail_once)
+    assert client.get(f"/files/{TEST_FILE_PATH}").status_code == status.HTTP_404_NOT_FOUND
+
+    lines = client.get("/metrics").text.splitlines()
+    assert 'files_api_s3_request_duration_seconds_count{operation="GetObject",status="404"} 1' in lines
+    assert 'files_api_s3_retries_total{operation="GetObject"} 1' in lines
+
+
+def write_worker_snapshot(directory: Path, pid: int, metrics: Metrics) -> None:
+    snapshot = metrics.snapshot()
+    snapshot["pid"] = pid
+    (directory / f"{pid}.json").write_text(json.dumps(snapshot))
+
+
+def test__metrics__merged_across_workers(mocked_aws: None, tmp_path: Path):  # pylint: disable=unused-argument
+    settings = Settings(s3_bucket_name=TEST_BUCKET_NAME, metrics_multiprocess_dir=str(tmp_path))
+    with TestClient(create_app(settings=settings)) as client:
+        # the parent of the test process stands for a worker still running
+        other_worker = Metrics()
+        other_worker.s3_retries.inc(("GetObject",), 2)
+        other_worker.http_requests_in_flight.inc(("GET",), 4)
+        write_worker_snapshot(tmp_path, os.getppid(), other_worker)
+        exited_worker = Metrics()
+        exited_worker.s3_retries.inc(("GetObject",), 3)
+        exited_worker.http_requests_in_flight.inc(("GET",), 5)
+        write_worker_snapshot(tmp_path, EXITED_WORKER_PID, exited_worker)
+        # this worker's own published snapshot is not counted on top of its live values
+        client.app.state.metrics.s3_retries.inc(("GetObject",), 1)
+        write_snapshot(client.app.state.metrics, str(tmp_path))
+
+        lines = client.get("/metrics").text.splitlines()
+        # counters of every worker add up, but gauges of exited workers are dropped
+        assert 'files_api_s3_retries_total{operation="GetObject"} 6' in lines
+        assert 'files_api_http_requests_in_flight{method="GET"} 5' in lines
+
+    # the worker removes its own snapshot when it shuts down
+    assert {path.name for path in tmp_path.iterdir()} == {f"{os.getppid()}.json", f"{EXITED_WORKER_PID}.json"}
@@ -0,0 +1,140 @@
+"""Test cases for `presigned`."""
+
+import requests
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api.presigned import upload_part_size
+from files_api.settings import (
+    S3_MAX_PARTS,
+    S3_MIN_PART_SIZE_BYTES,
+)
+from tests.fixtures.api_client import MakeClient
+
+TEST_FILE_PATH = "folder/test.txt"
+TEST_FILE_CONTENT = b"Hello, world!"
+
+
+def put_test_file(client: TestClient):
+    return client.put(f"/files/{TEST_FILE_PATH}", files={"file": ("test.txt", TEST_FILE_CONTENT, "text/plain")})
+
+
+def test__upload_part_size__grows_past_the_s3_part_limit():
+    assert upload_part_size(10, S3_MIN_PART_SIZE_BYTES) == S3_MIN_PART_SIZE_BYTES
+    large_file_size = S3_MAX_PARTS * S3_MIN_PART_SIZE_BYTES + 1
+    assert upload_part_size(large_file_size, S3_MIN_PART_SIZE_BYTES) == S3_MIN_PART_SIZE_BYTES + 1
+
+
+def test__get_file__redirects_to_presigned_url(client: TestClient):
+    put_test_file(client)
+
+    response = client.get(f"/files/{TEST_FILE_PATH}", params={"presigned": True}, follow_redirects=False)
+    assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+    assert response.headers["Cache-Control"] == "no-store"
+    # the client downloads the file from S3, ranges included
+    download = requests.get(response.headers["Location"], headers={"Range": "bytes=0-4"}, timeout=5)
+    assert download.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert download.content == TEST_FILE_CONTENT[:5]
+
+
+def test__get_file__presigned__missing_file(client: TestClient):
+    response = client.get(f"/files/{TEST_FILE_PATH}", params={"presigned": True}, follow_redirects=False)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test__get_file__presigned_by_default(make_client: MakeClient):
+    client = make_client(presigned_downloads_enabled=True)
+    client.follow_redirects = False
+    put_test_file(client)
+
+    assert client.get(f"/files/{TEST_FILE_PATH}").status_code == status.HTTP_307_TEMPORARY_REDIRECT
+    response = client.get(f"/files/{TEST_FILE_PATH}", params={"presigned": False})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.content == TEST_FILE_CONTENT
+
+
+def test__get_file__presigned__gzipped_file(make_client: MakeClient):
+    client = make_client(compression_enabled=True, presigned_downloads_enabled=True)
+    client.follow_redirects = False
+    put_test_file(client)
+
+    response = client.get(f"/files/{TEST_FILE_PATH}", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+    download = requests.get(response.headers["Location"], timeout=5)
+    assert download.headers["Content-Encoding"] == "gzip"
+    # requests decompresses the body
+    assert download.content == TEST_FILE_CONTENT
+    # S3 cannot decompress the file, so it goes through the API
+    response = client.get(f"/files/{TEST_FILE_PATH}", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.content == TEST_FILE_CONTENT
+
+
+def test__presigned_upload__single_put(client: TestClient):
+    presign_response = client.post(
+        "/files:presignUpload",
+        json={"file_path": TEST_FILE_PATH, "size_bytes": len(TEST_FILE_CONTENT), "content_type": "text/plain"},
+    )
+    assert presign_response.status_code == status.HTTP_200_OK
+    upload = presign_response.json()
+    assert upload["upload_id"] is None
+    [part] = upload["parts"]
+    assert part["headers"] == {"Content-Type": "text/plain"}
+
+    put_response = requests.put(part["url"], data=TEST_FILE_CONTENT, headers=part["headers"], timeout=5)
+    assert put_response.status_code == status.HTTP_200_OK
+    complete_response = client.post("/files:completeUpload", json={"file_path": TEST_FILE_PATH})
+    assert complete_response.status_code == status.HTTP_200_OK
+
+    response = client.get(f"/files/{TEST_FILE_PATH}")
+    assert response.content == TEST_FILE_CONTENT
+    assert response.headers["Content-Type"].startswith("text/plain")
+
+
+def test__presigned_upload__multipart(client: TestClient):
+    content = b"a" * S3_MIN_PART_SIZE_BYTES + b"b" * S3_MIN_PART_SIZE_BYTES + b"c"
+    client.app.state.settings.multipart_part_size_bytes = S3_MIN_PART_SIZE_BYTES
+    # the metadata cache now knows the file does not exist, until the upload completes
+    assert client.head(f"/files/{TEST_FILE_PATH}").status_code == status.HTTP_404_NOT_FOUND
+
+    upload = client.post("/files:presignUpload", json={"file_path": TEST_FILE_PATH, "size_bytes": len(content)}).json()
+    assert upload["upload_id"] is not None
+    assert upload["part_size_bytes"] == S3_MIN_PART_SIZE_BYTES
+    assert [part["part_number"] for part in upload["parts"]] == [1, 2, 3]
+
+    part_etags = []
+    for part in upload["parts"]:
+        start = (part["part_number"] - 1) * upload["part_size_bytes"]
+        part_content = content[start : start + upload["part_size_bytes"]]
+        part_etags.append(requests.put(part["url"], data=part_content, timeout=5).headers["ETag"])
+    complete_response = client.post(
+        "/files:completeUpload",
+        json={"file_path": TEST_FILE_PATH, "upload_id": upload["upload_id"], "part_etags": part_etags},
+    )
+    assert complete_response.status_code == status.HTTP_200_OK
+
+    assert client.head(f"/files/{TEST_FILE_PATH}").headers["Content-Length"] == str(len(content))
+    assert client.get(f"/files/{TEST_FILE_PATH}").content == content
+
+
+def test__presigned_upload__errors(client: TestClient):
+    # a single PUT that was never sent
+    response = client.post("/files:completeUpload", json={"file_path": TEST_FILE_PATH})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = client.post("/files:completeUpload", json={"file_path": TEST_FILE_PATH, "upload_id": "upload"})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    client.app.state.settings.multipart_part_size_bytes = S3_MIN_PART_SIZE_BYTES
+    upload = client.post(
+        "/files:presignUpload", json={"file_path": TEST_FILE_PATH, "size_bytes": 2 * S3_MIN_PART_SIZE_BYTES}
+    ).json()
+    response = client.post(
+        "/files:completeUpload",
+        json={"file_path": TEST_FILE_PATH, "upload_id": upload["upload_id"], "part_etags": ['"0"', '"1"']},
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    abort_request = {"file_path": TEST_FILE_PATH, "upload_id": upload["upload_id"]}
+    assert client.post("/files:abortUpload", json=abort_request).status_code == status.HTTP_204_NO_CONTENT
+    assert client.post("/files:abortUpload", json=abort_request).status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,73 @@
+"""Test cases for `profiling`."""
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api.profiling import (
+    PROFILE_ID_HEADER,
+    PROFILE_REQUEST_HEADER,
+)
+from tests.consts import TEST_BUCKET_NAME
+from tests.fixtures.api_client import MakeClient
+
+TEST_FILE_PATH = "folder/test.txt"
+TEST_FILE_CONTENT = b"Hello, world!"
+
+
+@pytest.fixture
+def profiling_client(make_client: MakeClient) -> TestClient:
+    client = make_client(profiling_header_enabled=True)
+    client.put(f"/files/{TEST_FILE_PATH}", files={"file": ("test.txt", TEST_FILE_CONTENT, "text/plain")})
+    return client
+
+
+def server_timing_names(response) -> list[str]:
+    return [metric.split(";")[0].strip() for metric in response.headers["Server-Timing"].split(",")]
+
+
+def test__profiled_request__server_timing_breakdown(profiling_client: TestClient):
+    profiling_client.app.state.metadata_cache.invalidate(TEST_BUCKET_NAME, TEST_FILE_PATH)
+    response = profiling_client.get(f"/files/{TEST_FILE_PATH}", headers={PROFILE_REQUEST_HEADER: "1"})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert server_timing_names(response) == ["s3", "validation", "endpoint", "serialization", "total"]
+    assert 's3;desc="GetObject";dur=' in response.headers["Server-Timing"]
+
+    profile = profiling_client.get(f"/debug/profiles/{response.headers[PROFILE_ID_HEADER]}").json()
+    assert (profile["method"], profile["path"], profile["status_code"]) == ("GET", f"/files/{TEST_FILE_PATH}", 200)
+    assert profile["trigger"] == "header"
+    # the body is sent after the headers, so its phase is only in the stored profile
+    assert [phase["name"] for phase in profile["phases"]][-1] == "response"
+
+
+def test__profiled_request__validation_error(profiling_client: TestClient):
+    response = profiling_client.get("/files", params={"page_size": -1}, headers={PROFILE_REQUEST_HEADER: "1"})
+
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert server_timing_names(response) == ["validation", "total"]
+
+
+def test__request_without_header_is_not_profiled(profiling_client: TestClient):
+    response = profiling_client.get(f"/files/{TEST_FILE_PATH}")
+
+    assert "Server-Timing" not in response.headers
+    assert profiling_client.get("/debug/profiles").json() == {"profiles": []}
+
+
+def test__sampled_requests_are_stored(make_client: MakeClient):
+    client = make_client(profiling_sample_rate=1.0, profiling_max_stored_profiles=2)
+    for _ in range(3):
+        client.get("/files")
+
+    profiles = client.get("/debug/profiles").json()["profiles"]
+    # the request listing the profiles is profiled too, but only stored once it is over
+    assert [profile["path"] for profile in profiles] == ["/files", "/files"]
+    assert {profile["trigger"] for profile in profiles} == {"sample"}
+
+
+def test__profiling_disabled_by_default(client: TestClient):
+    response = client.get("/files", headers={PROFILE_REQUEST_HEADER: "1"})
+
+    assert "Server-Timing" not in response.headers
+    assert client.get("/debug/profiles").status_code == status.HTTP_404_NOT_FOUND
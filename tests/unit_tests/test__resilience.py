@@ -0,0 +1,161 @@
+"""Test cases for `resilience`."""
+
+import pytest
+from botocore.awsrequest import AWSResponse
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api.resilience import (
+    AdaptiveRateLimiter,
+    CircuitBreaker,
+    RetryBudget,
+)
+from tests.fixtures.api_client import MakeClient
+
+TEST_FILE_PATH = "folder/test.txt"
+
+SLOW_DOWN_BODY = b"<Error><Code>SlowDown</Code><Message>Please reduce your request rate.</Message></Error>"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class ErrorBody:
+    def stream(self, **kwargs):
+        yield SLOW_DOWN_BODY
+
+
+class FaultyS3:
+    """Answers every request reaching S3 with 503 SlowDown while `failing`, and counts the requests sent."""
+
+    def __init__(self):
+        self.failing = True
+        self.requests_sent = 0
+
+    def __call__(self, request, **kwargs):
+        self.requests_sent += 1
+        if self.failing:
+            return AWSResponse(request.url, 503, {}, ErrorBody())
+        return None
+
+
+def make_faulty_client(make_client: MakeClient, **settings_overrides) -> tuple[TestClient, FaultyS3]:
+    # warm-up calls would otherwise reach S3 before the faults are injected
+    client = make_client(s3_warm_up_connections=0, **settings_overrides)
+    faulty_s3 = FaultyS3()
+    # runs before moto, which answers every request otherwise
+    client.app.state.s3_client.meta.events.register_first("before-send.s3", faulty_s3)
+    return client, faulty_s3
+
+
+def test__rate_limiter__halves_rate_when_throttled():
+    clock = FakeClock()
+    rate_limiter = AdaptiveRateLimiter(max_rate=4, min_rate=1, clock=clock)
+    assert [rate_limiter.reserve(timeout_seconds=0) for _ in range(4)] == [0, 0, 0, 0]
+    # the next token comes a quarter of a second later
+    assert rate_limiter.reserve(timeout_seconds=0.1) is None
+    assert rate_limiter.reserve(timeout_seconds=1) == pytest.approx(0.25)
+
+    rate_limiter.on_throttled()
+    assert rate_limiter.rate == 2
+    # a burst of throttled calls halves the rate once
+    rate_limiter.on_throttled()
+    assert rate_limiter.rate == 2
+    clock.now = 1.0
+    rate_limiter.on_throttled()
+    rate_limiter.on_throttled()
+    assert rate_limiter.rate == 1
+
+    rate_limiter.on_success()
+    assert rate_limiter.rate == pytest.approx(1.05)
+
+
+def test__retry_budget__allows_a_fraction_of_calls():
+    retry_budget = RetryBudget(ratio=0.5, max_balance=1)
+    assert retry_budget.withdraw()
+    assert not retry_budget.withdraw()
+
+    retry_budget.deposit()
+    assert not retry_budget.withdraw()
+    retry_budget.deposit()
+    assert retry_budget.withdraw()
+
+
+def test__circuit_breaker__opens_then_checks_with_one_call():
+    clock = FakeClock()
+    circuit_breaker = CircuitBreaker(failure_threshold=2, reset_timeout_seconds=10, clock=clock)
+    circuit_breaker.record_failure()
+    assert circuit_breaker.allow() is None
+    circuit_breaker.record_failure()
+    assert circuit_breaker.state == CircuitBreaker.OPEN
+    assert circuit_breaker.allow() == 10
+
+    clock.now = 10.0
+    assert circuit_breaker.state == CircuitBreaker.HALF_OPEN
+    assert circuit_breaker.allow() is None
+    # the other calls keep failing fast while one checks on S3
+    assert circuit_breaker.allow() == 10
+    circuit_breaker.record_failure()
+    assert circuit_breaker.state == CircuitBreaker.OPEN
+
+    clock.now = 20.0
+    assert circuit_breaker.allow() is None
+    circuit_breaker.record_success()
+    assert circuit_breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.fixture
+def failing_client(make_client: MakeClient) -> tuple[TestClient, FaultyS3]:
+    return make_faulty_client(make_client, s3_max_attempts=1, s3_circuit_breaker_failure_threshold=2)
+
+
+def test__throttled_s3__answers_503(failing_client: tuple[TestClient, FaultyS3]):
+    client, _ = failing_client
+
+    response = client.get(f"/files/{TEST_FILE_PATH}")
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["Retry-After"] == "1"
+    assert client.get("/stats").json()["s3_resilience"]["request_rate_limit"] == 500
+
+
+def test__circuit_breaker__fails_fast_without_calling_s3(failing_client: tuple[TestClient, FaultyS3]):
+    client, faulty_s3 = failing_client
+    client.get(f"/files/{TEST_FILE_PATH}")
+    client.get(f"/files/{TEST_FILE_PATH}")
+    assert faulty_s3.requests_sent == 2
+
+    response = client.get(f"/files/{TEST_FILE_PATH}")
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["Retry-After"] == "10"
+    assert faulty_s3.requests_sent == 2
+    stats = client.get("/stats").json()["s3_resilience"]
+    assert stats["circuit_state"] == "open"
+    assert stats["rejected_calls"]["circuit_open"] == 1
+
+
+def test__retry_budget__stops_retries(make_client: MakeClient):
+    client, faulty_s3 = make_faulty_client(
+        make_client, s3_max_attempts=5, s3_retry_budget_ratio=0, s3_retry_budget_max_retries=1
+    )
+    response = client.get(f"/files/{TEST_FILE_PATH}")
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    # the first attempt, and the only retry in the budget
+    assert faulty_s3.requests_sent == 2
+    assert client.get("/stats").json()["s3_resilience"]["rejected_calls"]["retry_budget_exhausted"] == 1
+
+
+def test__request_timeout__bounds_wait_for_rate_limiter(make_client: MakeClient):
+    client, faulty_s3 = make_faulty_client(make_client, s3_max_request_rate=1)
+    faulty_s3.failing = False
+    # takes the only token of the first second
+    assert client.get(f"/files/{TEST_FILE_PATH}").status_code == status.HTTP_404_NOT_FOUND
+
+    # another file, whose metadata is not cached
+    response = client.get("/files/other.txt", headers={"X-Request-Timeout": "0.5"})
+    assert response.status_code == status.HTTP_504_GATEWAY_TIMEOUT
+    assert faulty_s3.requests_sent == 1
@@ -50,6 +50,10 @@ def test_get_files_page_token_is_mutually_exclusive_with_page_size_and_directory
     assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
     assert "mutually exclusive" in str(response.json())
 
+    response = client.get("/files?page_token=token&recursive=false")
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert "mutually exclusive" in str(response.json())
+
 
 def test_unforeseemn_500_error(client: TestClient):
     # delete s3 bucket and all objects in it
@@ -59,3 +63,11 @@ def test_unforeseemn_500_error(client: TestClient):
     response = client.get("/files")
     assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
     assert response.json() == {"detail": "Internal server error"}
+
+
+def test__get__file__unsatisfiable_range(client: TestClient):
+    client.put("/files/test.txt", files={"file": ("test.txt", b"Hello, world!", "text/plain")})
+
+    response = client.get("/files/test.txt", headers={"Range": "bytes=100-200"})
+    assert response.status_code == status.HTTP_416_RANGE_NOT_SATISFIABLE
+    assert response.headers["Content-Range"] == "bytes */13"
@@ -54,6 +54,57 @@ def test__list__files__with__pagination(client: TestClient):
     assert len(data["files"]) == 10
     assert "next_page_token" in data
 
+    # follow the page token to the last page
+    response = client.get("/files", params={"page_token": data["next_page_token"]})
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["files"]) == 5
+    assert data["next_page_token"] is None
+
+
+def test__list__files__with__pagination__stays_in_directory(client: TestClient):
+    for file_path in [f"a/{i:02}.txt" for i in range(12)] + [f"b/{i:02}.txt" for i in range(3)]:
+        client.put(f"/files/{file_path}", files={"file": (file_path, TEST_FILE_CONTENT, TEST_FILE_CONTENT_TYPE)})
+
+    data = client.get("/files", params={"directory": "a/", "page_size": 10}).json()
+    assert len(data["files"]) == 10
+
+    # the page token keeps listing a/, not its sibling b/
+    data = client.get("/files", params={"page_token": data["next_page_token"]}).json()
+    assert [file["file_path"] for file in data["files"]] == ["a/10.txt", "a/11.txt"]
+    assert data["next_page_token"] is None
+
+
+def test__list__files__one_directory_level(client: TestClient):
+    for file_path in ["photos/a.jpg", "photos/2023/x.jpg", "photos/2023/deep/y.jpg", "photos/2024/z.jpg", "top.txt"]:
+        client.put(f"/files/{file_path}", files={"file": (file_path, TEST_FILE_CONTENT, TEST_FILE_CONTENT_TYPE)})
+
+    response = client.get("/files", params={"directory": "photos/", "recursive": False})
+    assert response.status_code == 200
+    data = response.json()
+    assert [file["file_path"] for file in data["files"]] == ["photos/a.jpg"]
+    assert data["directories"] == ["photos/2023/", "photos/2024/"]
+    assert data["next_page_token"] is None
+
+    # recursive listings have no subdirectories
+    assert client.get("/files", params={"directory": "photos/"}).json()["directories"] == []
+
+
+def test__list__files__one_directory_level__pagination(client: TestClient):
+    for i in range(12):
+        client.put(f"/files/dir/sub{i:02}/file.txt", files={"file": ("file.txt", TEST_FILE_CONTENT, TEST_FILE_CONTENT_TYPE)})
+    client.put("/files/dir/file.txt", files={"file": ("file.txt", TEST_FILE_CONTENT, TEST_FILE_CONTENT_TYPE)})
+
+    data = client.get("/files", params={"directory": "dir/", "recursive": False, "page_size": 10}).json()
+    listed_entries = [file["file_path"] for file in data["files"]] + data["directories"]
+    assert len(listed_entries) == 10
+
+    # the page token keeps listing one level of dir/
+    data = client.get("/files", params={"page_token": data["next_page_token"]}).json()
+    listed_entries += [file["file_path"] for file in data["files"]] + data["directories"]
+    assert sorted(listed_entries) == sorted(["dir/file.txt"] + [f"dir/sub{i:02}/" for i in range(12)])
+    assert data["next_page_token"] is None
+
 
 def test__get__file__metadata(client: TestClient):
     # Upload a file
@@ -96,4 +147,81 @@ def test__delete__file(client: TestClient):
     # Verify deletion
     # The API should return a 404 status code when trying to get a deleted file
     response = client.get(f"/files/{TEST_FILE_PATH}")
-    assert response.status_code == 404
\ No newline at end of file
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize(
+    "range_header, expected_content, expected_content_range",
+    [
+        ("bytes=0-4", b"Hello", "bytes 0-4/13"),
+        ("bytes=7-", b"world!", "bytes 7-12/13"),
+        ("bytes=-6", b"world!", "bytes 7-12/13"),
+        ("bytes=7-100", b"world!", "bytes 7-12/13"),
+    ],
+)
+def test__get__file__byte_range(
+    client: TestClient,
+    range_header: str,
+    expected_content: bytes,
+    expected_content_range: str,
+):
+    client.put(
+        f"/files/{TEST_FILE_PATH}",
+        files={"file": (TEST_FILE_PATH, TEST_FILE_CONTENT, TEST_FILE_CONTENT_TYPE)},
+    )
+
+    response = client.get(f"/files/{TEST_FILE_PATH}", headers={"Range": range_header})
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert response.content == expected_content
+    assert response.headers["Content-Range"] == expected_content_range
+    assert response.headers["Content-Length"] == str(len(expected_content))
+    assert response.headers["Accept-Ranges"] == "bytes"
+
+
+def test__get__file__ignores_unsupported_range(client: TestClient):
+    client.put(
+        f"/files/{TEST_FILE_PATH}",
+        files={"file": (TEST_FILE_PATH, TEST_FILE_CONTENT, TEST_FILE_CONTENT_TYPE)},
+    )
+
+    # multiple ranges are not supported, so the whole file is served
+    response = client.get(f"/files/{TEST_FILE_PATH}", headers={"Range": "bytes=0-1,4-5"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.content == TEST_FILE_CONTENT
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert "Content-Range" not in response.headers
+
+
+@pytest.mark.parametrize("method", ["GET", "HEAD"])
+def test__get__file__conditional_requests(client: TestClient, method: str):
+    client.put(
+        f"/files/{TEST_FILE_PATH}",
+        files={"file": (TEST_FILE_PATH, TEST_FILE_CONTENT, TEST_FILE_CONTENT_TYPE)},
+    )
+    response = client.request(method, f"/files/{TEST_FILE_PATH}")
+    assert response.status_code == status.HTTP_200_OK
+    etag = response.headers["ETag"]
+    last_modified = response.headers["Last-Modified"]
+    assert etag.startswith('"') and etag.endswith('"')
+
+    # unchanged file: 304 without a body, but with the validators
+    for conditional_headers in [
+        {"If-None-Match": etag},
+        {"If-None-Match": f'"some-other-etag", W/{etag}'},
+        {"If-Modified-Since": last_modified},
+    ]:
+        response = client.request(method, f"/files/{TEST_FILE_PATH}", headers=conditional_headers)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+
+    # changed file: the full response
+    for conditional_headers in [
+        {"If-None-Match": '"some-other-etag"'},
+        {"If-Modified-Since": "Mon, 01 Jan 2001 00:00:00 GMT"},
+    ]:
+        response = client.request(method, f"/files/{TEST_FILE_PATH}", headers=conditional_headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["ETag"] == etag
+        if method == "GET":
+            assert response.content == TEST_FILE_CONTENT
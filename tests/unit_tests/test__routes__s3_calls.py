@@ -0,0 +1,106 @@
+"""Test the number of S3 calls each route makes, so extra round trips do not creep back into the request paths."""
+
+from collections import Counter
+
+import boto3
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from tests.consts import TEST_BUCKET_NAME
+
+TEST_FILE_PATH = "folder/test.txt"
+TEST_FILE_CONTENT = b"Hello, world!"
+
+
+@pytest.fixture
+def existing_file(mocked_aws: None) -> None:  # pylint: disable=unused-argument
+    # written directly to S3, so the app has nothing cached about it
+    boto3.client("s3").put_object(Bucket=TEST_BUCKET_NAME, Key=TEST_FILE_PATH, Body=TEST_FILE_CONTENT)
+
+
+def put_test_file(client: TestClient):
+    return client.put(f"/files/{TEST_FILE_PATH}", files={"file": ("test.txt", TEST_FILE_CONTENT, "text/plain")})
+
+
+@pytest.mark.parametrize(
+    "send_request, expected_status_code, expected_s3_calls",
+    [
+        (lambda client: client.get(f"/files/{TEST_FILE_PATH}"), status.HTTP_200_OK, {"GetObject": 1}),
+        (lambda client: client.head(f"/files/{TEST_FILE_PATH}"), status.HTTP_200_OK, {"HeadObject": 1}),
+        (lambda client: client.get("/files"), status.HTTP_200_OK, {"ListObjectsV2": 1}),
+        (lambda client: client.get("/files?recursive=false"), status.HTTP_200_OK, {"ListObjectsV2": 1}),
+        # S3 does not tell whether a PUT replaced an object: the conditional write fails, then is sent unconditionally
+        (put_test_file, status.HTTP_200_OK, {"PutObject": 2}),
+        # S3 does not tell whether a DELETE removed an object either
+        (
+            lambda client: client.delete(f"/files/{TEST_FILE_PATH}"),
+            status.HTTP_204_NO_CONTENT,
+            {"HeadObject": 1, "DeleteObject": 1},
+        ),
+    ],
+)
+def test__s3_calls__existing_file(
+    existing_file: None,  # pylint: disable=unused-argument
+    client: TestClient,
+    s3_calls: Counter,
+    send_request,
+    expected_status_code: int,
+    expected_s3_calls: dict,
+):
+    assert send_request(client).status_code == expected_status_code
+    assert s3_calls == expected_s3_calls
+
+
+@pytest.mark.parametrize(
+    "send_request, expected_status_code, expected_s3_calls",
+    [
+        (lambda client: client.get(f"/files/{TEST_FILE_PATH}"), status.HTTP_404_NOT_FOUND, {"GetObject": 1}),
+        (lambda client: client.head(f"/files/{TEST_FILE_PATH}"), status.HTTP_404_NOT_FOUND, {"HeadObject": 1}),
+        (put_test_file, status.HTTP_201_CREATED, {"PutObject": 1}),
+        (lambda client: client.delete(f"/files/{TEST_FILE_PATH}"), status.HTTP_404_NOT_FOUND, {"HeadObject": 1}),
+    ],
+)
+def test__s3_calls__missing_file(
+    client: TestClient,
+    s3_calls: Counter,
+    send_request,
+    expected_status_code: int,
+    expected_s3_calls: dict,
+):
+    assert send_request(client).status_code == expected_status_code
+    assert s3_calls == expected_s3_calls
+
+
+def test__s3_calls__cached_metadata_saves_the_pre_flight_calls(
+    existing_file: None,  # pylint: disable=unused-argument
+    client: TestClient,
+    s3_calls: Counter,
+):
+    assert client.get(f"/files/{TEST_FILE_PATH}").status_code == status.HTTP_200_OK
+    s3_calls.clear()
+
+    # the GET cached the metadata, so the update and the delete know that the file exists
+    assert put_test_file(client).status_code == status.HTTP_200_OK
+    assert client.head(f"/files/{TEST_FILE_PATH}").status_code == status.HTTP_200_OK
+    assert client.delete(f"/files/{TEST_FILE_PATH}").status_code == status.HTTP_204_NO_CONTENT
+    assert s3_calls == {"PutObject": 1, "HeadObject": 1, "DeleteObject": 1}
+
+    # and that it is gone, although GET still asks S3, as another worker may have uploaded the file since
+    s3_calls.clear()
+    assert client.head(f"/files/{TEST_FILE_PATH}").status_code == status.HTTP_404_NOT_FOUND
+    assert client.get(f"/files/{TEST_FILE_PATH}").status_code == status.HTTP_404_NOT_FOUND
+    assert s3_calls == {"GetObject": 1}
+
+
+def test__s3_calls__not_modified_from_cached_metadata(
+    existing_file: None,  # pylint: disable=unused-argument
+    client: TestClient,
+    s3_calls: Counter,
+):
+    etag = client.get(f"/files/{TEST_FILE_PATH}").headers["ETag"]
+    s3_calls.clear()
+
+    response = client.get(f"/files/{TEST_FILE_PATH}", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert s3_calls == {}
@@ -0,0 +1,114 @@
+"""Test cases for `serialization`."""
+
+import csv
+import io
+from datetime import (
+    datetime,
+    timedelta,
+    timezone,
+)
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from pydantic import TypeAdapter
+
+from files_api.schemas import (
+    BatchHeadResponse,
+    FileHeadResult,
+    FileMetadata,
+    GetFilesResponse,
+)
+from files_api.serialization import (
+    MSGPACK_MEDIA_TYPE,
+    NEXT_PAGE_TOKEN_HEADER,
+    batch_head_response,
+    get_files_response,
+)
+from tests.fixtures.files import put_files
+
+FILES = [
+    {"file_path": "plain.txt", "last_modified": datetime(2024, 1, 1, tzinfo=timezone.utc), "size_bytes": 0},
+    {
+        "file_path": 'quotes " and \\ and\nnewline and é',
+        "last_modified": datetime(2024, 1, 1, 1, 2, 3, 450000, tzinfo=timezone(timedelta(hours=2))),
+        "size_bytes": 2**40,
+    },
+]
+
+
+@pytest.mark.parametrize("next_page_token", [None, "token"])
+@pytest.mark.parametrize("directories", [[], ["photos/2024/"]])
+def test__get_files_response__same_json_as_model(next_page_token, directories):
+    model = GetFilesResponse(
+        files=[FileMetadata(**file) for file in FILES], directories=directories, next_page_token=next_page_token
+    )
+
+    response = get_files_response(FILES, next_page_token=next_page_token, directories=directories)
+    assert response.body == TypeAdapter(GetFilesResponse).dump_json(model)
+
+
+def test__batch_head_response__same_json_as_model():
+    files = [
+        {
+            "file_path": "missing.txt",
+            "exists": False,
+            "size_bytes": None,
+            "content_type": None,
+            "etag": None,
+            "last_modified": None,
+        },
+        {
+            "file_path": "a.txt",
+            "exists": True,
+            "size_bytes": 7,
+            "content_type": "text/plain",
+            "etag": '"abc"',
+            "last_modified": FILES[1]["last_modified"],
+        },
+    ]
+    model = BatchHeadResponse(files=[FileHeadResult(**file) for file in files])
+
+    assert batch_head_response(files).body == TypeAdapter(BatchHeadResponse).dump_json(model)
+
+
+def test__list_files__csv(client: TestClient):
+    put_files([f"folder/{index:02}.txt" for index in range(12)])
+
+    response = client.get("/files", params={"directory": "folder/"}, headers={"Accept": "text/csv"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["Content-Type"] == "text/csv; charset=utf-8"
+    assert response.headers["Vary"] == "Accept"
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["file_path"] for row in rows] == [f"folder/{index:02}.txt" for index in range(10)]
+    assert rows[0]["size_bytes"] == str(len(b"content"))
+
+    next_page = client.get("/files", params={"page_token": response.headers[NEXT_PAGE_TOKEN_HEADER]})
+    assert [file["file_path"] for file in next_page.json()["files"]] == ["folder/10.txt", "folder/11.txt"]
+
+
+def test__list_files__msgpack(client: TestClient):
+    msgpack = pytest.importorskip("msgpack")
+    put_files(["a.txt"])
+
+    response = client.get("/files", headers={"Accept": MSGPACK_MEDIA_TYPE})
+    assert response.headers["Content-Type"] == MSGPACK_MEDIA_TYPE
+    assert msgpack.unpackb(response.content) == client.get("/files").json()
+
+
+def test__list_files__not_acceptable(client: TestClient):
+    response = client.get("/files", headers={"Accept": "application/xml"})
+    assert response.status_code == status.HTTP_406_NOT_ACCEPTABLE
+
+
+def test__batch_head__csv(client: TestClient):
+    put_files(["a.txt"])
+
+    response = client.post(
+        "/files:batchHead", json={"file_paths": ["a.txt", "missing.txt"]}, headers={"Accept": "text/csv"}
+    )
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [(row["file_path"], row["exists"], row["size_bytes"]) for row in rows] == [
+        ("a.txt", "true", str(len(b"content"))),
+        ("missing.txt", "false", ""),
+    ]
@@ -0,0 +1,86 @@
+"""Test cases for `server`."""
+
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from files_api.server import (
+    APP_FACTORY,
+    main,
+    parse_args,
+    resolve_event_loop,
+    uvicorn_options,
+)
+from files_api.settings import ServerSettings
+
+
+def test__uvicorn_options__defaults(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr("files_api.server.available_cpu_count", lambda: 6)
+
+    options = uvicorn_options(ServerSettings())
+    assert options["workers"] == 6
+    assert options["factory"] is True
+    assert options["backlog"] == 2048
+    assert options["timeout_keep_alive"] == 65
+    assert options["timeout_graceful_shutdown"] == 30
+    assert options["loop"] in ("uvloop", "asyncio")
+    assert options["http"] in ("httptools", "h11")
+
+
+def test__resolve_event_loop(monkeypatch: pytest.MonkeyPatch):
+    assert resolve_event_loop("asyncio") == "asyncio"
+    monkeypatch.setattr("importlib.util.find_spec", lambda name: None)
+    assert resolve_event_loop("auto") == "asyncio"
+    monkeypatch.setattr("importlib.util.find_spec", lambda name: object())
+    assert resolve_event_loop("auto") == "uvloop"
+
+
+def test__parse_args__command_line_overrides_environment(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("SERVER_PORT", "9000")
+    monkeypatch.setenv("SERVER_WORKERS", "3")
+
+    server_settings = parse_args(["--workers", "2", "--timeout-graceful-shutdown-seconds", "5"])
+    assert server_settings.port == 9000
+    assert server_settings.workers == 2
+    assert server_settings.timeout_graceful_shutdown_seconds == 5
+
+
+def test__main__requires_bucket_name(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.delenv("S3_BUCKET_NAME", raising=False)
+    assert main([]) == 2
+
+
+def test__main__runs_app_factory_in_workers(monkeypatch: pytest.MonkeyPatch):
+    calls = []
+
+    def run(app, **options):
+        # the workers share a directory to merge their metrics
+        assert os.path.isdir(os.environ["METRICS_MULTIPROCESS_DIR"])
+        calls.append((app, options))
+
+    fake_uvicorn = SimpleNamespace(run=run)
+    monkeypatch.setitem(sys.modules, "uvicorn", fake_uvicorn)
+    monkeypatch.setenv("S3_BUCKET_NAME", "some-bucket")
+    monkeypatch.delenv("METRICS_MULTIPROCESS_DIR", raising=False)
+
+    assert main(["--workers", "2", "--loop", "asyncio"]) == 0
+    [(app, options)] = calls
+    assert app == APP_FACTORY
+    assert options["workers"] == 2
+    assert options["loop"] == "asyncio"
+    # and it is removed once the server has stopped
+    assert not os.path.exists(os.environ["METRICS_MULTIPROCESS_DIR"])
+
+
+def test__main__warns_about_listing_index_per_worker(monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture):
+    monkeypatch.setitem(sys.modules, "uvicorn", SimpleNamespace(run=lambda app, **options: None))
+    monkeypatch.setenv("S3_BUCKET_NAME", "some-bucket")
+    monkeypatch.setenv("LISTING_INDEX_ENABLED", "true")
+    monkeypatch.delenv("METRICS_MULTIPROCESS_DIR", raising=False)
+
+    assert main(["--workers", "1"]) == 0
+    assert "listing index" not in capsys.readouterr().err
+    assert main(["--workers", "2"]) == 0
+    assert "listing index" in capsys.readouterr().err
@@ -0,0 +1,130 @@
+"""Test cases for `single_flight`."""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api.single_flight import SingleFlight
+from tests.fixtures.s3_calls import count_s3_calls
+
+TEST_FILE_PATH = "folder/test.txt"
+TEST_FILE_CONTENT = b"Hello, world!"
+
+CONCURRENT_REQUESTS = 8
+
+
+def test__single_flight__shares_one_call():
+    calls = []
+
+    async def call() -> str:
+        calls.append(None)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def run() -> list[tuple[str, bool]]:
+        single_flight = SingleFlight()
+        results = await asyncio.gather(*(single_flight.do(("op", "key"), call) for _ in range(3)))
+        # the call is over, so the next one is made again
+        results.append(await single_flight.do(("op", "key"), call))
+        assert single_flight.stats() == {"op": {"calls": 2, "coalesced": 2, "in_flight": 0}}
+        return results
+
+    assert asyncio.run(run()) == [("result", True), ("result", False), ("result", False), ("result", True)]
+    assert len(calls) == 2
+
+
+def test__single_flight__shares_errors_and_outlives_cancelled_callers():
+    async def call() -> str:
+        await asyncio.sleep(0.01)
+        raise ValueError("failed")
+
+    async def run():
+        single_flight = SingleFlight()
+        first = asyncio.ensure_future(single_flight.do(("op", "key"), call))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(single_flight.do(("op", "key"), call))
+        await asyncio.sleep(0)
+        # the caller that made the call leaves, the other still gets its outcome
+        first.cancel()
+        with pytest.raises(ValueError):
+            await second
+
+    asyncio.run(run())
+
+
+def test__single_flight__hands_result_back_when_its_caller_leaves():
+    abandoned = []
+
+    async def call() -> str:
+        await asyncio.sleep(0.01)
+        return "open body"
+
+    async def run():
+        single_flight = SingleFlight()
+        caller = asyncio.ensure_future(single_flight.do(("op", "key"), call, on_abandoned=abandoned.append))
+        await asyncio.sleep(0)
+        caller.cancel()
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert abandoned == ["open body"]
+
+
+def send_concurrently(client: TestClient, method: str, url: str) -> list:
+    with ThreadPoolExecutor(max_workers=CONCURRENT_REQUESTS) as executor:
+        return list(executor.map(lambda _: client.request(method, url), range(CONCURRENT_REQUESTS)))
+
+
+def test__concurrent_downloads__share_one_get_object(client: TestClient):
+    client.put(f"/files/{TEST_FILE_PATH}", files={"file": ("test.txt", TEST_FILE_CONTENT, "text/plain")})
+    s3_calls = count_s3_calls(client, delay_seconds=0.2)
+
+    responses = send_concurrently(client, "GET", f"/files/{TEST_FILE_PATH}")
+    assert all(response.status_code == status.HTTP_200_OK for response in responses)
+    assert all(response.content == TEST_FILE_CONTENT for response in responses)
+    assert s3_calls["GetObject"] < CONCURRENT_REQUESTS
+    stats = client.get("/stats").json()["single_flight"]["get_object"]
+    assert stats["calls"] == s3_calls["GetObject"]
+    assert stats["calls"] + stats["coalesced"] == CONCURRENT_REQUESTS
+
+
+def test__concurrent_metadata_lookups__share_one_head_object(client: TestClient):
+    client.put(f"/files/{TEST_FILE_PATH}", files={"file": ("test.txt", TEST_FILE_CONTENT, "text/plain")})
+    # forget the metadata cached by the upload
+    client.app.state.metadata_cache.invalidate(client.app.state.settings.s3_bucket_name, TEST_FILE_PATH)
+    s3_calls = count_s3_calls(client, delay_seconds=0.2)
+
+    responses = send_concurrently(client, "HEAD", f"/files/{TEST_FILE_PATH}")
+    assert all(response.headers["Content-Length"] == str(len(TEST_FILE_CONTENT)) for response in responses)
+    assert s3_calls["HeadObject"] < CONCURRENT_REQUESTS
+    assert client.get("/stats").json()["single_flight"]["head_object"]["calls"] == s3_calls["HeadObject"]
+
+
+def test__concurrent_downloads__of_large_file(client: TestClient):
+    client.app.state.settings.single_flight_max_body_bytes = 4
+    client.put(f"/files/{TEST_FILE_PATH}", files={"file": ("test.txt", TEST_FILE_CONTENT, "text/plain")})
+    count_s3_calls(client, delay_seconds=0.2)
+
+    # the body is too large to share, so each request streams its own
+    responses = send_concurrently(client, "GET", f"/files/{TEST_FILE_PATH}")
+    assert all(response.content == TEST_FILE_CONTENT for response in responses)
+
+
+def test__shared_download__each_request_keeps_its_own_deadline(client: TestClient):
+    client.put(f"/files/{TEST_FILE_PATH}", files={"file": ("test.txt", TEST_FILE_CONTENT, "text/plain")})
+    count_s3_calls(client, delay_seconds=0.5)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        # the first request makes the call, then gives up on it at its deadline
+        timed_out = executor.submit(client.get, f"/files/{TEST_FILE_PATH}", headers={"X-Request-Timeout": "0.2"})
+        time.sleep(0.1)
+        joined = executor.submit(client.get, f"/files/{TEST_FILE_PATH}")
+
+        assert timed_out.result().status_code == status.HTTP_504_GATEWAY_TIMEOUT
+        # the call itself is not cut short by that deadline
+        assert joined.result().content == TEST_FILE_CONTENT
+    assert client.get("/stats").json()["single_flight"]["get_object"]["coalesced"] == 1
@@ -0,0 +1,141 @@
+"""Test cases for `uploads`."""
+
+import asyncio
+import threading
+
+import boto3
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+import files_api.uploads
+from files_api.s3.executor import S3Executor
+from files_api.settings import S3_MIN_PART_SIZE_BYTES
+from files_api.uploads import (
+    CONDITIONAL_PUT_MAX_BYTES,
+    iter_parts,
+    upload_stream_to_s3,
+)
+from tests.consts import TEST_BUCKET_NAME
+from tests.fixtures.api_client import MakeClient
+from tests.fixtures.files import as_chunks
+from tests.fixtures.s3_calls import count_s3_calls
+
+PART_SIZE = S3_MIN_PART_SIZE_BYTES
+LARGE_FILE_CONTENT = b"a" * PART_SIZE + b"b" * PART_SIZE + b"c" * 1024
+
+
+def upload(content: bytes, max_concurrency: int = 2) -> None:
+    s3_client = boto3.client("s3")
+    s3_executor = S3Executor(max_concurrency=4)
+    asyncio.run(
+        upload_stream_to_s3(
+            chunks=as_chunks(content, chunk_size=1024 * 1024),
+            bucket_name=TEST_BUCKET_NAME,
+            object_key="large.bin",
+            s3_client=s3_client,
+            s3_executor=s3_executor,
+            part_size=PART_SIZE,
+            max_concurrency=max_concurrency,
+        )
+    )
+    s3_executor.shutdown()
+
+
+def test__iter_parts__regroups_chunks():
+    async def collect() -> list[bytes]:
+        return [part async for part in iter_parts(as_chunks(b"abcdefghij", chunk_size=3), part_size=4)]
+
+    assert asyncio.run(collect()) == [b"abcd", b"efgh", b"ij"]
+
+
+def test__upload__large_file__uses_multipart_upload(make_client: MakeClient):
+    client = make_client(multipart_part_size_bytes=PART_SIZE)
+    response = client.put(
+        "/files/large.bin",
+        files={"file": ("large.bin", LARGE_FILE_CONTENT, "application/octet-stream")},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    response = client.get("/files/large.bin")
+    assert response.content == LARGE_FILE_CONTENT
+
+    # multipart ETags end in "-<number of parts>"
+    head_response = boto3.client("s3").head_object(Bucket=TEST_BUCKET_NAME, Key="large.bin")
+    assert head_response["ETag"].strip('"').endswith("-3")
+    assert head_response["ContentType"] == "application/octet-stream"
+
+
+def test__upload__large_file__replacing_existing_file(make_client: MakeClient):
+    boto3.client("s3").put_object(Bucket=TEST_BUCKET_NAME, Key="large.bin", Body=b"old content")
+
+    client = make_client(multipart_part_size_bytes=PART_SIZE)
+    response = client.put(
+        "/files/large.bin",
+        files={"file": ("large.bin", LARGE_FILE_CONTENT, "application/octet-stream")},
+    )
+    # the conditional completion failed, so the upload was completed again without the condition
+    assert response.status_code == status.HTTP_200_OK
+    assert client.get("/files/large.bin").content == LARGE_FILE_CONTENT
+
+
+def test__upload__small_file__uses_single_put(mocked_aws: None):
+    upload(b"small content")
+
+    head_response = boto3.client("s3").head_object(Bucket=TEST_BUCKET_NAME, Key="large.bin")
+    assert "-" not in head_response["ETag"]
+
+
+def test__upload__single_part__replacing_uncached_file_is_sent_once(client: TestClient):
+    content = b"a" * (CONDITIONAL_PUT_MAX_BYTES + 1)
+    boto3.client("s3").put_object(Bucket=TEST_BUCKET_NAME, Key="file.bin", Body=b"old content")
+    s3_calls = count_s3_calls(client)
+
+    response = client.put("/files/file.bin", files={"file": ("file.bin", content, "application/octet-stream")})
+    assert response.status_code == status.HTTP_200_OK
+    # the file is looked up first rather than sent with If-None-Match, failing, then sent again
+    assert s3_calls == {"HeadObject": 1, "PutObject": 1}
+    assert client.get("/files/file.bin").content == content
+
+
+def test__upload__caps_parts_in_flight(mocked_aws: None, monkeypatch: pytest.MonkeyPatch):
+    lock = threading.Lock()
+    in_flight = 0
+    peak = 0
+
+    def tracking_upload_part(**kwargs) -> str:
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        try:
+            return original_upload_part(**kwargs)
+        finally:
+            with lock:
+                in_flight -= 1
+
+    original_upload_part = files_api.uploads.upload_part
+    monkeypatch.setattr(files_api.uploads, "upload_part", tracking_upload_part)
+
+    upload(LARGE_FILE_CONTENT * 2, max_concurrency=2)
+
+    assert 1 <= peak <= 2
+    body = boto3.client("s3").get_object(Bucket=TEST_BUCKET_NAME, Key="large.bin")["Body"].read()
+    assert body == LARGE_FILE_CONTENT * 2
+
+
+def test__upload__failed_part__aborts_multipart_upload(mocked_aws: None, monkeypatch: pytest.MonkeyPatch):
+    def failing_upload_part(**kwargs) -> str:
+        if kwargs["part_number"] == 2:
+            raise RuntimeError("connection reset")
+        return original_upload_part(**kwargs)
+
+    original_upload_part = files_api.uploads.upload_part
+    monkeypatch.setattr(files_api.uploads, "upload_part", failing_upload_part)
+
+    with pytest.raises(RuntimeError):
+        upload(LARGE_FILE_CONTENT)
+
+    s3_client = boto3.client("s3")
+    assert "Uploads" not in s3_client.list_multipart_uploads(Bucket=TEST_BUCKET_NAME)
+    assert s3_client.list_objects_v2(Bucket=TEST_BUCKET_NAME).get("KeyCount") == 0